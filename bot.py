@@ -1,14 +1,22 @@
 # bot.py
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-from dotenv import load_dotenv
-from woocommerce import API
 from pathlib import Path
-import os, re, sys, time, urllib.parse, datetime, json, requests
+import contextlib, hashlib, os, re, socket, sys, time, urllib.parse, datetime, json, threading, argparse, sqlite3, unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Playwright, WooCommerce, requests e NumPy são importados no primeiro uso: subcomandos que
+# só leem o histórico ou um plano ("report", "diff", "historico") sobem sem carregar nada disso.
+def sync_playwright():
+    from playwright.sync_api import sync_playwright as _sync_playwright
+    return _sync_playwright()
 
 # =======================
 # CONFIG
 # =======================
-load_dotenv()
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:  # sem python-dotenv: só o ambiente (suficiente para report/diff/historico)
+    pass
 
 TENDA_URL       = "https://www.tendaatacado.com.br"
 DEFAULT_TIMEOUT = int(os.getenv("PW_TIMEOUT", "60000"))
@@ -16,15 +24,122 @@ DEFAULT_TIMEOUT = int(os.getenv("PW_TIMEOUT", "60000"))
 # Modo headless: False = mostra navegador, True = sem UI
 HEADLESS        = True  # False para mostrar o navegador
 SLOW_MO_MS      = int(os.getenv("PW_SLOWMO", "0"))
+NAVEGADOR_PERFIL = os.getenv("NAVEGADOR_PERFIL", "headless-shell")  # completo | headless-shell | reduzido (ver "bench startup")
 
 USE_CEP         = True
 CEP_VALOR       = "05109-200"
 
+# --- Multi-CEP: um contexto isolado da Tenda por CEP, em paralelo; o preço base sai da agregação
+TENDA_CEPS    = [c.strip() for c in os.getenv("TENDA_CEPS", "").split(",") if c.strip()] or [CEP_VALOR]
+CEP_AGREGACAO = os.getenv("CEP_AGREGACAO", "min")   # min | mediana | cep:<CEP>
+
+# --- Tenda: casar vários SKUs do catálogo com os cards de uma mesma busca
+TENDA_MULTI_MATCH = os.getenv("TENDA_MULTI_MATCH", "1") == "1"
+TENDA_MAX_CARDS   = int(os.getenv("TENDA_MAX_CARDS", "60"))
+MATCH_MULTI_MIN   = float(os.getenv("MATCH_MULTI_MIN", "1.0"))  # fração dos tokens do nome no título
+MATCH_TITULO_MIN  = float(os.getenv("MATCH_TITULO_MIN", "0.6"))  # fração do título (sem medidas) coberta pelo nome
+
+# --- Tenda: varredura das categorias (snapshot + índice local) antes das buscas por SKU
+TENDA_CRAWL         = os.getenv("TENDA_CRAWL", "0") == "1"
+TENDA_CATEGORIAS    = [c.strip() for c in os.getenv("TENDA_CATEGORIAS", "hortifruti,mercearia").split(",") if c.strip()]
+TENDA_CRAWL_PAGINAS = int(os.getenv("TENDA_CRAWL_PAGINAS", "30"))   # máx. de páginas por categoria
+TENDA_PAGINACAO     = os.getenv("TENDA_PAGINACAO", "page={n}")       # parâmetro da página n na URL da categoria
+PRAZO_CRAWL_S       = float(os.getenv("PRAZO_CRAWL_S", "600"))       # varredura inteira (todas as categorias)
+MATCH_TRIGRAMA_MIN  = float(os.getenv("MATCH_TRIGRAMA_MIN", "0.75")) # similaridade p/ aceitar sem todos os tokens
+
+# --- Tenda: resultados lidos do HTML cru por HTTP (navegador só quando o HTML não traz os cards)
+TENDA_HTML_RAPIDO   = os.getenv("TENDA_HTML_RAPIDO", "1") == "1"
+TENDA_SALVAR_CORPUS = os.getenv("TENDA_SALVAR_CORPUS", "0") == "1"  # guarda as páginas p/ o benchmark
+
+# --- Tenda: preços tirados do JSON das chamadas XHR/fetch da busca (antes do mosaico renderizar)
+TENDA_API_JSON     = os.getenv("TENDA_API_JSON", "1") == "1"
+TENDA_API_PADRAO   = re.compile(os.getenv("TENDA_API_PADRAO", r"/api/[^?]*(search|busca)"), re.I)
+TENDA_API_LISTA    = [c.strip() for c in os.getenv("TENDA_API_LISTA", "products,produtos,items,data.products,data.items,result.products").split(",") if c.strip()]
+TENDA_API_ESPERA_MS = int(os.getenv("TENDA_API_ESPERA_MS", "5000"))  # espera pelo JSON antes de ir ao DOM
+TENDA_API_VALIDAR  = int(os.getenv("TENDA_API_VALIDAR", "3"))  # 1ªs buscas conferem JSON x DOM; divergiu = JSON desligado
+
 # --- Lotes / Batching
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "10"))
 
+# --- Precificação (motor em lote com travas)
+def _env_float(nome, padrao=None):
+    v = os.getenv(nome)
+    if v is None:
+        return padrao
+    return float(v) if v.strip() else None
+
+PRECO_ARREDONDAMENTO = os.getenv("PRECO_ARREDONDAMENTO", "centavo")  # centavo | 99 | 49 | 90
+MARGEM_MIN_PCT       = _env_float("MARGEM_MIN_PCT")    # trava do incremento (vazio = sem trava)
+MARGEM_MAX_PCT       = _env_float("MARGEM_MAX_PCT")
+PRECO_DESVIO_MAX_PCT = _env_float("PRECO_DESVIO_MAX_PCT", 40.0)  # vs último preço conhecido
+
+# --- Bloqueio de recursos: "cdp" (regras empurradas ao Chromium), "route" (handler Python) ou "off"
+BLOQUEIO_MODO     = os.getenv("BLOQUEIO_MODO", "cdp")
+BLOQUEIO_ESTATS   = os.getenv("BLOQUEIO_ESTATS", "1") == "1"   # contadores via eventos Network.*
+BLOQUEIO_ALLOWLIST = os.getenv("BLOQUEIO_ALLOWLIST", "1") == "1" # bloqueia terceiros conhecidos + BLOQUEIO_HOSTS
+BLOQUEIO_HOSTS     = [h.strip().lower() for h in os.getenv("BLOQUEIO_HOSTS", "").split(",") if h.strip()]
+BLOQUEIO_APRENDER  = os.getenv("BLOQUEIO_APRENDER", "0") == "1"   # host novo de terceiros passa a ser bloqueado
+
+# --- Cache de assets (js/css) em disco entre lotes/relançamentos do navegador
+CACHE_ASSETS       = os.getenv("CACHE_ASSETS", "1") == "1"
+CACHE_ASSETS_TTL_S = float(os.getenv("CACHE_ASSETS_TTL_S", "21600"))  # depois disso, revalida (ETag/Last-Modified)
+
+# --- HAR: "run --record" grava o tráfego de cada site; "run --replay" roda o mesmo main() servindo
+# essas gravações (nada sai para a rede; as escritas dos sinks ficam registradas localmente)
+HAR_MODO = os.getenv("HAR_MODO", "")   # "" | gravar | replay
+
+# --- Painel de status (HTTP local): progresso, ETA, sinks e controles pausar/drenar/priorizar
+STATUS_PORTA = int(os.getenv("STATUS_PORTA", "0"))         # 0 desliga
+STATUS_HOST  = os.getenv("STATUS_HOST", "127.0.0.1")
+STATUS_TOKEN = os.getenv("STATUS_TOKEN", "")               # se definido, exigido nos POST (X-Token)
+
+# --- Memória (amostragem via CDP a cada N SKUs; 0 desliga)
+MEM_AMOSTRA_CADA = int(os.getenv("MEM_AMOSTRA_CADA", "5"))
+MEM_HEAP_MAX_MB  = float(os.getenv("MEM_HEAP_MAX_MB", "300"))      # JS heap usado por página
+MEM_NODES_MAX    = int(os.getenv("MEM_NODES_MAX", "150000"))       # nós DOM por página
+MEM_RSS_MAX_MB   = float(os.getenv("MEM_RSS_MAX_MB", "1500"))      # RSS do bot + driver + Chromium
+MEM_RECRIAR_INTERVALO = int(os.getenv("MEM_RECRIAR_INTERVALO", "4"))  # amostras mínimas entre duas recriações
+
+# --- Circuit breaker por sink (aberto = pula o sink e enfileira a escrita)
+BREAKER_FALHAS   = int(os.getenv("BREAKER_FALHAS", "3"))       # falhas seguidas para abrir
+BREAKER_ESPERA_S = float(os.getenv("BREAKER_ESPERA_S", "300"))  # tempo aberto antes de sondar 1 SKU
+
+# --- Prazos (orçamento de tempo em segundos; cada espera usa o menor entre seu teto e o que resta)
+PRAZO_LOGIN_S = float(os.getenv("PRAZO_LOGIN_S", "180"))   # login de cada site
+PRAZO_TENDA_S = float(os.getenv("PRAZO_TENDA_S", "90"))    # busca de preço de um SKU
+PRAZO_SINK_S  = float(os.getenv("PRAZO_SINK_S", "120"))    # escrita de um SKU em um sink
+PRAZO_SKU_S   = float(os.getenv("PRAZO_SKU_S", "300"))     # SKU inteiro (busca + todos os sinks)
+
+# --- Logins dos sinks em paralelo (cada um no seu navegador; cookies levados ao contexto do lote)
+LOGIN_PARALELO = os.getenv("LOGIN_PARALELO", "1") == "1"
+
+# --- Preflight: confere os seletores críticos de cada site logo após o login (sink quebrado = desligado)
+PREFLIGHT         = os.getenv("PREFLIGHT", "1") == "1"
+PREFLIGHT_SKU     = os.getenv("PREFLIGHT_SKU")                     # padrão: 1º SKU do catálogo/plano
+PREFLIGHT_MS      = int(os.getenv("PREFLIGHT_MS", "8000"))         # teto de cada checagem
+PRAZO_PREFLIGHT_S = float(os.getenv("PRAZO_PREFLIGHT_S", "60"))    # orçamento total (todos os sites)
+
+# --- Plano / Aplicação (apply roda um navegador por sink, em paralelo)
+APLICAR_PARALELO = os.getenv("APLICAR_PARALELO", "1") == "1"
+
+# --- Fila de trabalho (coordenador enfileira, workers em qualquer máquina arrendam lotes)
+FILA_BROKER   = os.getenv("FILA_BROKER", "sqlite")          # sqlite | memoria
+FILA_LOTE     = int(os.getenv("FILA_LOTE", str(BATCH_SIZE)))
+FILA_LEASE_S  = float(os.getenv("FILA_LEASE_S", "900"))     # lote volta à fila se o worker sumir
+FILA_TENTATIVAS = int(os.getenv("FILA_TENTATIVAS", "3"))
+FILA_ESPERA_S = float(os.getenv("FILA_ESPERA_S", "5"))      # intervalo entre consultas sem trabalho
+FILA_OCIOSO_S = float(os.getenv("FILA_OCIOSO_S", "120"))    # worker desiste se só houver arrendados alheios
+WORKER_ID     = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# --- Catálogo (API de produtos da loja: SKU, nome e incremento)
+PRODUTOS_URL = os.getenv("PRODUTOS_URL", "https://mlovi.com.br/sistemahortigold/endpoints/test_products.php")
+
+# --- Várias lojas: a Tenda é coletada uma vez (feed) e cada perfil em LOJAS_DIR/<loja>.env aplica
+LOJAS_PARALELAS = int(os.getenv("LOJAS_PARALELAS", "4"))
+LOJA_SINKS      = os.getenv("LOJA_SINKS", "")   # sinks desta loja (vazio = todos)
+
 # --- CDS (ERP)
-CDS_URL   = "http://63.143.45.98:800/"
+CDS_URL   = (os.getenv("CDS_URL") or "http://63.143.45.98:800").rstrip("/") + "/"
 CDS_USER  = os.getenv("CDS_USER", "hortigold")
 CDS_PASS  = os.getenv("CDS_PASS", "hortigold@4120")
 CLIENT_USER = os.getenv("CLIENT_USER", "marcela")
@@ -39,22 +154,40 @@ WP_PASS = os.getenv("WP_PASS", "figueiredo")
 WOO_BASE_URL = (os.getenv("WOO_BASE_URL") or "").rstrip("/")
 WOO_CK = os.getenv("WOO_CK")
 WOO_CS = os.getenv("WOO_CS")
-wc = None
-if WOO_BASE_URL and WOO_CK and WOO_CS:
-    wc = API(
-        url=WOO_BASE_URL,
-        consumer_key=WOO_CK,
-        consumer_secret=WOO_CS,
-        version="wc/v3",
-        timeout=30,
-        query_string_auth=False,
-    )
+_wc = None
+
+def woo_cliente():
+    """Cliente da API WooCommerce, criado no primeiro uso (None sem credenciais ou com HAR ligado)"""
+    global _wc
+    if HAR_MODO:
+        return None
+    if _wc is None and WOO_BASE_URL and WOO_CK and WOO_CS:
+        from woocommerce import API
+        _wc = API(
+            url=WOO_BASE_URL,
+            consumer_key=WOO_CK,
+            consumer_secret=WOO_CS,
+            version="wc/v3",
+            timeout=30,
+            query_string_auth=False,
+        )
+    return _wc
 
 # =======================
 # LOG PATHS (ABSOLUTOS)
 # =======================
 BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = Path(os.getenv("LOG_DIR", str(BASE_DIR / "logs")))
+PLAN_DIR = Path(os.getenv("PLAN_DIR", str(BASE_DIR / "planos")))
+FILA_DB = Path(os.getenv("FILA_DB", str(LOG_DIR / "fila.sqlite3")))  # num compartilhamento p/ várias máquinas
+CACHE_ASSETS_DIR = Path(os.getenv("CACHE_ASSETS_DIR", str(BASE_DIR / "cache_assets")))
+CORPUS_DIR = Path(os.getenv("CORPUS_DIR", str(BASE_DIR / "corpus_tenda")))
+HAR_DIR = Path(os.getenv("HAR_DIR", str(BASE_DIR / "har")))   # uma pasta por gravação (RUN_ID)
+FEED_DIR = Path(os.getenv("FEED_DIR", str(PLAN_DIR / "feeds")))
+LOJAS_DIR = Path(os.getenv("LOJAS_DIR", str(BASE_DIR / "lojas")))
+HISTORICO_DB = Path(os.getenv("HISTORICO_DB", str(LOG_DIR / "historico.sqlite3")))
+HISTORICO_ATIVO = os.getenv("HISTORICO_ATIVO", "1") == "1"
+RUN_ID = os.getenv("RUN_ID") or f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
 
 def get_log_filename():
     hoje = datetime.date.today().strftime("%Y-%m-%d")
@@ -83,6 +216,263 @@ def log_produto(sku, query, preco, status, log_file):
     })
     with open(log_file, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    painel_produto(sku, status)
+
+# =======================
+# HISTÓRICO (SQLite)
+# =======================
+# Cada observação da Tenda e cada escrita num sink vira uma linha indexada por
+# SKU e horário, para consultas rápidas ("último preço do SKU X") sem abrir os JSONs.
+HISTORICO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS execucoes (
+    run_id TEXT PRIMARY KEY,
+    modo   TEXT,
+    inicio TEXT,
+    fim    TEXT
+);
+CREATE TABLE IF NOT EXISTS observacoes (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id      TEXT,
+    ts          TEXT NOT NULL,
+    sku         TEXT NOT NULL,
+    query       TEXT,
+    preco_base  REAL,
+    incremento  REAL,
+    preco_final REAL,
+    status      TEXT,
+    duracao_ms  INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_observacoes_sku_ts ON observacoes(sku, ts);
+CREATE INDEX IF NOT EXISTS idx_observacoes_ts ON observacoes(ts);
+CREATE TABLE IF NOT EXISTS escritas (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id     TEXT,
+    ts         TEXT NOT NULL,
+    sku        TEXT NOT NULL,
+    sink       TEXT NOT NULL,
+    preco      REAL,
+    resultado  TEXT,
+    duracao_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_escritas_sku_ts ON escritas(sku, ts);
+CREATE INDEX IF NOT EXISTS idx_escritas_ts ON escritas(ts);
+CREATE TABLE IF NOT EXISTS precos_regiao (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id  TEXT,
+    ts      TEXT NOT NULL,
+    sku     TEXT NOT NULL,
+    cep     TEXT NOT NULL,
+    preco   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_precos_regiao_sku_ts ON precos_regiao(sku, ts);
+"""
+
+_historico_local = threading.local()
+
+def historico_db():
+    """Conexão SQLite da thread atual (cada thread de sink tem a sua)"""
+    conn = getattr(_historico_local, "conn", None)
+    if conn is None:
+        HISTORICO_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(HISTORICO_DB), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(HISTORICO_SCHEMA)
+        _historico_local.conn = conn
+    return conn
+
+def _agora_iso():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+def _ms(t0):
+    return int((time.time() - t0) * 1000)
+
+def _resultado_sink(v):
+    if v is True: return "OK"
+    if v is None: return "NAO_ENCONTRADO"
+    if v is False: return "ERRO"
+    return str(v)
+
+def historico_iniciar_execucao(modo):
+    if not HISTORICO_ATIVO: return
+    try:
+        with historico_db() as conn:
+            conn.execute("INSERT OR REPLACE INTO execucoes (run_id, modo, inicio) VALUES (?, ?, ?)",
+                         (RUN_ID, modo, _agora_iso()))
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao registrar execução: {e}")
+
+def historico_finalizar_execucao():
+    if not HISTORICO_ATIVO: return
+    try:
+        with historico_db() as conn:
+            conn.execute("UPDATE execucoes SET fim = ? WHERE run_id = ?", (_agora_iso(), RUN_ID))
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao finalizar execução: {e}")
+
+def historico_registrar_observacao(sku, query, preco_base, incremento, preco_final, status, duracao_ms=None):
+    if not HISTORICO_ATIVO: return
+    try:
+        with historico_db() as conn:
+            conn.execute(
+                "INSERT INTO observacoes (run_id, ts, sku, query, preco_base, incremento, preco_final, status, duracao_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (RUN_ID, _agora_iso(), sku, query, preco_base, incremento, preco_final, status, duracao_ms))
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao registrar observação {sku}: {e}")
+
+def historico_registrar_escrita(sku, sink, preco, resultado, duracao_ms=None):
+    if not HISTORICO_ATIVO: return
+    try:
+        with historico_db() as conn:
+            conn.execute(
+                "INSERT INTO escritas (run_id, ts, sku, sink, preco, resultado, duracao_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (RUN_ID, _agora_iso(), sku, sink, preco, _resultado_sink(resultado), duracao_ms))
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao registrar escrita {sku}/{sink}: {e}")
+
+def historico_registrar_regioes(sku, precos):
+    """Um preço da Tenda por CEP (multi-CEP); None = sem preço naquela região"""
+    if not HISTORICO_ATIVO or not precos: return
+    try:
+        ts = _agora_iso()
+        with historico_db() as conn:
+            conn.executemany(
+                "INSERT INTO precos_regiao (run_id, ts, sku, cep, preco) VALUES (?, ?, ?, ?, ?)",
+                [(RUN_ID, ts, sku, cep, preco) for cep, preco in precos.items()])
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao registrar preços por região {sku}: {e}")
+
+def historico_ultimo_preco(sku):
+    """Última observação com preço para o SKU: dict(ts, preco_base, preco_final) ou None"""
+    try:
+        row = historico_db().execute(
+            "SELECT ts, preco_base, preco_final FROM observacoes "
+            "WHERE sku = ? AND preco_final IS NOT NULL ORDER BY ts DESC, id DESC LIMIT 1", (sku,)).fetchone()
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro na consulta de {sku}: {e}")
+        return None
+    if not row:
+        return None
+    return {"ts": row[0], "preco_base": row[1], "preco_final": row[2]}
+
+STATUS_PUBLICADOS = ("OK", "OK_SEM_WOO", "APROVADO")
+
+def historico_ultimos_precos(skus):
+    """Último preço publicado de vários SKUs numa consulta só: observação OK/OK_SEM_WOO/APROVADO
+    ou escrita OK num sink (apply). ERRO/PLANO/REVISAO nunca chegaram às lojas e não contam."""
+    skus = list(dict.fromkeys(skus))
+    res = {}
+    status = ",".join(f"'{s}'" for s in STATUS_PUBLICADOS)
+    try:
+        conn = historico_db()
+        for grupo in chunked(skus, 500):
+            marcas = ",".join("?" * len(grupo))
+            for sku, preco, _ in conn.execute(
+                    f"SELECT sku, preco, MAX(ts) FROM ("
+                    f"  SELECT sku, preco_final AS preco, ts FROM observacoes WHERE sku IN ({marcas}) "
+                    f"  AND preco_final IS NOT NULL AND status IN ({status}) "
+                    f"  UNION ALL SELECT sku, preco, ts FROM escritas WHERE sku IN ({marcas}) "
+                    f"  AND preco IS NOT NULL AND resultado = 'OK'"
+                    f") GROUP BY sku", grupo + grupo):
+                res[sku] = preco
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro na consulta em lote: {e}")
+    return res
+
+def historico_revisoes_pendentes():
+    """{sku: preço retido} dos SKUs cuja última observação com preço ainda é REVISAO"""
+    try:
+        linhas = historico_db().execute(
+            "SELECT o.sku, o.preco_final FROM observacoes o JOIN ("
+            "  SELECT sku, MAX(id) AS id FROM observacoes WHERE preco_final IS NOT NULL GROUP BY sku"
+            ") u ON o.id = u.id WHERE o.status = 'REVISAO' ORDER BY o.sku").fetchall()
+    except Exception as e:
+        print(f"[Histórico] ⚠️ Erro ao listar revisões: {e}")
+        return {}
+    return dict(linhas)
+
+def historico_aprovar(sku, preco=None):
+    """Aceita o preço revisado (o retido, ou o informado) como referência das próximas travas"""
+    if preco is None:
+        preco = historico_revisoes_pendentes().get(sku)
+        if preco is None:
+            print(f"[Revisão] {sku}: nada retido para aprovar")
+            return None
+    preco = round(float(preco), 2)
+    try:
+        with historico_db() as conn:
+            conn.execute(
+                "INSERT INTO observacoes (run_id, ts, sku, query, preco_base, incremento, preco_final, status) "
+                "VALUES (?, ?, ?, NULL, NULL, NULL, ?, 'APROVADO')", (RUN_ID, _agora_iso(), sku, preco))
+    except Exception as e:
+        print(f"[Revisão] ❌ Erro ao aprovar {sku}: {e}")
+        return None
+    print(f"[Revisão] ✅ {sku}: {preco} aceito como referência")
+    return preco
+
+def relatorio_execucao(run_id=None):
+    """Resumo de uma execução a partir do histórico (padrão: a última): status da coleta e escritas por sink"""
+    try:
+        conn = historico_db()
+        if run_id is None:
+            linha = conn.execute("SELECT run_id FROM execucoes ORDER BY inicio DESC LIMIT 1").fetchone()
+            if not linha:
+                print("[Relatório] Nenhuma execução registrada no histórico")
+                return None
+            run_id = linha[0]
+        execucao = conn.execute("SELECT modo, inicio, fim FROM execucoes WHERE run_id = ?", (run_id,)).fetchone()
+        obs = dict(conn.execute("SELECT COALESCE(status, '?'), COUNT(*) FROM observacoes WHERE run_id = ? "
+                                "GROUP BY 1 ORDER BY 2 DESC", (run_id,)).fetchall())
+        escritas = {}
+        for sink, resultado, n in conn.execute("SELECT sink, resultado, COUNT(*) FROM escritas WHERE run_id = ? "
+                                               "GROUP BY 1, 2 ORDER BY 1, 3 DESC", (run_id,)):
+            escritas.setdefault(sink, {})[resultado] = n
+    except Exception as e:
+        print(f"[Relatório] ❌ Erro ao ler o histórico: {e}")
+        return None
+
+    modo, inicio, fim = execucao or ("?", "?", None)
+    print(f"[Relatório] Execução {run_id} | modo={modo} | início={inicio} | fim={fim or 'não finalizada'}")
+    print(f"[Relatório] Coleta: {sum(obs.values())} SKUs | "
+          + (" | ".join(f"{st}={n}" for st, n in obs.items()) or "nenhuma observação"))
+    for sink, res in escritas.items():
+        print(f"[Relatório] {sink}: " + " | ".join(f"{r}={n}" for r, n in res.items()))
+    return {"run_id": run_id, "modo": modo, "observacoes": obs, "escritas": escritas}
+
+def historico_importar_logs(diretorio=None):
+    """Importa os logs/AAAA-MM-DD_N.json antigos (cada arquivo vira uma execução 'import:')"""
+    diretorio = Path(diretorio or LOG_DIR)
+    conn = historico_db()
+    importados = 0
+    for fn in sorted(diretorio.glob("*.json")):
+        m = re.match(r"^(\d{4}-\d{2}-\d{2})_\d+$", fn.stem)
+        if not m:
+            continue
+        run_id = f"import:{fn.stem}"
+        if conn.execute("SELECT 1 FROM execucoes WHERE run_id = ?", (run_id,)).fetchone():
+            continue
+        try:
+            with open(fn, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[Histórico] ⚠️ Ignorando {fn.name}: {e}")
+            continue
+        linhas = []
+        for reg in data if isinstance(data, list) else []:
+            if not reg.get("sku"):
+                continue
+            ts = f"{m.group(1)}T{reg.get('hora') or '00:00:00'}"
+            linhas.append((run_id, ts, str(reg["sku"]), reg.get("produto"), reg.get("preco"), reg.get("status")))
+        with conn:
+            conn.execute("INSERT INTO execucoes (run_id, modo, inicio, fim) VALUES (?, 'import', ?, ?)",
+                         (run_id, linhas[0][1] if linhas else None, linhas[-1][1] if linhas else None))
+            conn.executemany(
+                "INSERT INTO observacoes (run_id, ts, sku, query, preco_final, status) VALUES (?, ?, ?, ?, ?, ?)",
+                linhas)
+        importados += len(linhas)
+        print(f"[Histórico] {fn.name}: {len(linhas)} registros importados")
+    print(f"[Histórico] Importação concluída: {importados} registros")
+    return importados
 
 # =======================
 # HELPERS
@@ -111,51 +501,542 @@ def log_step(msg, start=None):
         print(f"[{msg}]")
     return time.time()
 
+_etapas = {}
+_etapas_lock = threading.Lock()
+
+def registrar_etapa(nome, t0):
+    """Acumula a duração de uma etapa para o relatorio_etapas() do fim da execução"""
+    dur = time.time() - t0
+    with _etapas_lock:
+        _etapas.setdefault(nome, []).append(dur)
+    return dur
+
+def relatorio_etapas():
+    with _etapas_lock:
+        etapas = {n: sorted(d) for n, d in _etapas.items()}
+    if not etapas:
+        return
+    print(f"[Tempo] Por etapa:  {'etapa':<16} {'n':>5} {'total s':>9} {'média s':>8} {'p95 s':>7}")
+    for nome, d in sorted(etapas.items(), key=lambda kv: -sum(kv[1])):
+        p95 = d[min(len(d) - 1, int(len(d) * 0.95))]
+        print(f"                    {nome:<16} {len(d):5d} {sum(d):9.2f} {sum(d) / len(d):8.2f} {p95:7.2f}")
+
 def chunked(seq, n):
     for i in range(0, len(seq), n):
         yield seq[i:i+n]
 
+# ====== PRAZOS (orçamento por SKU/etapa) ======
+TIMEOUT_BUDGET = "TIMEOUT_BUDGET"
+
+class PrazoEsgotado(Exception):
+    pass
+
+def criar_prazo(segundos, limite=None):
+    """Instante (monotonic) em que a etapa expira; nunca passa do prazo 'limite' de quem chamou"""
+    if segundos is None or segundos <= 0:
+        return limite
+    fim = time.monotonic() + segundos
+    return min(fim, limite) if limite is not None else fim
+
+def prazo_restante_ms(prazo):
+    if prazo is None:
+        return None
+    return int((prazo - time.monotonic()) * 1000)
+
+def prazo_vencido(prazo):
+    return prazo is not None and time.monotonic() >= prazo
+
+def t_ms(prazo, teto_ms):
+    """Timeout de uma espera: o teto da etapa ou o que resta do prazo, o que for menor"""
+    resta = prazo_restante_ms(prazo)
+    if resta is None:
+        return teto_ms
+    if resta <= 0:
+        raise PrazoEsgotado("prazo esgotado")
+    return max(1, min(int(teto_ms), resta))
+
+def renovar_prazo(page, prazo):
+    """Reaplica às esperas implícitas (fill/click/locator) o que resta do prazo; chamar a cada passo"""
+    if prazo is not None and page is not None:
+        page.set_default_timeout(t_ms(prazo, DEFAULT_TIMEOUT))
+
+@contextlib.contextmanager
+def prazo_na_pagina(page, prazo):
+    """Limita as esperas implícitas ao prazo na entrada e volta ao DEFAULT_TIMEOUT na saída.
+    O valor é fixado aqui: os passos seguintes chamam renovar_prazo para acompanhar o que resta."""
+    if prazo is None or page is None or is_page_closed(page):
+        yield
+        return
+    try:
+        renovar_prazo(page, prazo)
+        yield
+    finally:
+        try:
+            if not is_page_closed(page):
+                page.set_default_timeout(DEFAULT_TIMEOUT)
+        except Exception:
+            pass
+
 # =======================
 # BROWSER/CONTEXT
 # =======================
+# Perfis de lançamento: "completo" é o Chromium inteiro (headless novo), "headless-shell" o binário
+# enxuto só para headless, e "reduzido" o shell sem rede de fundo, extensões, atualizações e GPU.
+FLAGS_REDUZIDAS = [
+    "--disable-background-networking",
+    "--disable-extensions",
+    "--disable-component-update",
+    "--disable-gpu",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+]
+PERFIS_NAVEGADOR = {
+    "completo":       {"channel": "chromium", "args": []},
+    "headless-shell": {"channel": None,       "args": []},
+    "reduzido":       {"channel": None,       "args": FLAGS_REDUZIDAS},
+}
+
 def make_browser_and_context(pw):
-    ua = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-          "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36")
+    browser = lancar_navegador(pw)
+    return browser, make_context_only(browser)
 
-    launch_args = [
-        "--no-sandbox",
-        "--disable-dev-shm-usage",
-        "--disable-blink-features=AutomationControlled",
-        "--lang=pt-BR",
-    ]
+def lancar_navegador(pw, perfil=None):
+    perfil = perfil or NAVEGADOR_PERFIL
+    if perfil not in PERFIS_NAVEGADOR:
+        print(f"[Browser] ⚠️ Perfil desconhecido '{perfil}' — usando 'headless-shell'")
+        perfil = "headless-shell"
+    cfg = PERFIS_NAVEGADOR[perfil]
+    launch_args = ["--lang=pt-BR", "--disable-blink-features=AutomationControlled"] + cfg["args"]
 
-    browser = pw.chromium.launch(
+    # flags só para Linux (VPS/Docker)
+    if sys.platform.startswith("linux"):
+        launch_args += ["--no-sandbox", "--disable-dev-shm-usage"]
+
+    kwargs = dict(
         headless=HEADLESS,  # Usa a variável HEADLESS da configuração
         slow_mo=SLOW_MO_MS,
+        devtools=False,  # Sempre sem DevTools
         args=launch_args,
     )
+    # o headless shell só existe em headless; com janela o perfil vale só pelas flags
+    if cfg["channel"] and HEADLESS:
+        kwargs["channel"] = cfg["channel"]
+    print(f"[Browser] Perfil {perfil} | argumentos: {launch_args}")
+    return pw.chromium.launch(**kwargs)
 
-    ctx_kwargs = dict(
-        user_agent=ua,
-        locale="pt-BR",
-        timezone_id="America/Recife",
-        viewport={"width": 1280, "height": 900},  # Sempre viewport fixo em headless
-    )
+def fechar_navegador(browser):
+    """Fecha os contextos antes do navegador (é no close do contexto que o HAR gravado vai para o disco)"""
+    for ctx in list(browser.contexts):
+        try:
+            ctx.close()
+        except Exception:
+            pass
+    browser.close()
+
+# ====== BLOQUEIO DE RECURSOS (CDP) ======
+# Em vez de um ctx.route("**/*") que leva cada requisição até o Python, as regras
+# vão para o próprio Chromium via Network.setBlockedURLs, por página e por site.
+EXT_IMAGEM = ("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp")
+EXT_FONTE  = ("woff", "woff2", "ttf", "otf", "eot")
+EXT_MIDIA  = ("mp4", "webm", "ogg", "mp3", "wav", "m4a", "mov")
+
+def _padroes_ext(exts):
+    return [p for e in exts for p in (f"*.{e}", f"*.{e}?*")]
+
+BLOQUEIO_POLITICAS = {
+    "tenda":  {"padroes": _padroes_ext(EXT_IMAGEM + EXT_FONTE + EXT_MIDIA)},
+    "cds":    {"padroes": _padroes_ext(EXT_IMAGEM + EXT_FONTE + EXT_MIDIA)},
+    "wp":     {"padroes": _padroes_ext(EXT_IMAGEM + EXT_FONTE + EXT_MIDIA)},
+    "portal": {"padroes": _padroes_ext(EXT_IMAGEM + EXT_FONTE + EXT_MIDIA)},
+}
+BLOQUEIO_POLITICAS["padrao"] = BLOQUEIO_POLITICAS["tenda"]
+
+# Hosts de terceiros: só os da lista explícita (TERCEIROS_CONHECIDOS + BLOQUEIO_HOSTS) são
+# bloqueados; os desconhecidos passam e aparecem no resumo do fim da execução (com
+# BLOQUEIO_APRENDER=1 eles entram em hosts_terceiros.json e são bloqueados dali em diante).
+# CDS/WP/Portal dependem de jQuery/DataTables/Bootstrap servidos por CDN.
+CDNS_COMUNS = (
+    "code.jquery.com", "cdn.datatables.net", "cdnjs.cloudflare.com", "cdn.jsdelivr.net",
+    "stackpath.bootstrapcdn.com", "maxcdn.bootstrapcdn.com", "ajax.googleapis.com", "unpkg.com",
+)
+# Rastreadores/anúncios/chat já bloqueados de saída (sem precisar "aprender" o host)
+TERCEIROS_CONHECIDOS = (
+    "googletagmanager.com", "google-analytics.com", "doubleclick.net", "googleadservices.com",
+    "googlesyndication.com", "facebook.net", "facebook.com", "hotjar.com", "clarity.ms",
+    "tiktok.com", "criteo.com", "criteo.net", "taboola.com", "zdassets.com", "zendesk.com",
+    "tawk.to", "jivosite.com", "rdstation.com.br", "nr-data.net", "onesignal.com",
+    "pinterest.com", "licdn.com", "bing.com",
+)
+_bloqueio_lock = threading.Lock()
+_bloqueio_stats = {}
+_terceiros_stats = {}
+_hosts_aprendidos = None
+
+def _host_base(url):
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def hosts_permitidos(site):
+    primeiros = {"tenda": TENDA_URL, "cds": CDS_URL, "wp": WP_BASE_URL, "portal": PORTAL_URL}
+    hosts = [_host_base(primeiros.get(site, TENDA_URL))]
+    if site != "tenda":
+        hosts += CDNS_COMUNS
+    extra = os.getenv(f"HOSTS_EXTRA_{site.upper()}", "")
+    hosts += [h.strip().lower() for h in extra.split(",") if h.strip()]
+    return tuple(hosts)
+
+def _host_casa(host, dominios):
+    return any(host == d or host.endswith("." + d) for d in dominios)
+
+def arq_hosts_terceiros():
+    """Lido do LOG_DIR atual (no replay ele aponta para a pasta isolada da execução)"""
+    return LOG_DIR / "hosts_terceiros.json"
+
+def _carregar_hosts_aprendidos():
+    global _hosts_aprendidos
+    if _hosts_aprendidos is None:
+        try:
+            with open(arq_hosts_terceiros(), "r", encoding="utf-8") as f:
+                _hosts_aprendidos = {k: set(v) for k, v in json.load(f).items()}
+        except Exception:
+            _hosts_aprendidos = {}
+    return _hosts_aprendidos
+
+def _terceiros_contar(site, host, **campos):
+    with _bloqueio_lock:
+        st = _terceiros_stats.setdefault(site, {}).setdefault(
+            host, {"baixadas": 0, "bytes": 0, "ms": 0.0, "bloqueadas": 0, "desconhecido": 0})
+        for k, v in campos.items():
+            st[k] += v
+
+def _bloqueio_contar(site, campo, valor=1, tipo=None):
+    with _bloqueio_lock:
+        st = _bloqueio_stats.setdefault(site, {"permitidas": 0, "bytes_permitidos": 0,
+                                                "bloqueadas": 0, "bloqueadas_por_tipo": {}})
+        st[campo] += valor
+        if tipo:
+            st["bloqueadas_por_tipo"][tipo] = st["bloqueadas_por_tipo"].get(tipo, 0) + 1
+
+def aplicar_bloqueio(page, site):
+    """Empurra a política de bloqueio do site para o Chromium (uma sessão CDP por página)"""
+    if BLOQUEIO_MODO != "cdp":
+        return None
+    politica = BLOQUEIO_POLITICAS.get(site) or BLOQUEIO_POLITICAS["padrao"]
+    permitidos = hosts_permitidos(site)
+    bloqueados = set(BLOQUEIO_HOSTS)
+    if BLOQUEIO_APRENDER:
+        with _bloqueio_lock:
+            bloqueados |= _carregar_hosts_aprendidos().get(site, set())
+    pendentes = {}  # requestId -> (host, timestamp) de requisições de terceiros
+
+    def _padroes():
+        padroes = list(politica["padroes"])
+        if BLOQUEIO_ALLOWLIST:
+            padroes += [p for d in TERCEIROS_CONHECIDOS for p in (f"*://{d}/*", f"*://*.{d}/*")]
+            padroes += [f"*://{h}/*" for h in sorted(bloqueados)]
+        return padroes
+
+    try:
+        cdp = page.context.new_cdp_session(page)
+        cdp.send("Network.enable")
+        cdp.send("Network.setBlockedURLs", {"urls": _padroes()})
+    except Exception as e:
+        print(f"[Bloqueio] ⚠️ Não foi possível aplicar política CDP em {site}: {e}")
+        return None
+
+    def _on_request(ev):
+        host = (urllib.parse.urlsplit((ev.get("request") or {}).get("url", "")).hostname or "").lower()
+        if not host or _host_casa(host, permitidos):
+            return
+        pendentes[ev.get("requestId")] = (host, ev.get("timestamp"))
+        if host in bloqueados or _host_casa(host, TERCEIROS_CONHECIDOS):
+            return
+        _terceiros_contar(site, host, desconhecido=1)
+        if not BLOQUEIO_APRENDER:
+            return
+        # Host novo de terceiros: passa desta vez, mas já entra na lista para as próximas
+        bloqueados.add(host)
+        with _bloqueio_lock:
+            _carregar_hosts_aprendidos().setdefault(site, set()).add(host)
+        print(f"[Bloqueio] {site}: novo host de terceiros bloqueado: {host}")
+        try:
+            cdp.send("Network.setBlockedURLs", {"urls": _padroes()})
+        except Exception:
+            pass
 
-    ctx = browser.new_context(**ctx_kwargs)
+    def _on_finished(ev):
+        _bloqueio_contar(site, "permitidas")
+        _bloqueio_contar(site, "bytes_permitidos", int(ev.get("encodedDataLength") or 0))
+        info = pendentes.pop(ev.get("requestId"), None)
+        if info:
+            ms = ((ev.get("timestamp") or 0) - (info[1] or 0)) * 1000
+            _terceiros_contar(site, info[0], baixadas=1, bytes=int(ev.get("encodedDataLength") or 0), ms=max(ms, 0))
 
-    # Bloqueia imagens, fontes e mídia para economizar recursos
-    def _route(route):
-        r = route.request
-        if r.resource_type in {"image", "font", "media"}:
-            return route.abort()
-        return route.continue_()
-    ctx.route("**/*", _route)
+    def _on_failed(ev):
+        info = pendentes.pop(ev.get("requestId"), None)
+        if ev.get("blockedReason"):
+            _bloqueio_contar(site, "bloqueadas", tipo=ev.get("type"))
+            if info:
+                _terceiros_contar(site, info[0], bloqueadas=1)
 
-    ctx.add_init_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined});")
-    return browser, ctx
+    if BLOQUEIO_ALLOWLIST:
+        cdp.on("Network.requestWillBeSent", _on_request)
+    if BLOQUEIO_ESTATS or BLOQUEIO_ALLOWLIST:
+        cdp.on("Network.loadingFinished", _on_finished)
+        cdp.on("Network.loadingFailed", _on_failed)
+    return cdp
 
-def make_context_only(pw_browser):
+def relatorio_bloqueio():
+    with _bloqueio_lock:
+        for site, st in sorted(_bloqueio_stats.items()):
+            tipos = ", ".join(f"{t}={n}" for t, n in sorted(st["bloqueadas_por_tipo"].items()))
+            print(f"[Bloqueio] {site}: permitidas={st['permitidas']} ({st['bytes_permitidos']/1048576:.1f}MB) "
+                  f"| bloqueadas={st['bloqueadas']}" + (f" ({tipos})" if tipos else ""))
+        # Economia estimada = bloqueadas × média (bytes/ms) das vezes em que o host chegou a baixar
+        for site, hosts in sorted(_terceiros_stats.items()):
+            eco_bytes = eco_ms = 0.0
+            novos = sorted(h for h, st in hosts.items() if st["desconhecido"] and not st["bloqueadas"])
+            if novos:
+                print(f"[Bloqueio][{site}] ⚠️ Hosts de terceiros desconhecidos (permitidos): {', '.join(novos)}"
+                      " — para bloquear, inclua em BLOQUEIO_HOSTS")
+            for host, st in sorted(hosts.items(), key=lambda kv: -kv[1]["bloqueadas"]):
+                media_b = st["bytes"] / st["baixadas"] if st["baixadas"] else 0
+                media_ms = st["ms"] / st["baixadas"] if st["baixadas"] else 0
+                eco_bytes += st["bloqueadas"] * media_b
+                eco_ms += st["bloqueadas"] * media_ms
+                print(f"[Bloqueio][{site}] {host}: bloqueadas={st['bloqueadas']} baixadas={st['baixadas']} "
+                      f"({st['bytes']/1024:.0f}KB, {st['ms']:.0f}ms)")
+            print(f"[Bloqueio][{site}] Economia com terceiros (estimativa: bloqueadas × média das baixadas): "
+                  f"~{eco_bytes/1048576:.1f}MB, ~{eco_ms/1000:.1f}s de rede")
+        aprendidos = {k: sorted(v) for k, v in (_hosts_aprendidos or {}).items() if v}
+    if BLOQUEIO_APRENDER and aprendidos:
+        try:
+            arq = arq_hosts_terceiros()
+            arq.parent.mkdir(parents=True, exist_ok=True)
+            with open(arq, "w", encoding="utf-8") as f:
+                json.dump(aprendidos, f, ensure_ascii=False, indent=2, sort_keys=True)
+        except Exception as e:
+            print(f"[Bloqueio] ⚠️ Erro ao salvar hosts aprendidos: {e}")
+
+# ====== CACHE DE ASSETS (js/css em disco) ======
+# Cada lote abre navegador e contexto novos, então o cache HTTP do Chromium não sobrevive.
+# Só as URLs .js/.css passam por este route (o resto nem chega ao Python): dentro do TTL o
+# corpo sai do disco; depois disso revalida com ETag/Last-Modified (304 = reaproveita).
+# Corpos ficam em objetos/<sha256> (conteúdo igual em URLs diferentes = um arquivo só).
+ASSET_URL_RE = re.compile(r"^[^?#]+\.(js|mjs|css)([?#]|$)", re.I)
+_cache_lock = threading.Lock()
+_cache_indice = None
+_cache_stats = {"hits": 0, "revalidados": 0, "misses": 0, "ignorados": 0, "erros": 0,
+                "bytes_servidos": 0, "bytes_baixados": 0}
+_cache_salvo_em = 0.0
+
+def _cache_carregar():
+    global _cache_indice
+    if _cache_indice is None:
+        try:
+            with open(CACHE_ASSETS_DIR / "indice.json", "r", encoding="utf-8") as f:
+                _cache_indice = json.load(f)
+        except Exception:
+            _cache_indice = {}
+    return _cache_indice
+
+def _cache_salvar(forcar=False):
+    """Grava o índice (no máx. a cada 5s; troca atômica, vários processos podem ler)"""
+    global _cache_salvo_em
+    with _cache_lock:
+        if _cache_indice is None or (not forcar and time.time() - _cache_salvo_em < 5):
+            return
+        _cache_salvo_em = time.time()
+        try:
+            CACHE_ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = CACHE_ASSETS_DIR / f"indice.json.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_cache_indice, f, ensure_ascii=False)
+            os.replace(tmp, CACHE_ASSETS_DIR / "indice.json")
+        except Exception as e:
+            print(f"[Cache] ⚠️ Erro ao salvar índice: {e}")
+
+def _cache_objeto(sha):
+    return CACHE_ASSETS_DIR / "objetos" / sha[:2] / sha
+
+def _cache_contar(campo, valor=1, bytes_campo=None, n_bytes=0):
+    with _cache_lock:
+        _cache_stats[campo] += valor
+        if bytes_campo:
+            _cache_stats[bytes_campo] += n_bytes
+
+def _cache_guardar(url, resp, corpo):
+    sha = hashlib.sha256(corpo).hexdigest()
+    arq = _cache_objeto(sha)
+    if not arq.exists():
+        arq.parent.mkdir(parents=True, exist_ok=True)
+        tmp = arq.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(corpo)
+        os.replace(tmp, arq)
+    h = resp.headers
+    with _cache_lock:
+        _cache_carregar()[url] = {"sha256": sha, "content_type": h.get("content-type", ""),
+                                  "etag": h.get("etag"), "last_modified": h.get("last-modified"),
+                                  "salvo_em": time.time(), "tamanho": len(corpo)}
+
+def _rota_asset(route):
+    req = route.request
+    if req.method != "GET":
+        return route.fallback()
+    url = req.url
+    with _cache_lock:
+        ent = dict(_cache_carregar().get(url) or {})
+    arq = _cache_objeto(ent["sha256"]) if ent else None
+    if arq is not None and not arq.exists():
+        ent, arq = {}, None
+    try:
+        if ent and time.time() - ent["salvo_em"] < CACHE_ASSETS_TTL_S:
+            corpo = arq.read_bytes()
+            _cache_contar("hits", bytes_campo="bytes_servidos", n_bytes=len(corpo))
+            return route.fulfill(status=200, headers={"content-type": ent["content_type"]}, body=corpo)
+        headers = dict(req.headers)
+        if ent.get("etag"):
+            headers["if-none-match"] = ent["etag"]
+        if ent.get("last_modified"):
+            headers["if-modified-since"] = ent["last_modified"]
+        resp = route.fetch(headers=headers)
+        if resp.status == 304 and ent:
+            corpo = arq.read_bytes()
+            with _cache_lock:
+                _cache_carregar()[url]["salvo_em"] = time.time()
+            _cache_contar("revalidados", bytes_campo="bytes_servidos", n_bytes=len(corpo))
+            _cache_salvar()
+            return route.fulfill(status=200, headers={"content-type": ent["content_type"]}, body=corpo)
+        cc = (resp.headers.get("cache-control") or "").lower()
+        if resp.status == 200 and "no-store" not in cc:
+            corpo = resp.body()
+            _cache_guardar(url, resp, corpo)
+            _cache_contar("misses", bytes_campo="bytes_baixados", n_bytes=len(corpo))
+            _cache_salvar()
+        else:
+            _cache_contar("ignorados")
+        return route.fulfill(response=resp)
+    except Exception:
+        _cache_contar("erros")
+        try:
+            route.fallback()
+        except Exception:
+            pass
+
+def instalar_cache_assets(ctx):
+    if CACHE_ASSETS and not HAR_MODO:  # com HAR o tráfego tem de passar (gravar) ou vir (replay) do arquivo
+        ctx.route(ASSET_URL_RE, _rota_asset)
+
+def relatorio_cache_assets():
+    if not CACHE_ASSETS:
+        return
+    _cache_salvar(forcar=True)
+    with _cache_lock:
+        st = dict(_cache_stats)
+        n = len(_cache_indice or {})
+    total = st["hits"] + st["revalidados"] + st["misses"]
+    if not total:
+        return
+    print(f"[Cache] assets: hits={st['hits']} revalidados={st['revalidados']} misses={st['misses']} "
+          f"ignorados={st['ignorados']} erros={st['erros']} | taxa={100.0 * (st['hits'] + st['revalidados']) / total:.0f}% "
+          f"| servidos do disco={st['bytes_servidos']/1048576:.1f}MB baixados={st['bytes_baixados']/1048576:.1f}MB "
+          f"| {n} URLs no índice")
+
+# ====== GRAVAÇÃO / REPLAY HAR ======
+# Gravar: cada contexto grava um HAR (zip) por site via route_from_har(update=True); o que não é
+# de nenhum site (CDNs das telas dos sinks) vai para "outros". Replay: os mesmos arquivos servem as
+# respostas e o que não estiver gravado é abortado. Os atalhos por HTTP direto (parser HTML, portal
+# por POST, REST do Woo) ficam desligados nos dois modos, senão passariam por fora do navegador.
+_har = {"pasta": None, "contextos": 0, "fora_do_har": 0, "escritas": 0}
+_har_lock = threading.Lock()
+
+def _har_grupos():
+    """grupo -> regex das URLs que vão para o HAR dele"""
+    dominios = {"tenda": TENDA_URL, "cds": CDS_URL, "wp": WP_BASE_URL, "portal": PORTAL_URL}
+    dominios = {g: re.escape(_host_base(u)) for g, u in dominios.items()}
+    grupos = {g: re.compile(rf"^https?://([^/]*\.)?{d}(:\d+)?/") for g, d in dominios.items()}
+    todos = "|".join(dominios.values())
+    grupos["outros"] = re.compile(rf"^(?!https?://([^/]*\.)?({todos})(:\d+)?/)")
+    return grupos
+
+def har_iniciar(modo, pasta=None):
+    """Liga a gravação (pasta nova em HAR_DIR) ou o replay (padrão: a gravação mais recente)"""
+    global HAR_MODO, LOG_DIR, HISTORICO_DB
+    import shutil
+    HAR_MODO = modo
+    if modo == "gravar":
+        pasta = Path(pasta) if pasta else HAR_DIR / RUN_ID
+        pasta.mkdir(parents=True, exist_ok=True)
+        # o replay precisa começar com o mesmo estado de CEP que a gravação teve
+        for arq in LOG_DIR.glob("tenda_estado_*.json"):
+            shutil.copy2(arq, pasta / arq.name)
+    else:
+        if not pasta:
+            gravacoes = sorted(p for p in HAR_DIR.glob("*") if p.is_dir()) if HAR_DIR.exists() else []
+            pasta = gravacoes[-1] if gravacoes else None
+        if not pasta or not Path(pasta).exists():
+            raise RuntimeError(f"Nenhuma gravação HAR em {HAR_DIR} (rode 'run --record' antes)")
+        pasta = Path(pasta)
+        # logs, histórico, pendentes e revisão do replay ficam dentro da gravação, longe dos reais
+        LOG_DIR = pasta / f"replay_{RUN_ID}"
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        HISTORICO_DB = LOG_DIR / "historico.sqlite3"
+        for arq in pasta.glob("tenda_estado_*.json"):
+            shutil.copy2(arq, LOG_DIR / arq.name)
+    _har["pasta"] = pasta
+    print(f"[HAR] Modo {modo}: {pasta}")
+    return pasta
+
+def _har_abortar(route):
+    with _har_lock:
+        _har["fora_do_har"] += 1
+    route.abort("internetdisconnected")
+
+def instalar_har(ctx):
+    if not HAR_MODO:
+        return
+    pasta = _har["pasta"] or har_iniciar(HAR_MODO)
+    if HAR_MODO == "gravar":
+        with _har_lock:
+            _har["contextos"] += 1
+            n = _har["contextos"]
+        for grupo, rx in _har_grupos().items():
+            ctx.route_from_har(str(pasta / f"{grupo}-{n:03d}.zip"), url=rx, update=True)
+        return
+    # a rota registrada por último atende primeiro: HARs, e só o que nenhum tiver cai no abort
+    ctx.route("**/*", _har_abortar)
+    for grupo, rx in _har_grupos().items():
+        for arq in sorted(pasta.glob(f"{grupo}-*.zip")):
+            ctx.route_from_har(str(arq), url=rx, not_found="fallback")
+
+def har_registrar_escrita(sink, sku, preco, resultado, duracao_ms=None):
+    """No replay a escrita não sai: fica em escritas.jsonl da pasta do replay"""
+    try:
+        with _har_lock, open(LOG_DIR / "escritas.jsonl", "a", encoding="utf-8") as f:
+            _har["escritas"] += 1
+            f.write(json.dumps({"sku": sku, "sink": sink, "preco": preco, "resultado": _resultado_sink(resultado),
+                                "duracao_ms": duracao_ms, "ts": _agora_iso()}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[HAR] ⚠️ Erro ao registrar escrita {sku}/{sink}: {e}")
+
+def relatorio_har():
+    if not HAR_MODO:
+        return
+    if HAR_MODO == "gravar":
+        print(f"[HAR] {_har['contextos']} contexto(s) gravados em {_har['pasta']}")
+    else:
+        print(f"[HAR] Replay: {_har['escritas']} escritas registradas em {LOG_DIR / 'escritas.jsonl'} | "
+              f"{_har['fora_do_har']} requisições fora da gravação (abortadas)")
+
+def nova_pagina(ctx, site):
+    page = ctx.new_page()
+    page.set_default_timeout(DEFAULT_TIMEOUT)
+    aplicar_bloqueio(page, site)
+    return page
+
+def make_context_only(pw_browser, com_cep=True, cep=None):
     try:
         if not pw_browser:
             raise RuntimeError("Navegador não está disponível")
@@ -169,23 +1050,34 @@ def make_context_only(pw_browser):
             viewport={"width": 1280, "height": 900},  # Sempre viewport fixo em headless
         )
 
+        # Estado da Tenda com o CEP já escolhido (cookies/localStorage) dispensa o observer do modal
+        cep = cep or CEP_VALOR
+        estado_cep = tenda_estado_path(cep) if (USE_CEP and com_cep) else None
+        semeado = bool(estado_cep and estado_cep.exists())
+        if semeado:
+            ctx_kwargs["storage_state"] = str(estado_cep)
+
         print("[Context] Criando contexto...")
         ctx = pw_browser.new_context(**ctx_kwargs)
-        print("[Context] Contexto criado")
+        print("[Context] Contexto criado" + (" (estado da Tenda semeado)" if semeado else ""))
 
-        # Bloqueia imagens, fontes e mídia para economizar recursos
-        def _route(route):
-            r = route.request
-            if r.resource_type in {"image", "font", "media"}:
-                return route.abort()
-            return route.continue_()
-        ctx.route("**/*", _route)
+        # Bloqueia imagens, fontes e mídia para economizar recursos.
+        # No modo "cdp" isso é feito por página em nova_pagina(); aqui só o fallback antigo.
+        if BLOQUEIO_MODO == "route":
+            def _route(route):
+                r = route.request
+                if r.resource_type in {"image", "font", "media"}:
+                    return route.abort()
+                return route.continue_()
+            ctx.route("**/*", _route)
 
+        instalar_har(ctx)
+        instalar_cache_assets(ctx)
         ctx.add_init_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined});")
         
         # Adiciona o script do CEP se necessário (antes de criar páginas)
-        if USE_CEP:
-            ctx.add_init_script(build_cep_observer_js(CEP_VALOR))
+        if USE_CEP and com_cep and not semeado:
+            ctx.add_init_script(build_cep_observer_js(cep))
         
         print("[Context] ✅ Contexto configurado com sucesso")
         return ctx
@@ -195,7 +1087,26 @@ def make_context_only(pw_browser):
         traceback.print_exc()
         raise
 
-def open_and_login_all(ctx):
+def abrir_tenda(page, prazo=None, cep=None):
+    cep = cep or CEP_VALOR
+    page.goto(TENDA_URL, wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
+    print(f"[Login] Tenda carregada: {page.url}")
+    page.wait_for_timeout(500)
+
+    if USE_CEP:
+        if tenda_cep_ok(page, cep):
+            print("[Login] CEP já definido (estado semeado)")
+            return
+        print("[Login] Configurando CEP...")
+        ensure_cep(page, cep)
+        nuke_overlays(page)
+        if tenda_cep_ok(page, cep):
+            salvar_estado_tenda(page.context, cep)
+        print("[Login] CEP configurado")
+
+def open_and_login_all(ctx, paralelo=None, com_tenda=True):
+    """(p_tenda, p_cds, p_wp, p_portal); com_tenda=False (multi-CEP: a Tenda tem os seus
+    navegadores por CEP) não abre a página da Tenda no contexto do lote"""
     p_tenda = p_cds = p_wp = p_portal = None
     try:
         print("[Login] Verificando contexto...")
@@ -204,75 +1115,41 @@ def open_and_login_all(ctx):
         print("[Login] Contexto OK")
         
         # Criação das páginas
-        print("[Login] Criando página Tenda...")
-        p_tenda  = ctx.new_page()
-        print("[Login] Página Tenda criada")
+        if com_tenda:
+            print("[Login] Criando página Tenda...")
+            p_tenda  = nova_pagina(ctx, "tenda")
+            print("[Login] Página Tenda criada")
         
         print("[Login] Criando página CDS...")
-        p_cds    = ctx.new_page()
+        p_cds    = nova_pagina(ctx, "cds")
         print("[Login] Página CDS criada")
         
         print("[Login] Criando página WP...")
-        p_wp     = ctx.new_page()
+        p_wp     = nova_pagina(ctx, "wp")
         print("[Login] Página WP criada")
         
         print("[Login] Criando página Portal...")
-        p_portal = ctx.new_page()
+        p_portal = nova_pagina(ctx, "portal")
         print("[Login] Página Portal criada")
-        
-        print("[Login] Configurando timeouts...")
-        for _p in (p_tenda, p_cds, p_wp, p_portal):
-            _p.set_default_timeout(DEFAULT_TIMEOUT)
-        print("[Login] Timeouts configurados")
             
-        # Logins
-        print("[Login] Acessando Tenda...")
+        # Logins: Tenda nesta thread, sinks em paralelo; login que falhar só desliga o seu sink
         try:
-            p_tenda.goto(TENDA_URL, wait_until="domcontentloaded", timeout=60000)
-            print(f"[Login] Tenda carregada: {p_tenda.url}")
-            p_tenda.wait_for_timeout(500)
-            
-            if USE_CEP:
-                print("[Login] Configurando CEP...")
-                ensure_cep(p_tenda, CEP_VALOR)
-                nuke_overlays(p_tenda)
-                print("[Login] CEP configurado")
+            status = logar_sites(ctx, p_tenda, {"cds": p_cds, "wp": p_wp, "portal": p_portal}, paralelo)
         except Exception as tenda_err:
             print(f"[Login] ❌ Erro ao acessar Tenda: {tenda_err}")
-            import traceback
-            traceback.print_exc()
             raise
-            
-        print("[Login] Acessando CDS...")
-        try:
-            login_cds(p_cds)
-        except Exception as cds_err:
-            print(f"[Login] Erro crítico no login CDS: {cds_err}")
-            # Verifica se a página ainda está viva
-            try:
-                if not is_page_closed(p_cds):
-                    print(f"[Login] Página CDS ainda aberta, URL: {p_cds.url}")
-                else:
-                    print(f"[Login] Página CDS foi fechada!")
-            except:
-                print(f"[Login] Não foi possível verificar status da página CDS")
-            raise
-        
-        print("[Login] Acessando WP...")
-        try:
-            wp_login(p_wp)
-        except Exception as wp_err:
-            print(f"[Login] ❌ Erro no login WP: {wp_err}")
-            raise
-        
-        print("[Login] Acessando Portal...")
-        try:
-            login_portal(p_portal)
-        except Exception as portal_err:
-            print(f"[Login] ❌ Erro no login Portal: {portal_err}")
-            raise
-        
-        print("[Login] ✅ Todos os logins concluídos com sucesso!")
+        if not status["cds"]:
+            p_cds.close(); p_cds = None
+        if not status["wp"]:
+            p_wp.close(); p_wp = None
+        if not status["portal"]:
+            p_portal.close(); p_portal = None
+
+        if all(status.values()):
+            print("[Login] ✅ Todos os logins concluídos com sucesso!")
+        else:
+            falhos = ", ".join(s for s, ok in status.items() if not ok)
+            print(f"[Login] ⚠️ Seguindo sem: {falhos} (escritas desses sinks ficam pendentes)")
         return p_tenda, p_cds, p_wp, p_portal
         
     except Exception as e:
@@ -293,63 +1170,306 @@ def open_and_login_all(ctx):
 # =======================
 # Portal Hortigold
 # =======================
-PORTAL_URL = "https://mlovi.com.br/sistemahortigold/public/"
+PORTAL_URL = (os.getenv("PORTAL_URL") or "https://mlovi.com.br/sistemahortigold/public").rstrip("/") + "/"
 PORTAL_USER = os.getenv("PORTAL_USER", "admin")
 PORTAL_PASS = os.getenv("PORTAL_PASS", "admin123")
 
-def login_portal(page):
+# Caminho rápido por HTTP: lista de produtos numa requisição, diff e POST só do que mudou.
+# O endpoint de gravação é aprendido da 1ª gravação feita pelo modal (ou vem de PORTAL_SAVE_URL).
+# Só liga com um PORTAL_LIST_URL que traga o preço (PORTAL_PRECO_CAMPO); o test_products.php
+# do catálogo não traz, e sem o preço não há diff nem confirmação.
+PORTAL_LIST_URL     = os.getenv("PORTAL_LIST_URL", "")
+PORTAL_HTTP         = os.getenv("PORTAL_HTTP", "1" if PORTAL_LIST_URL else "0") == "1" and bool(PORTAL_LIST_URL)
+PORTAL_SAVE_URL     = os.getenv("PORTAL_SAVE_URL", "")
+PORTAL_PRECO_CAMPO  = os.getenv("PORTAL_PRECO_CAMPO", "preco")
+PORTAL_CAMPOS_FIXOS = set(os.getenv("PORTAL_CAMPOS_FIXOS", "action,acao,op,metodo,_token,csrf_token").split(","))
+PORTAL_HTTP_WORKERS = int(os.getenv("PORTAL_HTTP_WORKERS", "4"))
+
+_portal_lock = threading.Lock()
+_portal_http = {"endpoint": None, "sessao": None, "cookies": None, "registros": None,
+                "sem_preco": False, "a_confirmar": {}}
+if PORTAL_SAVE_URL:
+    # Endpoint informado: POST form com sku + preco
+    _portal_http["endpoint"] = {"url": PORTAL_SAVE_URL, "tipo": "form", "sku_ref": "",
+                                "campos": {"sku": "", PORTAL_PRECO_CAMPO: ""}, "campo_preco": PORTAL_PRECO_CAMPO,
+                                "decimal_virgula": False}
+
+def login_portal(page, prazo=None):
     try:
-        page.goto(PORTAL_URL + "login.php", wait_until="domcontentloaded", timeout=60000)
+        page.goto(PORTAL_URL + "login.php", wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
         page.fill("#username", PORTAL_USER)
         page.fill("#password", PORTAL_PASS)
         try:
-            with page.expect_navigation(wait_until="domcontentloaded", timeout=60000):
+            with page.expect_navigation(wait_until="domcontentloaded", timeout=t_ms(prazo, 60000)):
                 page.click("button[type='submit']")
         except Exception:
             pass
-        page.wait_for_url(re.compile(".*/dashboard.php"), timeout=30000)
+        page.wait_for_url(re.compile(".*/dashboard.php"), timeout=t_ms(prazo, 30000))
         print("[PORTAL] Login OK")
     except Exception as e:
         print(f"[PORTAL] ❌ Erro no login: {e}")
 
-def atualizar_portal(page, sku: str, preco: float):
+def portal_http_ativo():
+    return PORTAL_HTTP and not HAR_MODO and not _portal_http["sem_preco"]
+
+def abrir_portal(page, prazo=None):
+    page.goto(PORTAL_URL + "dashboard.php", wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
+
+def portal_sessao_http(page):
+    """requests.Session com os cookies do login_portal e pool de conexões (refeita a cada novo login)"""
+    import requests
+    cookies = page.context.cookies(PORTAL_URL)
+    chave = tuple(sorted((c["name"], c["value"]) for c in cookies))
+    with _portal_lock:
+        if _portal_http["sessao"] is None or _portal_http["cookies"] != chave:
+            sessao = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max(2, PORTAL_HTTP_WORKERS))
+            sessao.mount("https://", adapter)
+            sessao.mount("http://", adapter)
+            sessao.headers["User-Agent"] = page.evaluate("navigator.userAgent")
+            for c in cookies:
+                sessao.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+            _portal_http["sessao"], _portal_http["cookies"] = sessao, chave
+        return _portal_http["sessao"]
+
+def _portal_caiu_no_login(r):
+    """Sessão expirada: o POST/GET é redirecionado para login.php e ainda responde 200"""
+    destino = urllib.parse.urlsplit(r.url or "").path.lower()
+    return "login" in destino and (bool(r.history) or destino.endswith("login.php"))
+
+def _portal_invalidar_sessao():
+    with _portal_lock:
+        _portal_http["sessao"] = _portal_http["cookies"] = None
+
+def portal_listar_produtos(sessao, recarregar=False):
+    """{sku: registro} da lista de produtos do Portal, numa requisição só"""
+    with _portal_lock:
+        if _portal_http["registros"] is not None and not recarregar:
+            return _portal_http["registros"]
+    try:
+        r = sessao.get(PORTAL_LIST_URL, timeout=30)
+        r.raise_for_status()
+        if _portal_caiu_no_login(r):
+            _portal_invalidar_sessao()
+            raise RuntimeError("sessão expirada (redirecionou para o login)")
+        data = r.json()
+        lista = data.get("products", []) if isinstance(data, dict) else data
+        registros = {str(p.get("sku") or "").strip(): p for p in lista if p.get("sku")}
+        if registros and not any(PORTAL_PRECO_CAMPO in p for p in registros.values()):
+            print(f"[PORTAL][HTTP] ⚠️ A lista não traz o campo '{PORTAL_PRECO_CAMPO}' — caminho HTTP desligado")
+            with _portal_lock:
+                _portal_http["sem_preco"] = True
+    except Exception as e:
+        print(f"[PORTAL][HTTP] ⚠️ Não foi possível listar produtos: {e}")
+        registros = {}
+    with _portal_lock:
+        _portal_http["registros"] = registros
+    return registros
+
+def _portal_eh_gravacao(req, sku, preco):
+    """O POST do modal que grava este SKU (corpo com o SKU e o preço), não um POST qualquer"""
+    if req.method != "POST":
+        return False
+    corpo = urllib.parse.unquote_plus(req.post_data or "")
+    return sku in corpo and (f"{preco:.2f}" in corpo or as_br_price(preco) in corpo)
+
+def _portal_aprender_endpoint(req, sku, preco):
+    """Guarda URL e campos do POST que o modal fez, para repetir por HTTP nos próximos SKUs"""
+    try:
+        ctype = (req.headers.get("content-type") or "").lower()
+        corpo = req.post_data or ""
+        if "json" in ctype:
+            campos, tipo = json.loads(corpo), "json"
+        else:
+            campos = {k: v[0] for k, v in urllib.parse.parse_qs(corpo, keep_blank_values=True).items()}
+            tipo = "form"
+        campo_preco = next((k for k, v in campos.items() if clean_price(str(v)) == round(preco, 2)), None)
+        if not isinstance(campos, dict) or not campo_preco:
+            print("[PORTAL][HTTP] Gravação do modal sem campo de preço reconhecível — seguindo pela UI")
+            return
+        with _portal_lock:
+            _portal_http["endpoint"] = {"url": req.url, "tipo": tipo, "campos": campos,
+                                        "campo_preco": campo_preco, "sku_ref": sku,
+                                        "decimal_virgula": "," in str(campos[campo_preco])}
+        print(f"[PORTAL][HTTP] Endpoint de gravação aprendido: {req.url} ({tipo})")
+    except Exception as e:
+        print(f"[PORTAL][HTTP] ⚠️ Não foi possível aprender o endpoint: {e}")
+
+def _portal_montar_campos(ep, sku, preco, registros):
+    """Campos do POST para outro SKU; None se algum campo não puder ser resolvido com segurança"""
+    reg, ref = registros.get(sku), registros.get(ep["sku_ref"]) or {}
+    dados = {}
+    for k, v in ep["campos"].items():
+        if k == ep["campo_preco"]:
+            dados[k] = as_br_price(preco) if ep["decimal_virgula"] else f"{preco:.2f}"
+        elif k in ref and str(ref[k]) == str(v) and reg and k in reg:
+            dados[k] = reg[k]   # campo do próprio registro (inclui o SKU e flags como ativo=1)
+        elif "sku" in k.lower() and str(v) == ep["sku_ref"]:
+            dados[k] = sku
+        elif k in PORTAL_CAMPOS_FIXOS:
+            dados[k] = v
+        else:
+            return None
+    return dados
+
+def portal_salvar_http(sessao, sku, preco, registros):
+    ep = _portal_http["endpoint"]
+    if not ep:
+        return None
+    dados = _portal_montar_campos(ep, sku, preco, registros)
+    if dados is None:
+        return None
+    try:
+        if ep["tipo"] == "json":
+            r = sessao.post(ep["url"], json=dados, timeout=30)
+        else:
+            r = sessao.post(ep["url"], data=dados, timeout=30)
+        r.raise_for_status()
+        if _portal_caiu_no_login(r):
+            print(f"[PORTAL][HTTP] ⚠️ {sku}: sessão expirada (redirecionou para o login)")
+            _portal_invalidar_sessao()
+            return False
+        try:
+            corpo = r.json()
+            if isinstance(corpo, dict) and corpo.get("success") is False:
+                return False
+        except ValueError:
+            pass
+        return True
+    except Exception as e:
+        print(f"[PORTAL][HTTP] ❌ {sku}: {e}")
+        return False
+
+def portal_confirmar_http(sessao, precos):
+    """Relista o Portal e devolve os SKUs cujo preço gravado por HTTP bate com o alvo"""
+    registros = portal_listar_produtos(sessao, recarregar=True)
+    return {sku for sku, preco in precos.items()
+            if _portal_preco_atual(registros.get(sku)) is not None
+            and abs(_portal_preco_atual(registros.get(sku)) - preco) < 0.005}
+
+def _portal_preco_atual(reg):
+    if not reg or reg.get(PORTAL_PRECO_CAMPO) in (None, ""):
+        return None
+    return clean_price(str(reg.get(PORTAL_PRECO_CAMPO)))
+
+def atualizar_portal(page, sku: str, preco: float, prazo=None, via_http=True):
+    """Por HTTP (confirmado numa listagem só, em portal_confirmar_pendentes) ou pelo modal"""
+    if via_http and portal_http_ativo() and _portal_http["endpoint"] and not is_page_closed(page):
+        sessao = portal_sessao_http(page)
+        if portal_salvar_http(sessao, sku, preco, portal_listar_produtos(sessao)):
+            with _portal_lock:
+                _portal_http["a_confirmar"][sku] = preco
+            print(f"[PORTAL][HTTP] SKU {sku} gravado -> {preco:.2f} (confirmação no fim do lote)")
+            return True
     try:
         if is_page_closed(page):
             print(f"[PORTAL] Página fechada para SKU {sku}")
             return False
+        renovar_prazo(page, prazo)
         page.fill("#filter-sku", sku)
         page.press("#filter-sku", "Enter")
-        page.wait_for_selector(f"#products-table tr:has-text('{sku}')", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_selector(f"#products-table tr:has-text('{sku}')", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
+        renovar_prazo(page, prazo)
         row = page.locator(f"#products-table tr:has-text('{sku}')").first
         row.locator("button:has(i.fas.fa-edit)").click()
-        page.wait_for_selector("#edit-preco", state="visible", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_selector("#edit-preco", state="visible", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
+        renovar_prazo(page, prazo)
         txt = f"{preco:.2f}"
         page.fill("#edit-preco", txt)
-        page.locator(".modal-footer button:has-text('Salvar')").click()
-        page.wait_for_selector("#edit-preco", state="hidden", timeout=DEFAULT_TIMEOUT)
+        salvar = page.locator(".modal-footer button:has-text('Salvar')")
+        if portal_http_ativo() and not _portal_http["endpoint"]:
+            try:
+                with page.expect_request(lambda r: _portal_eh_gravacao(r, sku, preco),
+                                         timeout=t_ms(prazo, 10000)) as req_info:
+                    salvar.click()
+                _portal_aprender_endpoint(req_info.value, sku, preco)
+            except PrazoEsgotado:
+                raise
+            except Exception:
+                pass
+        else:
+            salvar.click()
+        page.wait_for_selector("#edit-preco", state="hidden", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
         print(f"[PORTAL] SKU {sku} atualizado -> {txt}")
         return True
     except Exception as e:
+        if isinstance(e, PrazoEsgotado) or prazo_vencido(prazo):
+            print(f"[PORTAL] ⚠️ {sku}: prazo esgotado")
+            return TIMEOUT_BUDGET
         print(f"[PORTAL] ❌ {sku}: {e}")
         return False
 
+def atualizar_portal_lote(page, escritas):
+    """Diff da lista do Portal contra os preços-alvo e POST em paralelo só do que mudou"""
+    pendentes = dict(escritas)
+    resultados = {}
+    sessao = portal_sessao_http(page) if portal_http_ativo() and not is_page_closed(page) else None
+    registros = portal_listar_produtos(sessao, recarregar=True) if sessao else None
+    if registros is not None and portal_http_ativo():  # lista sem o campo de preço desliga o HTTP
+        iguais = [sku for sku, preco in pendentes.items()
+                  if _portal_preco_atual(registros.get(sku)) is not None
+                  and abs(_portal_preco_atual(registros.get(sku)) - preco) < 0.005]
+        for sku in iguais:
+            resultados[sku] = True
+            pendentes.pop(sku)
+        print(f"[PORTAL][HTTP] {len(iguais)} SKUs já com o preço certo, {len(pendentes)} a gravar")
+
+        if pendentes and not _portal_http["endpoint"]:
+            sku0 = next(iter(pendentes))
+            resultados[sku0] = atualizar_portal(page, sku0, pendentes.pop(sku0), via_http=False)
+
+        if pendentes and _portal_http["endpoint"]:
+            with ThreadPoolExecutor(max_workers=PORTAL_HTTP_WORKERS) as ex:
+                futs = {ex.submit(portal_salvar_http, sessao, sku, preco, registros): sku
+                        for sku, preco in pendentes.items()}
+                gravados = {futs[fut] for fut in as_completed(futs) if fut.result()}
+            confirmados = portal_confirmar_http(sessao, {s: pendentes[s] for s in gravados}) if gravados else set()
+            for sku in confirmados:
+                resultados[sku] = True
+            if len(confirmados) < len(gravados):
+                print(f"[PORTAL][HTTP] ⚠️ {len(gravados) - len(confirmados)} POST(s) aceitos sem o preço mudar — vão pela UI")
+            print(f"[PORTAL][HTTP] {len(confirmados)}/{len(pendentes)} gravados e confirmados por HTTP")
+
+    for sku, preco in pendentes.items():
+        if sku not in resultados:
+            resultados[sku] = atualizar_portal(page, sku, preco, via_http=False)
+    return resultados
+
+def portal_confirmar_pendentes(page):
+    """Confirma numa listagem só os POSTs por HTTP do lote; o que não pegou é refeito pelo modal.
+    Devolve {sku: (preço, resultado)} só dos refeitos."""
+    with _portal_lock:
+        pendentes, _portal_http["a_confirmar"] = _portal_http["a_confirmar"], {}
+    if not pendentes or page is None or is_page_closed(page):
+        return {}
+    confirmados = portal_confirmar_http(portal_sessao_http(page), pendentes)
+    print(f"[PORTAL][HTTP] {len(confirmados)}/{len(pendentes)} gravações do lote confirmadas na lista")
+    refeitos = {}
+    for sku, preco in pendentes.items():
+        if sku not in confirmados:
+            print(f"[PORTAL][HTTP] ⚠️ {sku}: POST aceito mas o preço não mudou na lista — refazendo pela UI")
+            refeitos[sku] = (preco, atualizar_portal(page, sku, preco, via_http=False))
+    return refeitos
+
 # =======================
 # CDS (ERP)
 # =======================
-def fechar_modal_cds(page):
+def fechar_modal_cds(page, prazo=None):
     try:
-        page.wait_for_selector("#info-modal", state="visible", timeout=2000)
+        page.wait_for_selector("#info-modal", state="visible", timeout=t_ms(prazo, 2000))
         page.locator("#btn_fechar_modal button").click()
-        page.wait_for_selector("#info-modal", state="hidden", timeout=2000)
+        page.wait_for_selector("#info-modal", state="hidden", timeout=t_ms(prazo, 2000))
         print("[CDS] Modal de confirmação fechado")
+    except PrazoEsgotado:
+        raise
     except:
         pass
 
-def login_cds(page):
+def login_cds(page, prazo=None):
     for attempt in range(2):
         try:
             print(f"[CDS] Tentativa {attempt+1}: Navegando para {CDS_URL}...")
-            page.goto(CDS_URL, wait_until="domcontentloaded", timeout=60000)
+            page.goto(CDS_URL, wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
             print(f"[CDS] Página carregada. URL atual: {page.url}")
             
             print(f"[CDS] Preenchendo credenciais...")
@@ -358,7 +1478,7 @@ def login_cds(page):
             
             print(f"[CDS] Clicando no botão de login...")
             try:
-                with page.expect_navigation(wait_until="domcontentloaded", timeout=60000):
+                with page.expect_navigation(wait_until="domcontentloaded", timeout=t_ms(prazo, 60000)):
                     page.click("#btn-login")
             except Exception as nav_err:
                 print(f"[CDS] Navegação após primeiro login: {nav_err}")
@@ -366,7 +1486,7 @@ def login_cds(page):
             
             print(f"[CDS] Aguardando campo de usuário...")
             try:
-                page.wait_for_selector("#usuariologin", state="visible", timeout=45000)
+                page.wait_for_selector("#usuariologin", state="visible", timeout=t_ms(prazo, 45000))
                 print(f"[CDS] Campo de usuário encontrado!")
             except Exception as wait_err:
                 print(f"[CDS] Campo não apareceu imediatamente, tentando limpar modais...")
@@ -382,7 +1502,7 @@ def login_cds(page):
                     """)
                     print(f"[CDS] Modais removidos via JS")
                 except: pass
-                page.wait_for_selector("#usuariologin", timeout=30000)
+                page.wait_for_selector("#usuariologin", timeout=t_ms(prazo, 30000))
                 print(f"[CDS] Campo de usuário encontrado após limpeza!")
 
             print(f"[CDS] Preenchendo dados do cliente...")
@@ -397,12 +1517,12 @@ def login_cds(page):
             
             print(f"[CDS] Fazendo login final...")
             try:
-                with page.expect_navigation(wait_until="networkidle", timeout=60000):
+                with page.expect_navigation(wait_until="networkidle", timeout=t_ms(prazo, 60000)):
                     page.click("#_btn-login")
                 print(f"[CDS] Navegação após login final concluída")
             except Exception as final_nav_err:
                 print(f"[CDS] Navegação após login final: {final_nav_err}, aguardando networkidle...")
-                page.wait_for_load_state("networkidle", timeout=45000)
+                page.wait_for_load_state("networkidle", timeout=t_ms(prazo, 45000))
             
             print("[CDS] Login OK")
             return
@@ -427,22 +1547,25 @@ DT_NEXT_LI         = "#table-relatorio-lista-prod_next"        # id único
 DT_NEXT_ANCHOR     = f"{DT_WRAP} {DT_NEXT_LI} a"
 
 # ====== HELPERS DO DATATABLES ======
-def cds_wait_processing_off(page, timeout_each=10000):
+def cds_wait_processing_off(page, timeout_each=10000, prazo=None):
     try:
-        page.wait_for_selector(DT_PROCESSING, state="hidden", timeout=timeout_each)
+        page.wait_for_selector(DT_PROCESSING, state="hidden", timeout=t_ms(prazo, timeout_each))
+    except PrazoEsgotado:
+        raise
     except Exception:
         pass
 
-def cds_wait_dt_ready(page, timeout_each=15000):
-    page.wait_for_selector(DT_TABLE, state="attached", timeout=timeout_each)
+def cds_wait_dt_ready(page, timeout_each=15000, prazo=None):
+    page.wait_for_selector(DT_TABLE, state="attached", timeout=t_ms(prazo, timeout_each))
     sb = page.locator(DT_SCROLLBODY).filter(has=page.locator("table#table-relatorio-lista-prod")).first
-    sb.wait_for(state="visible", timeout=timeout_each)
+    sb.wait_for(state="visible", timeout=t_ms(prazo, timeout_each))
     return sb
 
-def cds_wait_rows(page, timeout_each=15000):
-    page.wait_for_selector(f"{DT_TABLE} tbody tr", state="attached", timeout=timeout_each)
+def cds_wait_rows(page, timeout_each=15000, prazo=None):
+    page.wait_for_selector(f"{DT_TABLE} tbody tr", state="attached", timeout=t_ms(prazo, timeout_each))
 
-def cds_force_len_100(page):
+def cds_force_len_100(page, prazo=None):
+    renovar_prazo(page, prazo)
     changed = False
     if page.locator(DT_LENGTH_SELECT).count():
         try:
@@ -450,8 +1573,8 @@ def cds_force_len_100(page):
             changed = True
         except Exception:
             pass
-    cds_wait_processing_off(page, 8000)
-    cds_wait_rows(page, 15000)
+    cds_wait_processing_off(page, 8000, prazo=prazo)
+    cds_wait_rows(page, 15000, prazo=prazo)
     try:
         api_ok = page.evaluate("""
             try {
@@ -466,8 +1589,8 @@ def cds_force_len_100(page):
         if api_ok: changed = True
     except Exception:
         pass
-    cds_wait_processing_off(page, 8000)
-    cds_wait_rows(page, 15000)
+    cds_wait_processing_off(page, 8000, prazo=prazo)
+    cds_wait_rows(page, 15000, prazo=prazo)
     try:
         page.wait_for_function(r"""
             () => {
@@ -476,12 +1599,15 @@ def cds_force_len_100(page):
                 const t = (el.textContent || '').replace(/\s+/g,' ');
                 return !/\b1 a 10\b/.test(t);
             }
-        """, timeout=8000)
+        """, timeout=t_ms(prazo, 8000))
+    except PrazoEsgotado:
+        raise
     except Exception:
         pass
     return changed
 
-def cds_search_apply(page, text: str):
+def cds_search_apply(page, text: str, prazo=None):
+    renovar_prazo(page, prazo)
     if page.locator(DT_FILTER_INPUT).count():
         inp = page.locator(DT_FILTER_INPUT).first
         inp.click()
@@ -495,9 +1621,9 @@ def cds_search_apply(page, text: str):
         try: inp.press("Enter")
         except Exception: pass
 
-    cds_wait_processing_off(page, 8000)
-    cds_wait_dt_ready(page, 15000)
-    cds_force_len_100(page)
+    cds_wait_processing_off(page, 8000, prazo=prazo)
+    cds_wait_dt_ready(page, 15000, prazo=prazo)
+    cds_force_len_100(page, prazo=prazo)
     try:
         page.evaluate("""
             try {
@@ -511,12 +1637,12 @@ def cds_search_apply(page, text: str):
     except Exception:
         pass
 
-    cds_wait_processing_off(page, 8000)
-    cds_wait_dt_ready(page, 15000)
-    cds_force_len_100(page)
+    cds_wait_processing_off(page, 8000, prazo=prazo)
+    cds_wait_dt_ready(page, 15000, prazo=prazo)
+    cds_force_len_100(page, prazo=prazo)
 
-def cds_clear_search(page):
-    cds_search_apply(page, "")
+def cds_clear_search(page, prazo=None):
+    cds_search_apply(page, "", prazo=prazo)
 
 def cds_find_in_current_page_by_hidden_input(page, sku: str):
     row = page.locator(
@@ -536,7 +1662,7 @@ def cds_find_in_current_page_by_codigo_base(page, sku: str):
         return None
     return cell.locator("xpath=ancestor::tr[1]").first
 
-def cds_jump_to_page_of_sku_via_api(page, sku: str) -> bool:
+def cds_jump_to_page_of_sku_via_api(page, sku: str, prazo=None) -> bool:
     try:
         ok = page.evaluate("""
             try {
@@ -563,19 +1689,22 @@ def cds_jump_to_page_of_sku_via_api(page, sku: str) -> bool:
     except Exception:
         ok = False
 
-    cds_wait_processing_off(page, 8000)
-    cds_wait_dt_ready(page, 15000)
-    cds_force_len_100(page)
+    cds_wait_processing_off(page, 8000, prazo=prazo)
+    cds_wait_dt_ready(page, 15000, prazo=prazo)
+    cds_force_len_100(page, prazo=prazo)
     return bool(ok)
 
-def cds_consultar(page):
+def cds_consultar(page, prazo=None):
+    renovar_prazo(page, prazo)
     try:
-        page.wait_for_selector("#tabela", timeout=10000)
+        page.wait_for_selector("#tabela", timeout=t_ms(prazo, 10000))
         try:
             page.select_option("#tabela", label=re.compile(r"TODAS AS TABELAS", re.I))
         except Exception:
             try: page.select_option("#tabela", value="")
             except Exception: pass
+    except PrazoEsgotado:
+        raise
     except Exception:
         pass
 
@@ -587,25 +1716,27 @@ def cds_consultar(page):
             except Exception: pass
 
     try:
-        page.wait_for_selector(DT_PROCESSING, state="visible", timeout=5000)
+        page.wait_for_selector(DT_PROCESSING, state="visible", timeout=t_ms(prazo, 5000))
+    except PrazoEsgotado:
+        raise
     except Exception:
         pass
-    cds_wait_processing_off(page, 20000)
-    cds_wait_dt_ready(page, 20000)
-    cds_wait_rows(page, 20000)
-    cds_force_len_100(page)
+    cds_wait_processing_off(page, 20000, prazo=prazo)
+    cds_wait_dt_ready(page, 20000, prazo=prazo)
+    cds_wait_rows(page, 20000, prazo=prazo)
+    cds_force_len_100(page, prazo=prazo)
 
-def cds_find_row(page, sku: str, timeout_each=20000):
-    cds_consultar(page)
+def cds_find_row(page, sku: str, timeout_each=20000, prazo=None):
+    cds_consultar(page, prazo=prazo)
 
-    cds_search_apply(page, sku)
+    cds_search_apply(page, sku, prazo=prazo)
     row = cds_find_in_current_page_by_hidden_input(page, sku) or cds_find_in_current_page_by_codigo_base(page, sku)
     if row:
         return row
 
-    cds_clear_search(page)
+    cds_clear_search(page, prazo=prazo)
 
-    if cds_jump_to_page_of_sku_via_api(page, sku):
+    if cds_jump_to_page_of_sku_via_api(page, sku, prazo=prazo):
         row = cds_find_in_current_page_by_hidden_input(page, sku) or cds_find_in_current_page_by_codigo_base(page, sku)
         if row:
             print(f"[CDS] SKU {sku} encontrado via DataTables API (salto).")
@@ -620,10 +1751,10 @@ def cds_find_row(page, sku: str, timeout_each=20000):
     visited = 0
     while True:
         visited += 1
-        cds_wait_processing_off(page, 8000)
-        cds_wait_dt_ready(page, 15000)
-        cds_force_len_100(page)
-        cds_wait_rows(page, 15000)
+        cds_wait_processing_off(page, 8000, prazo=prazo)
+        cds_wait_dt_ready(page, 15000, prazo=prazo)
+        cds_force_len_100(page, prazo=prazo)
+        cds_wait_rows(page, 15000, prazo=prazo)
 
         row = cds_find_in_current_page_by_hidden_input(page, sku) or cds_find_in_current_page_by_codigo_base(page, sku)
         if row:
@@ -643,34 +1774,38 @@ def cds_find_row(page, sku: str, timeout_each=20000):
                 break
 
         page.wait_for_timeout(120)
-        cds_wait_processing_off(page, 8000)
+        cds_wait_processing_off(page, 8000, prazo=prazo)
 
     return None
 
-def atualizar_cds(page, sku: str, preco: float):
+def atualizar_cds(page, sku: str, preco: float, prazo=None):
     try:
         if is_page_closed(page):
             print(f"[CDS] Página fechada para SKU {sku}")
             return False
-        page.goto(CDS_URL + "relatorio-dos-produtos", wait_until="domcontentloaded", timeout=60000)
+        page.goto(CDS_URL + "relatorio-dos-produtos", wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
 
-        cds_consultar(page)
+        cds_consultar(page, prazo=prazo)
 
-        row = cds_find_row(page, sku, timeout_each=DEFAULT_TIMEOUT)
+        row = cds_find_row(page, sku, timeout_each=DEFAULT_TIMEOUT, prazo=prazo)
         if row is None:
             print(f"[CDS] SKU {sku} não encontrado após varrer as páginas.")
-            return False
+            return None  # como no Woo: o CDS respondeu, só não tem o SKU (não conta para o breaker)
 
         try:
-            row.scroll_into_view_if_needed(timeout=3000)
+            row.scroll_into_view_if_needed(timeout=t_ms(prazo, 3000))
+        except PrazoEsgotado:
+            raise
         except Exception:
             pass
 
+        renovar_prazo(page, prazo)
         btn_edit = row.locator("button.btn_edita_prod").first
         btn_edit.click()
 
-        page.wait_for_selector("#vendaPrc", state="visible", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_selector("#vendaPrc", state="visible", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
 
+        renovar_prazo(page, prazo)
         val = as_br_price(preco)
         print(f"[CDS] Preenchendo preço: {val} (valor original: {preco})")
         
@@ -695,65 +1830,73 @@ def atualizar_cds(page, sku: str, preco: float):
         btn_salvar = page.locator("#btn_salvar_produto")
         if btn_salvar.count() > 0:
             # Garante que o botão está visível e habilitado
-            btn_salvar.wait_for(state="visible", timeout=10000)
+            btn_salvar.wait_for(state="visible", timeout=t_ms(prazo, 10000))
             try:
                 # Rola até o botão se necessário
-                btn_salvar.scroll_into_view_if_needed(timeout=3000)
+                btn_salvar.scroll_into_view_if_needed(timeout=t_ms(prazo, 3000))
+            except PrazoEsgotado:
+                raise
             except:
                 pass
+            renovar_prazo(page, prazo)
             btn_salvar.click()
-            cds_wait_processing_off(page, 6000)
-            fechar_modal_cds(page)
+            cds_wait_processing_off(page, 6000, prazo=prazo)
+            fechar_modal_cds(page, prazo=prazo)
         else:
             # Fallback para outros botões de salvar
             for sel in ["button:has-text('Atualizar')", ".modal-footer button:has-text('Salvar')"]:
                 if page.locator(sel).count() > 0:
-                    page.locator(sel).first.wait_for(state="visible", timeout=10000)
+                    page.locator(sel).first.wait_for(state="visible", timeout=t_ms(prazo, 10000))
                     page.locator(sel).first.click()
-                    cds_wait_processing_off(page, 6000)
-                    fechar_modal_cds(page)
+                    cds_wait_processing_off(page, 6000, prazo=prazo)
+                    fechar_modal_cds(page, prazo=prazo)
                     break
 
         print(f"[CDS] SKU {sku} atualizado -> {val}")
         return True
 
     except Exception as e:
+        if isinstance(e, PrazoEsgotado) or prazo_vencido(prazo):
+            print(f"[CDS] ⚠️ {sku}: prazo esgotado")
+            return TIMEOUT_BUDGET
         print(f"[CDS] ❌ {sku}: {e}")
         return False
 
 # =======================
 # WP-Admin
 # =======================
-def wp_login(page):
+def wp_login(page, prazo=None):
     login_url = f"{WP_BASE_URL}/wp-login.php?redirect_to={urllib.parse.quote(WP_BASE_URL + '/wp-admin/')}"
-    page.goto(login_url, wait_until="domcontentloaded", timeout=60000)
+    page.goto(login_url, wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
     page.fill('input[name="log"]', WP_USER)
     page.fill('input[name="pwd"]', WP_PASS)
     try:
-        with page.expect_navigation(wait_until="domcontentloaded", timeout=60000):
+        with page.expect_navigation(wait_until="domcontentloaded", timeout=t_ms(prazo, 60000)):
             page.click('input[name="wp-submit"]')
     except Exception:
         pass
     try:
-        page.wait_for_url(re.compile(r".*/wp-admin/.*"), timeout=30000)
+        page.wait_for_url(re.compile(r".*/wp-admin/.*"), timeout=t_ms(prazo, 30000))
     except Exception:
-        page.wait_for_selector("#wpadminbar, body.wp-admin", timeout=30000)
+        page.wait_for_selector("#wpadminbar, body.wp-admin", timeout=t_ms(prazo, 30000))
     print("[WP] Login OK")
 
-def atualizar_woo(page, sku: str, preco: float):
+def atualizar_woo(page, sku: str, preco: float, prazo=None):
     try:
         if is_page_closed(page):
             print(f"[WP] Página fechada para SKU {sku}")
             return None
-        page.goto(f"{WP_BASE_URL}/wp-admin/edit.php?post_type=product", wait_until="domcontentloaded", timeout=60000)
+        page.goto(f"{WP_BASE_URL}/wp-admin/edit.php?post_type=product", wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
+        renovar_prazo(page, prazo)
         page.fill("#post-search-input", sku)
         page.click("#search-submit")
-        page.wait_for_selector("table.wp-list-table tbody", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_selector("table.wp-list-table tbody", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
 
         has_row = page.locator("table.wp-list-table tbody tr .row-title").count() > 0
         no_items = page.locator("table.wp-list-table tbody tr.no-items").count() > 0
 
         if (not has_row) or no_items:
+            wc = woo_cliente()
             if wc:
                 try:
                     r = wc.get("products", params={"sku": sku})
@@ -768,8 +1911,10 @@ def atualizar_woo(page, sku: str, preco: float):
                 print(f"[WP] SKU {sku} não encontrado — pulando Woo")
                 return None
 
+        renovar_prazo(page, prazo)
         page.locator("table.wp-list-table tbody tr .row-title").first.click()
-        page.wait_for_selector("#_regular_price, input[name='_regular_price']", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_selector("#_regular_price, input[name='_regular_price']", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
+        renovar_prazo(page, prazo)
 
         txt = f"{preco:.2f}".replace(".", ",")
         if page.locator("#_regular_price").count():
@@ -783,14 +1928,18 @@ def atualizar_woo(page, sku: str, preco: float):
             page.click("button.editor-post-publish-button")
 
         try:
-            page.wait_for_selector(".updated.notice-success, .notice-success, #message.updated", timeout=10000)
+            page.wait_for_selector(".updated.notice-success, .notice-success, #message.updated", timeout=t_ms(prazo, 10000))
         except Exception:
-            page.wait_for_load_state("networkidle", timeout=8000)
+            page.wait_for_load_state("networkidle", timeout=t_ms(prazo, 8000))
 
         print(f"[WP] SKU {sku} -> {txt}")
         return True
 
     except Exception as e:
+        if isinstance(e, PrazoEsgotado) or prazo_vencido(prazo):
+            print(f"[WP] ⚠️ {sku}: prazo esgotado")
+            return TIMEOUT_BUDGET
+        wc = woo_cliente()
         if wc:
             try:
                 r = wc.get("products", params={"sku": sku})
@@ -807,18 +1956,369 @@ def atualizar_woo(page, sku: str, preco: float):
         print(f"[WP] ❌ {sku}: {e}")
         return False
 
+def atualizar_woo_lote(page, escritas):
+    """Atualiza vários SKUs via REST em lote (products/batch); o que falhar cai no wp-admin"""
+    pendentes = dict(escritas)
+    resultados = {}
+    wc = woo_cliente()
+    if wc:
+        ids, consultados = {}, set()
+        for grupo in chunked(list(pendentes), 50):
+            try:
+                r = wc.get("products", params={"sku": ",".join(grupo), "per_page": 100})
+                for p in r.json():
+                    ids[(p.get("sku") or "").strip()] = p.get("id")
+                consultados.update(grupo)
+            except Exception as e:
+                print(f"[WP][REST] Erro ao consultar lote de SKUs: {e}")
+
+        for sku in consultados:
+            if sku not in ids:
+                print(f"[WP][REST] SKU {sku} não encontrado — pulando Woo")
+                resultados[sku] = None
+
+        for grupo in chunked([s for s in pendentes if s in ids], 100):
+            payload = {"update": [{"id": ids[s], "regular_price": f"{pendentes[s]:.2f}"} for s in grupo]}
+            try:
+                r = wc.post("products/batch", payload)
+                atualizados = {it.get("id") for it in r.json().get("update", []) if not it.get("error")}
+                for s in grupo:
+                    if ids[s] in atualizados:
+                        resultados[s] = True
+                print(f"[WP][REST] Lote: {len(atualizados)}/{len(grupo)} SKUs atualizados")
+            except Exception as e:
+                print(f"[WP][REST] Falha no lote: {e}")
+
+    for sku, preco in pendentes.items():
+        if sku not in resultados:
+            resultados[sku] = atualizar_woo(page, sku, preco)
+    return resultados
+
 # =======================
-# API Produtos
+# LOGINS (paralelos)
 # =======================
-def carregar_produtos():
-    url = "https://mlovi.com.br/sistemahortigold/endpoints/test_products.php"
+# Os logins dos sinks rodam ao mesmo tempo, cada um numa thread com Playwright e navegador
+# próprios (a API síncrona não cruza threads), enquanto esta thread abre a Tenda. Os cookies
+# de cada sessão vão para o contexto do lote; se a sessão não pegar, loga ali mesmo.
+# Os cookies de quem logou ficam guardados e são reaproveitados nos lotes seguintes.
+LOGINS_SITES = {  # site -> (login, página de entrada, seletor que denuncia a tela de login)
+    "cds":    (login_cds,    CDS_URL + "relatorio-dos-produtos",  "#btn-login, #usuariologin"),
+    "wp":     (wp_login,     f"{WP_BASE_URL}/wp-admin/",           "#loginform"),
+    "portal": (login_portal, PORTAL_URL + "dashboard.php",         "#username"),
+}
+
+_sessoes_login = {}  # site -> cookies da última sessão que funcionou
+
+def _login_isolado(site, resultados):
+    login, _, sel_login = LOGINS_SITES[site]
+    t0 = time.time()
     try:
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        if not data.get("success"):
-            print("[API] ❌ Resposta inválida:", data)
-            return []
+        with sync_playwright() as pw:
+            browser = lancar_navegador(pw)
+            try:
+                ctx = make_context_only(browser, com_cep=False)
+                page = nova_pagina(ctx, site)
+                login(page, prazo=criar_prazo(PRAZO_LOGIN_S))
+                if page.locator(sel_login).count():
+                    raise RuntimeError("continua na tela de login")
+                resultados[site] = {"ok": True, "cookies": ctx.cookies(), "ms": _ms(t0)}
+            finally:
+                fechar_navegador(browser)
+    except Exception as e:
+        resultados[site] = {"ok": False, "erro": str(e), "ms": _ms(t0)}
+
+def _adotar_sessao(ctx, page, site, r=None):
+    """Sessão do login isolado no contexto do lote (r=None: login direto na página)"""
+    login, entrada, sel_login = LOGINS_SITES[site]
+    prazo = criar_prazo(PRAZO_LOGIN_S)
+    if r is not None:
+        if not r.get("ok"):
+            return False
+        try:
+            ctx.add_cookies(r["cookies"])
+            page.goto(entrada, wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
+            if not page.locator(sel_login).count():
+                return True
+            print(f"[Login] {site}: sessão não pegou no contexto do lote — logando de novo")
+        except Exception as e:
+            print(f"[Login] {site}: erro ao adotar a sessão ({e}) — logando de novo")
+    try:
+        login(page, prazo=prazo)
+        return not page.locator(sel_login).count()
+    except Exception as e:
+        print(f"[Login] ❌ {site}: {e}")
+        return False
+
+def logar_sites(ctx, p_tenda, paginas, paralelo=None):
+    """Abre a Tenda (se p_tenda; falha = exceção) e loga os sinks; devolve {site: True/False}
+
+    Sessão guardada de um lote anterior é adotada direto; paralelo=False nunca abre
+    navegadores extras (usado ao recriar o contexto por falta de memória)."""
+    paralelo = LOGIN_PARALELO if paralelo is None else paralelo
+    t0 = time.time()
+    resultados = {site: {"ok": True, "cookies": _sessoes_login[site], "reaproveitada": True}
+                  for site in paginas if site in _sessoes_login}
+    threads = []
+    if paralelo:
+        for site in paginas:
+            if site in resultados:
+                continue
+            t = threading.Thread(target=_login_isolado, args=(site, resultados), name=f"login-{site}", daemon=True)
+            t.start()
+            threads.append(t)
+    try:
+        if p_tenda is not None:
+            print("[Login] Acessando Tenda...")
+            abrir_tenda(p_tenda, prazo=criar_prazo(PRAZO_LOGIN_S))
+    finally:
+        for t in threads:
+            t.join()
+    status = {}
+    for site, page in paginas.items():
+        r = resultados.get(site, {"ok": False, "erro": "sem resultado"} if paralelo else None)
+        status[site] = _adotar_sessao(ctx, page, site, r)
+        if status[site]:
+            _sessoes_login[site] = ctx.cookies([LOGINS_SITES[site][1]])
+        else:
+            _sessoes_login.pop(site, None)
+        detalhe = " (sessão reaproveitada)" if r and r.get("reaproveitada") else (f" ({r['ms']} ms)" if r and "ms" in r else "")
+        erro = f" — {r['erro']}" if r and r.get("erro") else ""
+        print(f"[Login] {site}: {'✅ OK' if status[site] else '❌ FALHOU'}{detalhe}{erro}")
+    log_step("Logins" + (" (paralelos)" if paralelo else ""), t0)
+    return status
+
+# =======================
+# PREFLIGHT (saúde dos seletores)
+# =======================
+# Logo após o login, cada site passa por suas checagens com um SKU de amostra, com teto
+# curto por checagem e um orçamento só para todos os sites. Checagem crítica que falha desliga o sink
+# (breaker "desligado"), em vez de cada SKU da noite estourar os timeouts.
+PREFLIGHT_SINK = {"cds": "cds", "wp": "woo", "portal": "portal"}  # site -> sink (Tenda não tem sink)
+
+def _checar(rel, nome, fn, critico=True):
+    try:
+        ok, detalhe = bool(fn()), ""
+    except Exception as e:
+        ok, detalhe = False, (str(e).strip().splitlines() or [type(e).__name__])[0][:120]
+    rel.append({"checagem": nome, "ok": ok, "critico": critico, "detalhe": detalhe})
+    return ok
+
+def _preflight_tenda(page, amostra, prazo):
+    rel = []
+    ms = lambda: t_ms(prazo, PREFLIGHT_MS)
+    if not _checar(rel, "busca", lambda: tenda_do_search(page, amostra["nome"], prazo=prazo) or True):
+        return rel
+    if not _checar(rel, "CARD_ANCHOR", lambda: page.wait_for_selector(CARD_ANCHOR, state="attached", timeout=ms())):
+        return rel
+    card = page.locator(CARD_ANCHOR).first
+    _checar(rel, "CARD_TITLE_SEL", lambda: card.locator(CARD_TITLE_SEL).count() > 0)
+    _checar(rel, "UNIT_PRICE_SEL", lambda: clean_price(card.locator(UNIT_PRICE_SEL).first.inner_text(timeout=ms())) is not None)
+    return rel
+
+def _preflight_cds(page, amostra, prazo):
+    rel = []
+    ms = lambda: t_ms(prazo, PREFLIGHT_MS)
+    if not _checar(rel, "relatório", lambda: page.goto(CDS_URL + "relatorio-dos-produtos",
+                                                         wait_until="domcontentloaded", timeout=ms() * 2) or True):
+        return rel
+    _checar(rel, "#tabela", lambda: page.wait_for_selector("#tabela", timeout=ms()))
+    _checar(rel, "consultar", lambda: cds_consultar(page, prazo=prazo) or True, critico=False)
+    if not _checar(rel, "DT_TABLE", lambda: cds_wait_dt_ready(page, PREFLIGHT_MS, prazo=prazo)):
+        return rel
+    _checar(rel, "DataTables API", lambda: page.evaluate(
+        "sel => !!(window.jQuery && jQuery.fn.dataTable && jQuery.fn.dataTable.isDataTable(jQuery(sel)))", DT_TABLE))
+    _checar(rel, "DT_FILTER_INPUT", lambda: page.locator(DT_FILTER_INPUT).count() > 0)
+    _checar(rel, "DT_LENGTH_SELECT", lambda: page.locator(DT_LENGTH_SELECT).count() > 0, critico=False)
+    if not _checar(rel, "busca do SKU", lambda: cds_search_apply(page, amostra["sku"], prazo=prazo) or True, critico=False):
+        return rel
+    row = cds_find_in_current_page_by_hidden_input(page, amostra["sku"]) \
+        or cds_find_in_current_page_by_codigo_base(page, amostra["sku"])
+    if not _checar(rel, f"linha do SKU {amostra['sku']}", lambda: row is not None, critico=False):
+        return rel
+    if _checar(rel, "button.btn_edita_prod", lambda: row.locator("button.btn_edita_prod").first.click(timeout=ms()) or True):
+        _checar(rel, "#vendaPrc", lambda: page.wait_for_selector("#vendaPrc", state="visible", timeout=ms()))
+        _checar(rel, "#btn_salvar_produto", lambda: page.locator("#btn_salvar_produto").count() > 0
+                or page.locator("button:has-text('Atualizar')").count() > 0)
+    return rel
+
+def _preflight_wp(page, amostra, prazo):
+    rel = []
+    ms = lambda: t_ms(prazo, PREFLIGHT_MS)
+    if not _checar(rel, "lista de produtos", lambda: page.goto(f"{WP_BASE_URL}/wp-admin/edit.php?post_type=product",
+                                                                 wait_until="domcontentloaded", timeout=ms() * 2) or True):
+        return rel
+    if not _checar(rel, "#post-search-input", lambda: page.fill("#post-search-input", amostra["sku"], timeout=ms()) or True):
+        return rel
+    if not _checar(rel, "#search-submit", lambda: page.click("#search-submit", timeout=ms()) or True):
+        return rel
+    if not _checar(rel, "table.wp-list-table", lambda: page.wait_for_selector("table.wp-list-table tbody", timeout=ms())):
+        return rel
+    titulo = page.locator("table.wp-list-table tbody tr .row-title")
+    if not _checar(rel, f"linha do SKU {amostra['sku']}", lambda: titulo.count() > 0, critico=False):
+        return rel
+    if not _checar(rel, "abrir produto", lambda: titulo.first.click(timeout=ms()) or True):
+        return rel
+    _checar(rel, "_regular_price", lambda: page.wait_for_selector("#_regular_price, input[name='_regular_price']", timeout=ms()))
+    _checar(rel, "botão publicar", lambda: page.locator("#publish, button.editor-post-publish-button").count() > 0)
+    return rel
+
+def _preflight_portal(page, amostra, prazo):
+    rel = []
+    ms = lambda: t_ms(prazo, PREFLIGHT_MS)
+    if not _checar(rel, "dashboard", lambda: abrir_portal(page, prazo=prazo) or True):
+        return rel
+    if not _checar(rel, "#filter-sku", lambda: page.fill("#filter-sku", amostra["sku"], timeout=ms()) or True):
+        return rel
+    if not _checar(rel, "Enter no filtro", lambda: page.press("#filter-sku", "Enter", timeout=ms()) or True):
+        return rel
+    linha = f"#products-table tr:has-text('{amostra['sku']}')"
+    if not _checar(rel, f"linha do SKU {amostra['sku']}", lambda: page.wait_for_selector(linha, timeout=ms()), critico=False):
+        _checar(rel, "#products-table", lambda: page.locator("#products-table").count() > 0)
+        return rel
+    if _checar(rel, "botão editar", lambda: page.locator(linha).first.locator("button:has(i.fas.fa-edit)").click(timeout=ms()) or True):
+        _checar(rel, "#edit-preco", lambda: page.wait_for_selector("#edit-preco", state="visible", timeout=ms()))
+        _checar(rel, "botão Salvar", lambda: page.locator(".modal-footer button:has-text('Salvar')").count() > 0)
+        try:
+            page.keyboard.press("Escape")
+            abrir_portal(page, prazo=prazo)
+        except Exception:
+            pass
+    return rel
+
+PREFLIGHTS = {"tenda": _preflight_tenda, "cds": _preflight_cds, "wp": _preflight_wp, "portal": _preflight_portal}
+
+def preflight_site(site, page, amostra, prazo=None):
+    """Roda as checagens do site; True se nenhuma crítica falhou (desliga o sink se falhou)"""
+    t0 = time.time()
+    prazo = prazo or criar_prazo(PRAZO_PREFLIGHT_S)
+    try:
+        with prazo_na_pagina(page, prazo):
+            rel = PREFLIGHTS[site](page, amostra, prazo)
+    except Exception as e:
+        rel = [{"checagem": "preflight", "ok": False, "critico": True, "detalhe": str(e)[:120]}]
+    falhas = [c for c in rel if not c["ok"] and c["critico"]]
+    avisos = [c for c in rel if not c["ok"] and not c["critico"]]
+    print(f"[Preflight] {site}: {'✅ OK' if not falhas else '❌ FALHOU'} "
+          f"({sum(c['ok'] for c in rel)}/{len(rel)} checagens, {_ms(t0)} ms)")
+    for c in falhas + avisos:
+        print(f"[Preflight]   {'❌' if c['critico'] else '⚠️'} {c['checagem']}: {c['detalhe'] or 'não encontrado'}")
+    if falhas and site in PREFLIGHT_SINK:
+        breaker_desligar(PREFLIGHT_SINK[site], "preflight: " + ", ".join(c["checagem"] for c in falhas))
+    return not falhas
+
+def preflight_cli():
+    """Só login + preflight de todos os sites (sem processar o catálogo)"""
+    produtos = carregar_produtos()
+    amostra = produtos[0] if produtos else {"sku": PREFLIGHT_SKU or "", "nome": ""}
+    with sync_playwright() as pw:
+        browser = lancar_navegador(pw)
+        try:
+            ctx = make_context_only(browser)
+            return preflight(dict(zip(PAGINAS_SITES, open_and_login_all(ctx))), amostra)
+        finally:
+            fechar_navegador(browser)
+
+def preflight(paginas, amostra):
+    """{site: ok} para as páginas logadas (None = login já falhou, fica de fora)"""
+    if PREFLIGHT_SKU:
+        amostra = dict(amostra, sku=PREFLIGHT_SKU)
+    t0 = time.time()
+    print(f"[Preflight] SKU de amostra: {amostra['sku']} | {amostra['nome']}")
+    prazo, res = criar_prazo(PRAZO_PREFLIGHT_S), {}
+    for site, page in paginas.items():
+        if page is None:
+            continue
+        if prazo_vencido(prazo):
+            print(f"[Preflight] ⚠️ {site}: orçamento de {PRAZO_PREFLIGHT_S:.0f}s esgotado — não checado")
+            continue
+        res[site] = preflight_site(site, page, amostra, prazo)
+    log_step("Preflight", t0)
+    return res
+
+# ====== BENCH DE INICIALIZAÇÃO ======
+# Custo de cada perfil de PERFIS_NAVEGADOR: lançamento a frio, primeiro goto em cada site
+# e memória (RSS do Chromium). Serve para escolher o NAVEGADOR_PERFIL mais barato que funciona.
+def bench_startup(perfis=None, repeticoes=3):
+    """{perfil: {launch_ms, goto_ms por site, mem_mb, falhas}} (medianas das repetições)"""
+    import statistics
+    perfis = [p for p in (perfis or PERFIS_NAVEGADOR) if p in PERFIS_NAVEGADOR]
+    sites = {"tenda": TENDA_URL, **{s: url for s, (_, url, _) in LOGINS_SITES.items()}}
+    res = {}
+    with sync_playwright() as pw:
+        base_mb = rss_processos_mb(proprio=False)  # o driver do Playwright já está de pé
+        for perfil in perfis:
+            amostras = []
+            for _ in range(repeticoes):
+                t0 = time.perf_counter()
+                try:
+                    browser = lancar_navegador(pw, perfil)
+                except Exception as e:
+                    print(f"[Bench] ❌ {perfil}: não lançou ({e})")
+                    break
+                a = {"launch_ms": (time.perf_counter() - t0) * 1000, "goto_ms": {}, "falhas": set()}
+                try:
+                    ctx = browser.new_context(locale="pt-BR", viewport={"width": 1280, "height": 900})
+                    for site, url in sites.items():
+                        page = ctx.new_page()
+                        t0 = time.perf_counter()
+                        try:
+                            resp = page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                            if resp is not None and resp.status >= 400:
+                                raise RuntimeError(f"HTTP {resp.status}")
+                            a["goto_ms"][site] = (time.perf_counter() - t0) * 1000
+                        except Exception as e:
+                            a["falhas"].add(site)
+                            print(f"[Bench] ⚠️ {perfil}/{site}: {e}")
+                        finally:
+                            page.close()
+                    mem = rss_processos_mb(proprio=False)
+                    a["mem_mb"] = None if mem is None or base_mb is None else mem - base_mb
+                finally:
+                    browser.close()
+                amostras.append(a)
+            if not amostras:
+                res[perfil] = None
+                continue
+            mems = [a["mem_mb"] for a in amostras if a["mem_mb"] is not None]
+            res[perfil] = {
+                "launch_ms": statistics.median(a["launch_ms"] for a in amostras),
+                "goto_ms": {s: statistics.median(a["goto_ms"][s] for a in amostras if s in a["goto_ms"])
+                            for s in sites if any(s in a["goto_ms"] for a in amostras)},
+                "mem_mb": statistics.median(mems) if mems else None,
+                "falhas": sorted(set().union(*(a["falhas"] for a in amostras))),
+            }
+
+    print(f"[Bench] Inicialização por perfil ({repeticoes} repetições, medianas em ms):")
+    print(f"  {'perfil':<15} {'launch':>8} " + " ".join(f"{s:>8}" for s in sites) + f" {'mem MB':>8}  falhas")
+    for perfil, r in res.items():
+        if r is None:
+            print(f"  {perfil:<15} {'não lançou':>8}")
+            continue
+        gotos = " ".join(f"{r['goto_ms'][s]:8.0f}" if s in r["goto_ms"] else f"{'-':>8}" for s in sites)
+        mem = f"{r['mem_mb']:8.0f}" if r["mem_mb"] is not None else f"{'-':>8}"
+        print(f"  {perfil:<15} {r['launch_ms']:8.0f} {gotos} {mem}  {', '.join(r['falhas']) or '-'}")
+    return res
+
+# =======================
+# API Produtos
+# =======================
+def carregar_produtos(url=None):
+    import requests
+    url = url or PRODUTOS_URL
+    try:
+        if HAR_MODO == "replay":
+            with open(_har["pasta"] / "produtos.json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            resp = requests.get(url, timeout=15)
+            resp.raise_for_status()
+            data = resp.json()
+            if HAR_MODO == "gravar":
+                with open(_har["pasta"] / "produtos.json", "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+        if not data.get("success"):
+            print("[API] ❌ Resposta inválida:", data)
+            return []
         products = []
         for prod in data.get("products", []):
             sku = (prod.get("sku") or "").strip()
@@ -1040,9 +2540,55 @@ def ensure_cep(page, cep):
         except:
             pass
 
-def tenda_do_search(page, query: str):
+def tenda_estado_path(cep):
+    return LOG_DIR / f"tenda_estado_{re.sub(r'[^0-9]', '', cep)}.json"
+
+def salvar_estado_tenda(ctx, cep):
+    """Guarda só os cookies/localStorage da Tenda depois que o CEP foi escolhido"""
+    try:
+        st = ctx.storage_state()
+        dominio = _host_base(TENDA_URL)
+        estado = {
+            "cookies": [c for c in st.get("cookies", []) if c.get("domain", "").lstrip(".").endswith(dominio)],
+            "origins": [o for o in st.get("origins", []) if dominio in o.get("origin", "")],
+        }
+        caminho = tenda_estado_path(cep)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False, indent=2)
+        print(f"[Tenda] Estado do CEP salvo em {caminho}")
+    except Exception as e:
+        print(f"[Tenda] ⚠️ Erro ao salvar estado do CEP: {e}")
+
+def tenda_cep_ok(page, cep) -> bool:
+    """Checagem única e barata: sem modal de CEP aberto e CEP presente em cookie/localStorage"""
+    digits = re.sub(r"\D", "", cep)
+    try:
+        r = page.evaluate("""
+            (digits) => {
+              const modal = document.querySelector('#modal-shipping.show, .ShippingModalContainer.medium .ModalDefault.show');
+              const aberto = !!(modal && modal.offsetParent !== null);
+              let salvo = false;
+              try {
+                for (let i = 0; i < localStorage.length && !salvo; i++) {
+                  salvo = (localStorage.getItem(localStorage.key(i)) || '').replace(/\\D/g, '').includes(digits);
+                }
+              } catch (e) {}
+              return {aberto, salvo};
+            }
+        """, digits)
+        if r.get("aberto"):
+            return False
+        if r.get("salvo"):
+            return True
+        cookies = page.context.cookies(TENDA_URL)
+        return any(digits in re.sub(r"\D", "", urllib.parse.unquote(c.get("value", ""))) for c in cookies)
+    except Exception:
+        return False
+
+def tenda_do_search(page, query: str, prazo=None):
     q_enc = urllib.parse.quote(query)
-    page.goto(f"{TENDA_URL}/busca?q={q_enc}", wait_until="domcontentloaded", timeout=60000)
+    page.goto(f"{TENDA_URL}/busca?q={q_enc}", wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
 
 def tenda_has_zero_results(page) -> bool:
     try:
@@ -1059,22 +2605,409 @@ def tenda_has_zero_results(page) -> bool:
         pass
     return False
 
-def buscar_preco_tenda(page, query: str):
+def tenda_ler_cards(page, limite=12):
+    """Título/preço/URL dos cards do mosaico numa única ida ao DOM"""
+    brutos = page.locator(CARD_ANCHOR).evaluate_all("""
+        (els, [lim, tSel, pSel]) => els.slice(0, lim).map(a => ({
+          titulo: ((a.querySelector(tSel) || {}).innerText || '').trim(),
+          preco:  ((a.querySelector(pSel) || {}).innerText || '').trim(),
+          url:    a.href || ''
+        }))
+    """, [limite, CARD_TITLE_SEL, UNIT_PRICE_SEL])
+    return [{"titulo": c["titulo"], "preco": clean_price(c["preco"]), "url": c["url"]} for c in brutos]
+
+# ====== PARSER HTML (sem renderizar) ======
+# Os cards vêm renderizados no servidor: título/preço/URL saem do HTML cru com um parser
+# em C, sem esperar o DOM nem ir ao navegador. Mesmo formato de tenda_ler_cards().
+_parsers_html = None
+
+def parsers_html():
+    """{nome: parser} dos parsers instalados (selectolax > lxml), importados na primeira chamada"""
+    global _parsers_html
+    if _parsers_html is None:
+        _parsers_html = {}
+        try:
+            from selectolax.lexbor import LexborHTMLParser as _sx
+        except ImportError:
+            try:
+                from selectolax.parser import HTMLParser as _sx
+            except ImportError:
+                _sx = None
+        if _sx:
+            _parsers_html["selectolax"] = _sx
+        try:
+            import lxml.html
+            _parsers_html["lxml"] = lxml.html
+        except ImportError:
+            pass
+    return _parsers_html
+
+def parser_html_padrao():
+    return next(iter(parsers_html()), None)
+
+def _classe_xpath(tag, classe):
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {classe} ')]"
+
+XP_CARD   = "//" + _classe_xpath("a", "showcase-card-content")
+XP_TITULO = ".//" + _classe_xpath("h3", "TitleCardComponent")
+XP_PRECO  = ".//" + _classe_xpath("*", "SimplePriceComponent")
+XP_ZERO     = "//" + _classe_xpath("*", "SearchContainer") + "//" + _classe_xpath("h1", "area-result") + "//strong"
+XP_NOTFOUND = "//" + _classe_xpath("*", "mosaic-container") + "[contains(concat(' ', normalize-space(@class), ' '), ' notFound ')]"
+XP_VAZIO    = "//" + _classe_xpath("*", "EmptyAreaComponent") + "//" + _classe_xpath("*", "title")
+
+def _texto(t):
+    return " ".join((t or "").split())
+
+def tenda_cards_html(html, base_url=TENDA_URL, limite=12, parser=None):
+    """Cards do HTML cru ([] se não houver); None sem parser disponível"""
+    parser = parser or parser_html_padrao()
+    impl = parsers_html().get(parser)
+    brutos = []
+    if impl is None:
+        return None
+    if parser == "selectolax":
+        for a in impl(html).css(CARD_ANCHOR)[:limite]:
+            t, p = a.css_first(CARD_TITLE_SEL), a.css_first(UNIT_PRICE_SEL)
+            brutos.append((t.text() if t else "", p.text() if p else "", a.attributes.get("href") or ""))
+    elif parser == "lxml":
+        for a in impl.fromstring(html).xpath(XP_CARD)[:limite]:
+            t, p = a.xpath(XP_TITULO), a.xpath(XP_PRECO)
+            brutos.append((t[0].text_content() if t else "", p[0].text_content() if p else "", a.get("href") or ""))
+    return [{"titulo": _texto(t), "preco": clean_price(_texto(p)),
+             "url": urllib.parse.urljoin(base_url, u) if u else ""} for t, p, u in brutos]
+
+def tenda_html_sem_resultados(html, parser=None):
+    """Mesmas condições de tenda_has_zero_results, aplicadas ao HTML cru"""
+    parser = parser or parser_html_padrao()
+    impl = parsers_html().get(parser)
+    if impl is None or not html:
+        return False
+    if parser == "selectolax":
+        arvore = impl(html)
+        contador = arvore.css_first(".SearchContainer h1.area-result strong")
+        zero = contador is not None and _texto(contador.text()) == "0"
+        nao_encontrado = arvore.css_first(".mosaic-container.notFound") is not None
+        vazio = any("Não existem produtos" in n.text() for n in arvore.css(".EmptyAreaComponent .title"))
+    else:
+        arvore = impl.fromstring(html)
+        contador = arvore.xpath(XP_ZERO)
+        zero = bool(contador) and _texto(contador[0].text_content()) == "0"
+        nao_encontrado = bool(arvore.xpath(XP_NOTFOUND))
+        vazio = any("Não existem produtos" in n.text_content() for n in arvore.xpath(XP_VAZIO))
+    return zero or nao_encontrado or vazio
+
+_tenda_sessoes = {}           # cep -> (cookies de origem, requests.Session)
+_tenda_html_sem_regiao = set()  # CEPs cujo HTML cru não mostrou a região: só navegador
+_tenda_sessoes_lock = threading.Lock()
+
+def tenda_sessao_http(page, cep):
+    """requests.Session com os cookies do contexto da Tenda, uma por CEP (refeita quando os cookies mudam)"""
+    import requests
+    cookies = page.context.cookies(TENDA_URL)
+    chave = tuple(sorted((c["name"], c["value"]) for c in cookies))
+    with _tenda_sessoes_lock:
+        if cep not in _tenda_sessoes or _tenda_sessoes[cep][0] != chave:
+            sessao = requests.Session()
+            sessao.headers["User-Agent"] = page.evaluate("navigator.userAgent")
+            sessao.headers["Accept-Language"] = "pt-BR,pt;q=0.9"
+            for c in cookies:
+                sessao.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+            _tenda_sessoes[cep] = (chave, sessao)
+        return _tenda_sessoes[cep][1]
+
+def tenda_html_regiao_ok(html, cep):
+    """O HTML cru mostra o CEP esperado? (o CEP só no localStorage não chega ao servidor)"""
+    d = re.sub(r"\D", "", cep or "")
+    return bool(d) and re.search(rf"(?<!\d){d[:5]}-?{d[5:]}(?!\d)", html or "") is not None
+
+def salvar_corpus_tenda(query, html):
+    if not TENDA_SALVAR_CORPUS or not html:
+        return
+    try:
+        CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+        nome = (normalizar_query(query) or "vazio").replace(" ", "_")[:80]
+        (CORPUS_DIR / f"{nome}.html").write_text(html, encoding="utf-8")
+    except Exception as e:
+        print(f"[Tenda] ⚠️ Erro ao salvar corpus: {e}")
+
+def buscar_cards_tenda_http(page, query: str, limite=12, prazo=None, cep=None):
+    """Busca só por HTTP + parser; None = o HTML não serviu, usar o navegador"""
+    cep = cep or CEP_VALOR
+    if USE_CEP and cep in _tenda_html_sem_regiao:
+        return None
+    try:
+        url = f"{TENDA_URL}/busca?q={urllib.parse.quote(query)}"
+        r = tenda_sessao_http(page, cep).get(url, timeout=t_ms(prazo, 15000) / 1000.0)
+        if r.status_code != 200:
+            return None
+        if USE_CEP and not tenda_html_regiao_ok(r.text, cep):
+            print(f"[Tenda][HTML] ⚠️ HTML sem o CEP {cep} (loja padrão?) — só navegador para este CEP")
+            with _tenda_sessoes_lock:
+                _tenda_html_sem_regiao.add(cep)
+            return None
+        salvar_corpus_tenda(query, r.text)
+        cards = tenda_cards_html(r.text, r.url or url, limite)
+        if cards:
+            print(f"[Tenda][HTML] {len(cards)} cards lidos sem renderizar ({parser_html_padrao()})")
+            return cards
+        if cards is not None and tenda_html_sem_resultados(r.text):
+            print(f"[Tenda][HTML] 0 resultados para \"{query.strip()}\" — pulando SKU.")
+            return []
+    except PrazoEsgotado:
+        raise
+    except Exception as e:
+        print(f"[Tenda][HTML] Caminho rápido falhou ({e}) — usando o navegador")
+    return None
+
+def bench_parser(diretorio=None, repeticoes=20, limite=60):
+    """Micro-benchmark: parser(es) HTML vs locator (set_content + evaluate_all) sobre o corpus"""
+    pasta = Path(diretorio) if diretorio else CORPUS_DIR
+    arquivos = sorted(pasta.glob("*.html"))
+    if not arquivos:
+        print(f"[Bench] Nenhuma página em {pasta} (rode com TENDA_SALVAR_CORPUS=1 para montar o corpus)")
+        return {}
+    paginas = [(a.name, a.read_text(encoding="utf-8")) for a in arquivos]
+    parsers = list(parsers_html())
+    tempos = {}
+    for p in parsers:
+        t0 = time.perf_counter()
+        for _ in range(repeticoes):
+            for _, html in paginas:
+                tenda_cards_html(html, limite=limite, parser=p)
+        tempos[p] = (time.perf_counter() - t0) * 1000 / (repeticoes * len(paginas))
+
+    divergentes = 0
+    with sync_playwright() as pw:
+        browser = lancar_navegador(pw)
+        try:
+            page = browser.new_page()
+            page.route("**/*", lambda route: route.abort())  # só o HTML do corpus, sem rede
+            t_total = 0.0
+            for nome, html in paginas:
+                page.set_content(html, wait_until="domcontentloaded")
+                t0 = time.perf_counter()
+                for _ in range(repeticoes):
+                    via_dom = tenda_ler_cards(page, limite)
+                t_total += time.perf_counter() - t0
+                via_html = tenda_cards_html(html, page.url, limite)
+                if via_html is not None and [(c["titulo"], c["preco"]) for c in via_html] != \
+                        [(c["titulo"], c["preco"]) for c in via_dom]:
+                    divergentes += 1
+                    print(f"[Bench] ⚠️ {nome}: parser e locator divergem")
+            tempos["locator"] = t_total * 1000 / (repeticoes * len(paginas))
+        finally:
+            browser.close()
+
+    print(f"[Bench] {len(paginas)} páginas x {repeticoes} repetições (ms por página):")
+    for nome, ms in sorted(tempos.items(), key=lambda kv: kv[1]):
+        print(f"  {nome:<10} {ms:8.3f}")
+    if divergentes:
+        print(f"[Bench] ⚠️ {divergentes} página(s) com resultados diferentes")
+    return tempos
+
+# ====== CAPTURA DO JSON DA BUSCA (XHR/fetch) ======
+# O mosaico é preenchido por chamadas à API da Tenda: guardamos essas respostas e lemos
+# nome/preço estruturados assim que chegam, sem esperar renderizar nem parsear texto.
+def _campos_env(nome, padrao):
+    return tuple(c.strip() for c in os.getenv(nome, padrao).split(",") if c.strip())
+
+# O preço tem que ser o mesmo unitário que UNIT_PRICE_SEL mostra (não atacado, lista ou centavos);
+# as primeiras buscas conferem isso contra o DOM (tenda_api_validar).
+API_CAMPOS_NOME  = _campos_env("TENDA_API_CAMPO_NOME", "name,nome,title,titulo,productName,displayName")
+API_CAMPOS_PRECO = _campos_env("TENDA_API_CAMPO_PRECO", "unitPrice,precoUnitario,sellingPrice,salePrice,bestPrice,price,preco,valor")
+API_CAMPOS_URL   = _campos_env("TENDA_API_CAMPO_URL", "url,link,href,slug,linkText")
+API_PARAMS_BUSCA = ("q", "query", "term", "busca", "ft")
+_tenda_api_stats = {"buscas": 0, "com_json": 0, "validadas": 0, "desligado": False}
+_tenda_api_lock = threading.Lock()  # multi-CEP: uma thread por CEP
+
+def _preco_api(v):
+    if isinstance(v, bool) or v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return round(float(v), 2) if v > 0 else None
+    if isinstance(v, str):
+        return clean_price(v)
+    if isinstance(v, dict):
+        for k in ("value", "valor", "amount", "price", "preco"):
+            if k in v:
+                return _preco_api(v[k])
+    return None
+
+def _produto_api(d):
+    nome = next((d[k] for k in API_CAMPOS_NOME if isinstance(d.get(k), str) and d[k].strip()), None)
+    if not nome:
+        return None
+    preco = next((p for p in (_preco_api(d.get(k)) for k in API_CAMPOS_PRECO if k in d) if p is not None), None)
+    if preco is None:
+        return None
+    url = next((d[k] for k in API_CAMPOS_URL if isinstance(d.get(k), str) and d[k]), "")
+    return {"titulo": " ".join(nome.split()), "preco": preco, "url": urllib.parse.urljoin(TENDA_URL + "/", url) if url else ""}
+
+def _lista_api(dados):
+    """Lista de produtos no primeiro caminho de TENDA_API_LISTA presente no JSON"""
+    for caminho in TENDA_API_LISTA:
+        atual = dados
+        for chave in caminho.split("."):
+            atual = atual.get(chave) if isinstance(atual, dict) else None
+        if isinstance(atual, list):
+            return atual
+    return None
+
+def cards_json_api(dados, limite=12):
+    """Produtos (nome + preço) da lista de produtos da resposta, na ordem em que aparecem"""
+    cards = []
+    for item in _lista_api(dados) or []:
+        card = _produto_api(item) if isinstance(item, dict) else None
+        if card:
+            cards.append(card)
+            if len(cards) >= limite:
+                break
+    return cards
+
+def _termo_api(resp):
+    """Termo buscado pela chamada (parâmetro q/query/... da URL ou do corpo JSON)"""
+    params = urllib.parse.parse_qs(urllib.parse.urlsplit(resp.url).query)
+    for k in API_PARAMS_BUSCA:
+        if params.get(k):
+            return params[k][0]
+    try:
+        corpo = json.loads(resp.request.post_data or "null")
+    except Exception:
+        corpo = None
+    if isinstance(corpo, dict):
+        for k in API_PARAMS_BUSCA:
+            if isinstance(corpo.get(k), str):
+                return corpo[k]
+    return None
+
+def _mesmo_termo(a, b):
+    return " ".join((a or "").lower().split()) == " ".join((b or "").lower().split())
+
+def captura_api_tenda(page):
+    """Instala (uma vez por página) o coletor das respostas JSON da API de busca"""
+    cap = getattr(page, "_captura_api", None)
+    if cap is None:
+        cap = {"respostas": []}
+        def _on_response(resp):
+            try:
+                if resp.request.resource_type not in ("xhr", "fetch") or not TENDA_API_PADRAO.search(resp.url):
+                    return
+                if "json" not in (resp.headers.get("content-type") or ""):
+                    return
+                cap["respostas"].append((_termo_api(resp), resp.json()))
+            except Exception:
+                pass
+        page.on("response", _on_response)
+        page._captura_api = cap
+    return cap
+
+def tenda_cards_api(page, cap, query, limite=12, prazo=None):
+    """Cards do JSON da busca atual; espera até TENDA_API_ESPERA_MS ou até o mosaico aparecer no DOM"""
+    with _tenda_api_lock:
+        if _tenda_api_stats["desligado"]:
+            return None
+        _tenda_api_stats["buscas"] += 1
+        # Sem nenhum JSON útil nas primeiras buscas, a API não casa o padrão: para de esperar por ela
+        espera_ms = TENDA_API_ESPERA_MS if _tenda_api_stats["com_json"] or _tenda_api_stats["buscas"] <= 5 else 0
+    fim = time.monotonic() + espera_ms / 1000.0
+    while True:
+        for termo, dados in cap["respostas"]:
+            if not _mesmo_termo(termo, query):
+                continue  # resposta de outra busca (ou sem termo): não serve para este SKU
+            cards = cards_json_api(dados, limite)
+            if cards:
+                with _tenda_api_lock:
+                    _tenda_api_stats["com_json"] += 1
+                print(f"[Tenda][API] {len(cards)} produtos lidos do JSON da busca")
+                return cards
+        if time.monotonic() >= fim or prazo_vencido(prazo) or page.locator(CARD_ANCHOR).count():
+            return None
+        page.wait_for_timeout(100)
+
+def tenda_api_em_validacao():
+    return _tenda_api_stats["validadas"] < TENDA_API_VALIDAR
+
+def tenda_api_validar(api, dom):
+    """Confere os cards do JSON com os do DOM (título igual = mesmo preço); divergiu, desliga o JSON"""
+    por_titulo = {normalizar_query(c["titulo"]): c["preco"] for c in api}
+    comuns = [(c, por_titulo[normalizar_query(c["titulo"])]) for c in dom[:5]
+              if normalizar_query(c["titulo"]) in por_titulo and c["preco"] is not None]
+    divergentes = [(c["titulo"], p, c["preco"]) for c, p in comuns if p is None or abs(p - c["preco"]) >= 0.005]
+    with _tenda_api_lock:
+        if comuns and not divergentes:
+            _tenda_api_stats["validadas"] += 1
+            return True
+        _tenda_api_stats["desligado"] = True
+    if divergentes:
+        titulo, p_api, p_dom = divergentes[0]
+        print(f"[Tenda][API] ⚠️ JSON diverge do DOM (\"{titulo}\": {p_api} x {p_dom}) — leitura do JSON desligada")
+    else:
+        print("[Tenda][API] ⚠️ Nenhum card do JSON bate com o DOM — leitura do JSON desligada")
+    return False
+
+def escolher_preco_cards(cards, query: str):
+    q_tokens = [t for t in re.findall(r"[a-z0-9]+", query.lower()) if len(t) > 1]
+    best_score, best_price = -1.0, None
+
+    lim = min(12, len(cards))
+    for i in range(lim):
+        name = (cards[i]["titulo"] or "").lower()
+        unit_price = cards[i]["preco"]
+        if unit_price is None:
+            continue
+
+        score = (sum(1 for t in q_tokens if t in name) / max(1, len(q_tokens))) if name else 0.0
+        if score > best_score:
+            best_score, best_price = score, unit_price
+
+        if i == 0 and best_price is not None and score >= 0.6:
+            break
+
+    if best_price is not None:
+        print(f"[Tenda][Resultados] preço unitário = {best_price}")
+        return best_price
+
+    for c in cards[:lim]:
+        if c["preco"] is not None:
+            print(f"[Tenda][Resultados][fallback] preço unitário = {c['preco']}")
+            return c["preco"]
+
+    print("[Tenda] Não foi possível extrair preço unitário.")
+    return None
+
+def buscar_cards_tenda(page, query: str, limite=12, prazo=None, cep=None):
+    """Faz a busca e devolve os cards da página de resultados ([] se não houver, None se falhar)"""
+    cep = cep or CEP_VALOR
     try:
         if is_page_closed(page):
             print("[Tenda] Página fechada")
             return None
+        if TENDA_HTML_RAPIDO and not HAR_MODO and parser_html_padrao():
+            cards = buscar_cards_tenda_http(page, query, limite, prazo, cep)
+            if cards is not None:
+                return cards
         if TENDA_URL not in page.url:
-            page.goto(TENDA_URL, wait_until="domcontentloaded", timeout=60000)
+            page.goto(TENDA_URL, wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
             page.wait_for_timeout(500)
-        if USE_CEP:
-            ensure_cep(page, CEP_VALOR)
-            nuke_overlays(page)
 
-        tenda_do_search(page, query)
-        if USE_CEP:
-            ensure_cep(page, CEP_VALOR)
+        cap = captura_api_tenda(page) if TENDA_API_JSON and not _tenda_api_stats["desligado"] else None
+        if cap:
+            cap["respostas"].clear()
+        tenda_do_search(page, query, prazo=prazo)
+        renovar_prazo(page, prazo)
+        if USE_CEP and not tenda_cep_ok(page, cep):
+            print("[Tenda] CEP não confirmado — tratando modal...")
+            if cap:
+                cap["respostas"].clear()  # o que veio antes do CEP é de outra loja
+            ensure_cep(page, cep)
             nuke_overlays(page)
+            if tenda_cep_ok(page, cep):
+                salvar_estado_tenda(page.context, cep)
+
+        renovar_prazo(page, prazo)
+        cards_api = tenda_cards_api(page, cap, query, limite, prazo) if cap else None
+        if cards_api and not tenda_api_em_validacao():
+            return cards_api
 
         page.wait_for_function("""
             () => {
@@ -1084,71 +3017,1580 @@ def buscar_preco_tenda(page, query: str):
               const zero = counter && (counter.textContent||'').trim() === '0';
               return hasCards || notFound || zero;
             }
-        """, timeout=DEFAULT_TIMEOUT)
+        """, timeout=t_ms(prazo, DEFAULT_TIMEOUT))
 
         if tenda_has_zero_results(page):
+            if cards_api:
+                tenda_api_validar(cards_api, [])
             termo = query.strip()
             print(f"[Tenda] 0 resultados para \"{termo}\" — pulando SKU.")
-            return None
+            return []
 
         try:
-            page.wait_for_selector(CARD_ANCHOR, state="attached", timeout=DEFAULT_TIMEOUT)
+            page.wait_for_selector(CARD_ANCHOR, state="attached", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
         except Exception:
-            page.wait_for_load_state("networkidle", timeout=DEFAULT_TIMEOUT)
+            page.wait_for_load_state("networkidle", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
 
-        cards = page.locator(CARD_ANCHOR)
-        count = cards.count()
-        if count == 0:
+        renovar_prazo(page, prazo)
+        cards = tenda_ler_cards(page, limite)
+        if cards_api and cards:
+            tenda_api_validar(cards_api, cards)
+        if TENDA_SALVAR_CORPUS:
+            salvar_corpus_tenda(query, page.content())
+        if not cards:
             print("[Tenda] Nenhum card encontrado (não é tela de 0 resultados, mas não há cards).")
-            return None
+        return cards
 
-        q_tokens = [t for t in re.findall(r"[a-z0-9]+", query.lower()) if len(t) > 1]
-        best_score, best_price = -1.0, None
+    except Exception as e:
+        print(f"[Tenda] ❌ Erro na busca: {e}")
+        return None
 
-        lim = min(12, count)
-        for i in range(lim):
-            card = cards.nth(i)
-            try:
-                name = card.locator(CARD_TITLE_SEL).first.inner_text().strip().lower()
-            except Exception:
-                name = ""
+def buscar_preco_tenda(page, query: str, prazo=None, cep=None):
+    cards = buscar_cards_tenda(page, query, prazo=prazo, cep=cep)
+    return escolher_preco_cards(cards, query) if cards else None
+
+# ====== VÁRIOS SKUs POR PÁGINA DE RESULTADOS ======
+# Uma busca genérica ("tomate") traz as variações que vendemos; em vez de descartar os
+# outros cards, casamos todos contra o catálogo e guardamos quem bater com confiança.
+# Esse preço só vale se a busca do próprio SKU não achar nada: "Molho de Tomate" numa
+# página qualquer nunca substitui a busca por "tomate".
+PALAVRAS_VAZIAS = {"de", "da", "do", "das", "dos", "com", "sem", "em", "para", "tipo"}
+UNIDADES = {"kg": ("g", 1000), "g": ("g", 1), "gr": ("g", 1), "ml": ("ml", 1), "l": ("ml", 1000),
+            "lt": ("ml", 1000), "un": ("un", 1), "und": ("un", 1), "unid": ("un", 1)}
+RE_MEDIDA = re.compile(r"(\d+(?:[.,]\d+)?)\s*(kg|gr|g|ml|lt|l|unid|und|un)\b")
+
+_multi_fallback = {}   # (cep, query canônica) -> preço visto no card de outra busca
+_multi_lock = threading.Lock()
+
+def _tokens(texto):
+    return set(t for t in normalizar_query(texto).split() if len(t) > 1)
+
+def _tokens_nucleo(texto):
+    """Tokens que identificam o produto (sem preposições, números e unidades)"""
+    return {t for t in _tokens(texto)
+            if t not in PALAVRAS_VAZIAS and t not in UNIDADES and not re.fullmatch(r"\d+[a-z]{0,4}", t)}
+
+def _medidas(texto):
+    res = set()
+    for n, u in RE_MEDIDA.findall((texto or "").lower()):
+        base, fator = UNIDADES[u]
+        res.add((base, round(float(n.replace(",", ".")) * fator, 3)))
+    return res
+
+def _confianca_card(nome, titulo, minimo):
+    """(fração do nome no título, fração do título coberta pelo nome) ou None se o card não é do produto"""
+    p_tok, t_tok = _tokens_nucleo(nome), _tokens_nucleo(titulo)
+    if not p_tok or not t_tok:
+        return None
+    comuns = len(p_tok & t_tok)
+    conf, cobre = comuns / len(p_tok), comuns / len(t_tok)
+    if conf < minimo or cobre < MATCH_TITULO_MIN:
+        return None
+    m_nome, m_titulo = _medidas(nome), _medidas(titulo)
+    if m_nome and m_titulo and not (m_nome & m_titulo):  # 300g não casa com 1kg
+        return None
+    return conf, cobre
+
+def casar_cards_catalogo(cards, produtos, minimo=None):
+    """
+    {query canônica: preço} para cada produto cujo nome bate com um único card.
+    Exige os tokens do produto no título E o título coberto pelo produto (MATCH_TITULO_MIN),
+    com medidas compatíveis; desempate pela cobertura. Empate no topo = ambíguo, fica de fora.
+    """
+    minimo = MATCH_MULTI_MIN if minimo is None else minimo
+    cards = [c for c in cards if c.get("preco") is not None and c.get("titulo")]
+    achados = {}
+    for prod in produtos:
+        ranking = []
+        for c in cards:
+            conf = _confianca_card(prod["nome"], c["titulo"], minimo)
+            if conf:
+                ranking.append((conf[0], conf[1], c))
+        if not ranking:
+            continue
+        ranking.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        if len(ranking) > 1 and ranking[0][:2] == ranking[1][:2] and ranking[0][2]["preco"] != ranking[1][2]["preco"]:
+            continue
+        achados[normalizar_query(prod["nome"])] = ranking[0][2]["preco"]
+    return achados
+
+# =======================
+# PRECIFICAÇÃO (lote, NumPy)
+# =======================
+# Terminações aceitas por regra de arredondamento (sempre para cima, na menor terminação >= preço)
+ARREDONDAMENTOS = {
+    "centavo": None,
+    "99": (0.99,),
+    "49": (0.49, 0.99),
+    "90": (0.90,),
+}
+REVISAO_ARQ_FMT = "revisao_{data}.jsonl"
+
+def arredondar_precos(precos, regra=None):
+    import numpy as np
+    regra = regra or PRECO_ARREDONDAMENTO
+    p = np.round(np.asarray(precos, dtype=float), 2)
+    finais = ARREDONDAMENTOS.get(regra)
+    if not finais:
+        return p
+    # para cada terminação e: menor x >= p com x = inteiro + e; fica a menor entre as terminações
+    validos = ~np.isnan(p)  # SEM_PRECO fica NaN, sem passar pelo min (evita o aviso de All-NaN)
+    cand = np.stack([np.ceil(np.round(p[validos] - e, 2)) + e for e in finais])
+    p[validos] = np.round(cand.min(axis=0), 2)
+    return p
+
+def precificar_lote(itens):
+    """
+    Calcula o preço final de todos os itens de uma vez.
+    itens: dicts com sku, preco_base (None se não achou) e incremento.
+    Devolve, na mesma ordem, dicts com preco_final, incremento_aplicado, status (OK | SEM_PRECO | REVISAO) e motivo.
+    """
+    if not itens:
+        return []
+    import numpy as np
+    skus = [i["sku"] for i in itens]
+    base = np.array([i["preco_base"] if i.get("preco_base") else np.nan for i in itens], dtype=float)
+    inc = np.array([float(i.get("incremento") or 0.0) for i in itens], dtype=float)
+    inc_aplicado = np.clip(inc,
+                           MARGEM_MIN_PCT if MARGEM_MIN_PCT is not None else -np.inf,
+                           MARGEM_MAX_PCT if MARGEM_MAX_PCT is not None else np.inf)
+
+    with np.errstate(invalid="ignore"):
+        final = arredondar_precos(np.round(base * (1 + inc_aplicado / 100.0), 2))
+
+    ultimos = historico_ultimos_precos(skus) if PRECO_DESVIO_MAX_PCT is not None else {}
+    ultimo = np.array([ultimos.get(s, np.nan) for s in skus], dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        desvio = np.abs(final / ultimo - 1.0) * 100.0
+        sem_preco = np.isnan(base) | (base <= 0)
+        revisar = ~sem_preco & ~np.isnan(ultimo) & (desvio > (np.inf if PRECO_DESVIO_MAX_PCT is None else PRECO_DESVIO_MAX_PCT))
+
+    saida = []
+    for k in range(len(itens)):
+        r = {"sku": skus[k], "preco_final": None, "incremento_aplicado": float(inc_aplicado[k]),
+             "ultimo_preco": None if np.isnan(ultimo[k]) else float(ultimo[k]), "status": "OK", "motivo": None}
+        if sem_preco[k]:
+            r["status"] = "SEM_PRECO"
+        else:
+            r["preco_final"] = float(final[k])
+            if inc_aplicado[k] != inc[k]:
+                r["motivo"] = f"incremento {inc[k]:g}% travado em {inc_aplicado[k]:g}%"
+            if revisar[k]:
+                r["status"] = "REVISAO"
+                r["motivo"] = f"desvio de {desvio[k]:.0f}% vs último preço {ultimo[k]:.2f}"
+        saida.append(r)
+    return saida
+
+def registrar_revisao(item, prc):
+    """Itens fora da curva ficam retidos num arquivo para alguém conferir antes de publicar"""
+    print(f"[Preço] ⚠️ SKU {item['sku']} retido para revisão: {prc['motivo']}")
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOG_DIR / REVISAO_ARQ_FMT.format(data=f"{datetime.date.today():%Y-%m-%d}"), "a", encoding="utf-8") as f:
+            f.write(json.dumps({**item, **prc, "ts": _agora_iso(), "run_id": RUN_ID}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[Preço] ⚠️ Erro ao gravar revisão: {e}")
+
+# =======================
+# MEMÓRIA (CDP + RSS)
+# =======================
+PAGINAS_SITES = ("tenda", "cds", "wp", "portal")
+# Como reabrir cada página reciclada (CDS e WP navegam sozinhos a cada SKU)
+PAGINAS_ENTRADA = {"tenda": abrir_tenda, "portal": abrir_portal}
+_mem_lock = threading.Lock()
+
+def metricas_pagina(page):
+    """JS heap / nós DOM de uma página via Performance.getMetrics (None se a página morreu)"""
+    if is_page_closed(page):
+        return None
+    try:
+        cdp = page.context.new_cdp_session(page)
+        try:
+            cdp.send("Performance.enable")
+            m = {x["name"]: x["value"] for x in cdp.send("Performance.getMetrics").get("metrics", [])}
+        finally:
+            try: cdp.detach()
+            except: pass
+    except Exception as e:
+        print(f"[Memória] Falha ao ler métricas: {e}")
+        return None
+    return {
+        "heap_mb": round(m.get("JSHeapUsedSize", 0) / 1048576, 1),
+        "heap_total_mb": round(m.get("JSHeapTotalSize", 0) / 1048576, 1),
+        "nodes": int(m.get("Nodes", 0)),
+        "documents": int(m.get("Documents", 0)),
+        "listeners": int(m.get("JSEventListeners", 0)),
+    }
+
+def rss_processos_mb(proprio=True):
+    """RSS somado deste processo e de todos os descendentes (driver + Chromium). Só Linux.
+    proprio=False conta só os descendentes."""
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    filhos = {}
+    for d in proc.iterdir():
+        if not d.name.isdigit():
+            continue
+        try:
+            ppid = int((d / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except Exception:
+            continue
+        filhos.setdefault(ppid, []).append(int(d.name))
+    total_kb, pilha = 0, [os.getpid()]
+    while pilha:
+        pid = pilha.pop()
+        pilha.extend(filhos.get(pid, []))
+        if pid == os.getpid() and not proprio:
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for linha in f:
+                    if linha.startswith("VmRSS:"):
+                        total_kb += int(linha.split()[1])
+                        break
+        except Exception:
+            pass
+    return round(total_kb / 1024, 1)
+
+def amostrar_memoria(paginas):
+    amostra = {
+        "ts": _agora_iso(),
+        "run_id": RUN_ID,
+        "rss_mb": rss_processos_mb(),
+        "paginas": {nome: metricas_pagina(p) for nome, p in paginas.items() if p},
+    }
+    resumo = " | ".join(f"{n}: {m['heap_mb']}MB/{m['nodes']} nós" for n, m in amostra["paginas"].items() if m)
+    print(f"[Memória] RSS={amostra['rss_mb']}MB | {resumo}")
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with _mem_lock, open(LOG_DIR / f"memoria_{datetime.date.today():%Y-%m-%d}.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(amostra, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[Memória] ⚠️ Erro ao gravar amostra: {e}")
+    return amostra
+
+def paginas_acima_limite(amostra):
+    return [nome for nome, m in amostra["paginas"].items()
+            if m and (m["heap_mb"] > MEM_HEAP_MAX_MB or m["nodes"] > MEM_NODES_MAX)]
+
+def reciclar_pagina(ctx, nome, page):
+    print(f"[Memória] Reciclando página {nome}...")
+    try:
+        if page: page.close()
+    except: pass
+    nova = nova_pagina(ctx, nome)
+    entrada = PAGINAS_ENTRADA.get(nome)
+    if entrada:
+        try:
+            entrada(nova)
+        except Exception as e:
+            print(f"[Memória] ⚠️ Erro ao reabrir {nome}: {e}")
+    return nova
+
+def recriar_contexto_lote(browser, ctx, paginas, com_tenda=True):
+    print("[Memória] RSS acima do limite — recriando contexto e refazendo logins (sem navegadores extras)...")
+    for p in paginas.values():
+        try:
+            if p: p.close()
+        except: pass
+    try:
+        if ctx: ctx.close()
+    except: pass
+    novo = make_context_only(browser)
+    return novo, dict(zip(PAGINAS_SITES, open_and_login_all(novo, paralelo=False, com_tenda=com_tenda)))
+
+# O RSS inclui o Python e o processo do navegador, que não encolhem ao fechar o contexto:
+# recria no máximo a cada MEM_RECRIAR_INTERVALO amostras, e para de recriar (até o RSS
+# voltar abaixo do limite) se a recriação anterior não baixou o RSS em pelo menos 10%.
+_mem_recriacao = {"rss_antes": None, "amostras": 0, "ineficaz": False}
+
+def verificar_memoria(ctx, paginas, recriar_contexto=None):
+    """Amostra e recicla páginas (ou o contexto inteiro) antes de estourarem os limites"""
+    amostra = amostrar_memoria(paginas)
+    rss, rc = amostra["rss_mb"], _mem_recriacao
+    rc["amostras"] += 1
+    if rss and rss <= MEM_RSS_MAX_MB:
+        rc["ineficaz"] = False
+    elif rss and rc["rss_antes"] is not None and rc["amostras"] == 1 and rss >= rc["rss_antes"] * 0.9:
+        rc["ineficaz"] = True
+        print(f"[Memória] ⚠️ Recriar o contexto não baixou o RSS ({rc['rss_antes']}MB -> {rss}MB) — "
+              "só reciclando páginas até o RSS voltar abaixo do limite")
+    if recriar_contexto and rss and rss > MEM_RSS_MAX_MB and not rc["ineficaz"] \
+            and (rc["rss_antes"] is None or rc["amostras"] >= MEM_RECRIAR_INTERVALO):
+        rc["rss_antes"], rc["amostras"] = rss, 0
+        return recriar_contexto()
+    for nome in paginas_acima_limite(amostra):
+        paginas[nome] = reciclar_pagina(ctx, nome, paginas[nome])
+    return ctx, paginas
+
+# ====== COALESCÊNCIA DE BUSCAS ======
+# SKUs cujo "nome" só difere em caixa/acentos/espaços/pontuação fazem a mesma busca na Tenda.
+def normalizar_query(nome: str) -> str:
+    t = unicodedata.normalize("NFKD", nome or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", t))
+
+def agrupar_por_query(produtos):
+    grupos = {}
+    for prod in produtos:
+        grupos.setdefault(normalizar_query(prod["nome"]), []).append(prod)
+    return grupos
+
+def buscar_preco_tenda_coalescido(page, query: str, cache: dict, catalogo=None, prazo=None, cep=None):
+    """
+    Uma busca por query canônica na execução inteira; o resultado vale para todo o grupo.
+    Com TENDA_MULTI_MATCH e o catálogo, os outros cards da página já precificam outros SKUs.
+    """
+    chave = normalizar_query(query)
+    if chave in cache:
+        print(f"[Tenda] Reaproveitando busca \"{chave}\" -> {cache[chave]}")
+        return cache[chave]
+    if not (TENDA_MULTI_MATCH and catalogo):
+        preco = buscar_preco_tenda(page, query, prazo=prazo, cep=cep)
+    else:
+        cards = buscar_cards_tenda(page, query, limite=TENDA_MAX_CARDS, prazo=prazo, cep=cep)
+        preco = escolher_preco_cards(cards, query) if cards else None
+        if cards:
+            pendentes = [p for p in catalogo if normalizar_query(p["nome"]) not in cache
+                         and normalizar_query(p["nome"]) != chave]
+            extras = casar_cards_catalogo(cards, pendentes)
+            if extras:
+                print(f"[Tenda][Multi] {len(extras)} outras queries com preço de reserva nesta página: "
+                      + ", ".join(sorted(extras)[:5]) + ("..." if len(extras) > 5 else ""))
+                with _multi_lock:
+                    for q, p in extras.items():
+                        _multi_fallback.setdefault((cep or CEP_VALOR, q), p)
+    if not preco:
+        with _multi_lock:
+            reserva = _multi_fallback.get((cep or CEP_VALOR, chave))
+        if reserva:
+            print(f"[Tenda][Multi] \"{chave}\" sem resultado próprio — usando o card visto em outra busca: {reserva}")
+            preco = reserva
+    if preco:
+        cache[chave] = preco
+    return preco
+
+# =======================
+# CATÁLOGO DA TENDA (varredura de categorias + índice de trigramas)
+# =======================
+# Algumas dezenas de páginas de categoria trazem o sortimento inteiro; casamos o catálogo
+# todo contra esse snapshot e só os SKUs que sobrarem vão para a busca por texto.
+SNAPSHOT_ARQ_FMT = "tenda_snapshot_{data}.json"
+
+def tenda_url_categoria(categoria, pagina=1):
+    url = categoria if categoria.startswith("http") else f"{TENDA_URL}/{categoria.strip('/')}"
+    if pagina > 1:
+        url += ("&" if "?" in url else "?") + TENDA_PAGINACAO.format(n=pagina)
+    return url
+
+def varrer_categorias_tenda(page, categorias=None, max_paginas=None, prazo=None):
+    """Percorre as categorias com paginação; itens únicos por URL com a categoria de origem.
+    Esgotado o PRAZO_CRAWL_S, devolve o que já foi lido (o resto vai para a busca por texto)."""
+    categorias = categorias or TENDA_CATEGORIAS
+    max_paginas = max_paginas or TENDA_CRAWL_PAGINAS
+    prazo = prazo or criar_prazo(PRAZO_CRAWL_S)
+    itens, vistos = [], set()
+    for cat in categorias:
+        t0 = time.time()
+        n_cat = 0
+        for pagina in range(1, max_paginas + 1):
             try:
-                unit_raw = card.locator(UNIT_PRICE_SEL).first.inner_text().strip()
-                unit_price = clean_price(unit_raw)
+                page.goto(tenda_url_categoria(cat, pagina), wait_until="domcontentloaded", timeout=t_ms(prazo, 60000))
+                page.wait_for_selector(CARD_ANCHOR, state="attached", timeout=t_ms(prazo, DEFAULT_TIMEOUT))
+            except PrazoEsgotado:
+                log_step(f"Tenda categoria '{cat}': {n_cat} itens em {pagina - 1} página(s)", t0)
+                print(f"[Crawl] ⚠️ Prazo de {PRAZO_CRAWL_S:.0f}s esgotado — seguindo com {len(itens)} itens")
+                return itens
             except Exception:
-                unit_price = None
+                break
+            novos = [c for c in tenda_ler_cards(page, limite=1000) if c["url"] and c["url"] not in vistos]
+            if not novos:
+                break
+            for c in novos:
+                vistos.add(c["url"])
+                itens.append(dict(c, categoria=cat))
+            n_cat += len(novos)
+        log_step(f"Tenda categoria '{cat}': {n_cat} itens em {pagina} página(s)", t0)
+    return itens
+
+def salvar_snapshot_tenda(itens, cep=None):
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    caminho = LOG_DIR / SNAPSHOT_ARQ_FMT.format(data=datetime.date.today().isoformat())
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump({"gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "cep": cep, "itens": itens}, f, ensure_ascii=False, indent=2)
+    print(f"[Crawl] Snapshot com {len(itens)} itens em {caminho}")
+    return caminho
 
-            if unit_price is None:
+def _trigramas(texto):
+    t = f"  {normalizar_query(texto)} "
+    return {t[i:i+3] for i in range(len(t) - 2)}
+
+def indice_tenda(itens):
+    """Índice invertido trigrama -> itens (só os que têm preço e título)"""
+    validos = [c for c in itens if c.get("preco") is not None and c.get("titulo")]
+    tri = [_trigramas(c["titulo"]) for c in validos]
+    postings = {}
+    for i, tg in enumerate(tri):
+        for g in tg:
+            postings.setdefault(g, []).append(i)
+    return {"itens": validos, "tri": tri, "postings": postings}
+
+def casar_catalogo_indice(indice, produtos, minimo=None, candidatos=25):
+    """
+    ({query canônica: preço}, índices usados). Candidatos pelos trigramas em comum; aceita
+    quem passa em _confianca_card (como casar_cards_catalogo) ou, sem isso, uma
+    similaridade de trigramas >= MATCH_TRIGRAMA_MIN com medidas compatíveis. Empate no topo = ambíguo.
+    """
+    minimo = MATCH_MULTI_MIN if minimo is None else minimo
+    achados, usados = {}, set()
+    for prod in produtos:
+        chave = normalizar_query(prod["nome"])
+        p_tok, p_tri = _tokens_nucleo(prod["nome"]), _trigramas(prod["nome"])
+        m_nome = _medidas(prod["nome"])
+        if not p_tok or chave in achados:
+            continue
+        comuns = {}
+        for g in p_tri:
+            for i in indice["postings"].get(g, ()):
+                comuns[i] = comuns.get(i, 0) + 1
+        ranking = []
+        for i, n in sorted(comuns.items(), key=lambda kv: kv[1], reverse=True)[:candidatos]:
+            titulo = indice["itens"][i]["titulo"]
+            sim = n / len(p_tri | indice["tri"][i])
+            por_tokens = _confianca_card(prod["nome"], titulo, minimo) is not None
+            m_titulo = _medidas(titulo)
+            if not por_tokens and (sim < MATCH_TRIGRAMA_MIN or (m_nome and m_titulo and not (m_nome & m_titulo))):
                 continue
+            ranking.append((por_tokens, round(sim, 4), i))
+        if not ranking:
+            continue
+        ranking.sort(reverse=True)
+        topo = indice["itens"][ranking[0][2]]
+        if len(ranking) > 1 and ranking[0][:2] == ranking[1][:2] \
+                and topo["preco"] != indice["itens"][ranking[1][2]]["preco"]:
+            continue
+        achados[chave] = topo["preco"]
+        usados.add(ranking[0][2])
+    return achados, usados
 
-            score = (sum(1 for t in q_tokens if t in name) / max(1, len(q_tokens))) if name else 0.0
-            if score > best_score:
-                best_score, best_price = score, unit_price
+def relatorio_nao_casados(indice, usados):
+    """Itens da Tenda que nenhum SKU nosso casou (candidatos a entrar no catálogo)"""
+    fora = sorted((c for i, c in enumerate(indice["itens"]) if i not in usados), key=lambda c: c["titulo"])
+    if fora:
+        caminho = LOG_DIR / f"tenda_nao_casados_{datetime.date.today().isoformat()}.json"
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(fora, f, ensure_ascii=False, indent=2)
+        print(f"[Crawl] {len(fora)} itens da Tenda sem SKU correspondente -> {caminho}")
+    return fora
 
-            if i == 0 and best_price is not None and score >= 0.6:
-                break
+def precos_via_crawl(produtos, cep=None):
+    """Varre as categorias uma vez e devolve o cache {query canônica: preço} já casado"""
+    t0 = time.time()
+    try:
+        with sync_playwright() as pw:
+            browser = lancar_navegador(pw)
+            try:
+                ctx = make_context_only(browser, cep=cep)
+                page = nova_pagina(ctx, "tenda")
+                abrir_tenda(page, prazo=criar_prazo(PRAZO_LOGIN_S), cep=cep)
+                itens = varrer_categorias_tenda(page)
+            finally:
+                fechar_navegador(browser)
+    except Exception as e:
+        print(f"[Crawl] ❌ Erro na varredura: {e}")
+        return {}
+    salvar_snapshot_tenda(itens, cep or CEP_VALOR)
+    indice = indice_tenda(itens)
+    achados, usados = casar_catalogo_indice(indice, produtos)
+    relatorio_nao_casados(indice, usados)
+    queries = len(agrupar_por_query(produtos))
+    log_step(f"Crawl: {len(achados)}/{queries} buscas resolvidas pelo snapshot "
+             f"({len(indice['itens'])} itens da Tenda)", t0)
+    return achados
 
-        if best_price is not None:
-            print(f"[Tenda][Resultados] preço unitário = {best_price}")
-            return best_price
+# =======================
+# MULTI-CEP (um contexto da Tenda por região)
+# =======================
+# A API síncrona do Playwright não atravessa threads: cada CEP tem sua thread com
+# sync_playwright, navegador e contexto próprios (estado/observer do seu CEP).
+def agregar_precos_regiao(precos):
+    """{cep: preço} -> preço base conforme CEP_AGREGACAO (min | mediana | cep:<CEP>)"""
+    validos = {cep: p for cep, p in precos.items() if p}
+    if not validos:
+        return None
+    if CEP_AGREGACAO.startswith("cep:"):
+        return validos.get(CEP_AGREGACAO[4:].strip())
+    if CEP_AGREGACAO == "mediana":
+        import statistics
+        return round(float(statistics.median(validos.values())), 2)
+    return min(validos.values())
 
-        for i in range(lim):
-            card = cards.nth(i)
+def _coletar_regiao(cep, produtos, catalogo, cache, saida):
+    precos = {}
+    t0 = time.time()
+    try:
+        with sync_playwright() as pw:
+            browser = lancar_navegador(pw)
             try:
-                unit_raw = card.locator(UNIT_PRICE_SEL).first.inner_text().strip()
-                unit_price = clean_price(unit_raw)
-                if unit_price is not None:
-                    print(f"[Tenda][Resultados][fallback] preço unitário = {unit_price}")
-                    return unit_price
-            except Exception:
-                continue
+                ctx = make_context_only(browser, cep=cep)
+                page = nova_pagina(ctx, "tenda")
+                abrir_tenda(page, prazo=criar_prazo(PRAZO_LOGIN_S), cep=cep)
+                for prod in produtos:
+                    prazo = criar_prazo(PRAZO_TENDA_S)
+                    try:
+                        if is_page_closed(page):
+                            page = nova_pagina(ctx, "tenda")
+                        with prazo_na_pagina(page, prazo):
+                            precos[prod["sku"]] = buscar_preco_tenda_coalescido(
+                                page, prod["nome"], cache, catalogo, prazo=prazo, cep=cep)
+                    except Exception as e:
+                        print(f"[Tenda][{cep}] Erro busca {prod['sku']}: {e}")
+                        precos[prod["sku"]] = None
+            finally:
+                fechar_navegador(browser)
+    except Exception as e:
+        print(f"[Tenda][{cep}] ❌ Erro fatal: {e}")
+    saida[cep] = precos
+    log_step(f"Tenda CEP {cep} ({len(precos)}/{len(produtos)} buscados)", t0)
+
+def coletar_precos_regioes(produtos, catalogo=None, caches=None, ceps=None):
+    """{sku: {cep: preço}} com um contexto isolado por CEP, todos em paralelo"""
+    ceps = ceps or TENDA_CEPS
+    caches = caches if caches is not None else {}
+    saida, threads = {}, []
+    for cep in ceps:
+        t = threading.Thread(target=_coletar_regiao, name=f"tenda-{cep}", daemon=True,
+                             args=(cep, produtos, catalogo, caches.setdefault(cep, {}), saida))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    return {p["sku"]: {cep: saida.get(cep, {}).get(p["sku"]) for cep in ceps} for p in produtos}
+
+def preco_base_regioes(sku, precos):
+    """Agrega, registra e mostra os preços de um SKU por região"""
+    historico_registrar_regioes(sku, precos)
+    preco = agregar_precos_regiao(precos)
+    print(f"[Tenda][Multi-CEP] {sku}: " + " | ".join(f"{c}={p}" for c, p in precos.items())
+          + f" -> {CEP_AGREGACAO}={preco}")
+    return preco
+
+# =======================
+# CIRCUIT BREAKERS (por sink)
+# =======================
+# fechado -> (BREAKER_FALHAS falhas seguidas) -> aberto -> (BREAKER_ESPERA_S) -> meio-aberto:
+# uma única escrita de sonda; sucesso fecha, falha reabre. Enquanto aberto, as escritas
+# vão para logs/pendentes_<sink>.jsonl e viram um plano com "python bot.py pendentes".
+ADIADO = "ADIADO"
+_breaker_lock = threading.Lock()
+_breakers = {}
+
+def _breaker(sink):
+    return _breakers.setdefault(sink, {"estado": "fechado", "falhas": 0, "aberto_em": 0.0, "sondando": False,
+                                       "adiados": 0})
+
+def breaker_permite(sink) -> bool:
+    with _breaker_lock:
+        b = _breaker(sink)
+        if b["estado"] == "fechado":
+            return True
+        if b["estado"] == "aberto" and time.time() - b["aberto_em"] >= BREAKER_ESPERA_S:
+            b["estado"] = "meio-aberto"
+            print(f"[Breaker] {sink}: meio-aberto, sondando com 1 SKU")
+        if b["estado"] == "meio-aberto" and not b["sondando"]:
+            b["sondando"] = True
+            return True
+        return False
+
+def breaker_desligar(sink, motivo):
+    """Desliga o sink pelo resto da execução (sem sonda); as escritas ficam pendentes"""
+    with _breaker_lock:
+        b = _breaker(sink)
+        b["estado"], b["motivo"] = "desligado", motivo
+    print(f"[Breaker] {sink}: DESLIGADO — {motivo}")
+
+def breaker_registrar(sink, resultado):
+    """resultado False/TIMEOUT_BUDGET = falha; True/None (não encontrado) = o sink respondeu"""
+    with _breaker_lock:
+        b = _breaker(sink)
+        b["sondando"] = False
+        if resultado is False or resultado == TIMEOUT_BUDGET:
+            b["falhas"] += 1
+            if b["estado"] == "meio-aberto" or b["falhas"] >= BREAKER_FALHAS:
+                if b["estado"] != "aberto":
+                    print(f"[Breaker] {sink}: ABERTO após {b['falhas']} falhas seguidas "
+                          f"(nova sonda em {BREAKER_ESPERA_S:.0f}s)")
+                b["estado"], b["aberto_em"] = "aberto", time.time()
+        else:
+            if b["estado"] != "fechado":
+                print(f"[Breaker] {sink}: fechado novamente")
+            b["estado"], b["falhas"] = "fechado", 0
+
+def breakers_resumo():
+    with _breaker_lock:
+        return {s: dict(b) for s, b in _breakers.items()}
+
+def pendentes_path(sink):
+    return LOG_DIR / f"pendentes_{sink}.jsonl"
+
+def enfileirar_pendente(sink, sku, preco, nome=None):
+    with _breaker_lock:
+        _breaker(sink)["adiados"] += 1
+        try:
+            LOG_DIR.mkdir(parents=True, exist_ok=True)
+            with open(pendentes_path(sink), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"sku": sku, "nome": nome, "preco": preco, "ts": _agora_iso(),
+                                    "run_id": RUN_ID}, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"[Breaker] ⚠️ Erro ao enfileirar {sku}/{sink}: {e}")
+
+def escrever_sink(sink, fn, page, sku, preco, nome=None, prazo=None):
+    """Chama o sink respeitando o breaker; com o breaker aberto a escrita fica pendente (ADIADO).
+    prazo = limite do SKU; a escrita ganha PRAZO_SINK_S dentro dele (TIMEOUT_BUDGET se estourar)"""
+    if page is None or not breaker_permite(sink):  # sem página = login do sink falhou no lote
+        if HAR_MODO == "replay":
+            har_registrar_escrita(sink, sku, preco, ADIADO)
+        else:
+            enfileirar_pendente(sink, sku, preco, nome)
+        return ADIADO
+    prazo = criar_prazo(PRAZO_SINK_S, prazo)
+    if prazo_vencido(prazo):
+        print(f"[{sink}] ⚠️ {sku}: sem prazo restante — escrita não tentada")
+        return TIMEOUT_BUDGET
+    t0 = time.time()
+    try:
+        with prazo_na_pagina(page, prazo):
+            resultado = fn(page, sku, preco, prazo=prazo)
+    except PrazoEsgotado:
+        resultado = TIMEOUT_BUDGET
+    breaker_registrar(sink, resultado)
+    painel_escrita(sink, resultado)
+    registrar_etapa(f"sink {sink}", t0)
+    if HAR_MODO == "replay":
+        har_registrar_escrita(sink, sku, preco, resultado, _ms(t0))
+    return resultado
+
+# =======================
+# PLANO / APLICAÇÃO
+# =======================
+# "plan" só raspa a Tenda e grava os preços-alvo por SKU e sink; "apply" consome o
+# plano com o mecanismo em lote de cada sink. Os planos são JSON ordenado (diffável).
+SINKS = {
+    "cds":    {"site": "cds",    "login": login_cds,    "atualizar": atualizar_cds,    "lote": None},
+    "woo":    {"site": "wp",     "login": wp_login,     "atualizar": atualizar_woo,    "lote": atualizar_woo_lote},
+    "portal": {"site": "portal", "login": login_portal, "atualizar": atualizar_portal, "lote": atualizar_portal_lote},
+}
+
+def item_do_plano(prod, preco_base):
+    return {
+        "sku": prod["sku"],
+        "nome": prod["nome"],
+        "incremento": float(prod["incremento"]),
+        "preco_base": preco_base,
+        "preco_final": None,
+        "sinks": {},
+    }
+
+def precificar_plano(itens):
+    """Preenche preço final e sinks dos itens do plano; os retidos vão com 'revisao' e sem sinks"""
+    for item, prc in zip(itens, precificar_lote(itens)):
+        item["preco_final"] = prc["preco_final"]
+        if prc["status"] == "OK":
+            item["sinks"] = {s: prc["preco_final"] for s in SINKS}
+        elif prc["status"] == "REVISAO":
+            item["revisao"] = prc["motivo"]
+            registrar_revisao(item, prc)
+    return itens
+
+def salvar_plano(plano, saida=None):
+    if saida:
+        caminho = Path(saida)
+    else:
+        PLAN_DIR.mkdir(parents=True, exist_ok=True)
+        caminho = PLAN_DIR / f"plano_{datetime.datetime.now().strftime('%Y-%m-%d_%H%M%S')}.json"
+    plano["itens"] = sorted(plano.get("itens", []), key=lambda i: i["sku"])
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(plano, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return str(caminho)
+
+def carregar_plano(caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def plano_mais_recente():
+    planos = sorted(PLAN_DIR.glob("plano_*.json")) if PLAN_DIR.exists() else []
+    return str(planos[-1]) if planos else None
+
+def plano_manual(sku, preco, sinks=None):
+    """Plano em memória com um único SKU/preço (push avulso, sem passar pela Tenda)"""
+    preco = round(float(preco), 2)
+    return {"versao": 1, "gerado_em": _agora_iso(), "origem": "manual",
+            "itens": [{"sku": sku, "nome": None, "incremento": None, "preco_base": None, "preco_final": preco,
+                       "sinks": {s: preco for s in (sinks or SINKS) if s in SINKS}}]}
+
+def coletar_lote_plano(pw, batch, catalogo, cache_tenda, caches_cep):
+    """Itens do plano (preço base da Tenda) de um lote; o que falhar fica sem preço"""
+    itens = []
+    browser = ctx = p_tenda = None
+    try:
+        if len(TENDA_CEPS) > 1:
+            t_regioes = time.time()
+            regioes = coletar_precos_regioes(batch, catalogo, caches_cep)
+            for prod in batch:
+                item = item_do_plano(prod, preco_base_regioes(prod["sku"], regioes[prod["sku"]]))
+                item["regioes"] = regioes[prod["sku"]]
+                item["_dur_ms"] = _ms(t_regioes) // len(batch)
+                itens.append(item)
+            return itens
+        browser = lancar_navegador(pw)
+        ctx = make_context_only(browser)
+        p_tenda = nova_pagina(ctx, "tenda")
+        abrir_tenda(p_tenda)
 
-        print("[Tenda] Não foi possível extrair preço unitário.")
+        for prod in batch:
+            print(f"\n=== {prod['sku']} | {prod['nome']} ===")
+            t_tenda = time.time()
+            prazo_tenda = criar_prazo(PRAZO_TENDA_S)
+            with prazo_na_pagina(p_tenda, prazo_tenda):
+                preco_base = buscar_preco_tenda_coalescido(p_tenda, prod["nome"], cache_tenda, catalogo,
+                                                           prazo=prazo_tenda)
+            item = item_do_plano(prod, preco_base)
+            item["_dur_ms"] = _ms(t_tenda)
+            itens.append(item)
+    except Exception as e:
+        print(f"[Plano] ❌ Erro no lote: {e}")
+        feitos = {i["sku"] for i in itens}
+        itens += [item_do_plano(prod, None) for prod in batch if prod["sku"] not in feitos]
+    finally:
+        for obj in (p_tenda, ctx, browser):
+            try:
+                if obj: obj.close()
+            except: pass
+    return itens
+
+def gerar_plano(saida=None):
+    produtos = carregar_produtos()
+    if not produtos:
+        print("[Plano] Nenhum produto carregado da API")
         return None
 
+    t0 = time.time()
+    itens, cache_tenda, caches_cep = [], {}, {}
+    if TENDA_CRAWL:
+        cache_tenda = precos_via_crawl(produtos)
+        caches_cep[CEP_VALOR] = dict(cache_tenda)
+    print(f"[Plano] {len(produtos)} SKUs -> {len(agrupar_por_query(produtos))} buscas distintas na Tenda")
+    historico_iniciar_execucao("plan")
+    with sync_playwright() as pw:
+        for batch_idx, batch in enumerate(chunked(produtos, BATCH_SIZE), start=1):
+            print(f"\n====== Plano: lote {batch_idx} ({len(batch)} itens) ======")
+            itens += coletar_lote_plano(pw, batch, produtos, cache_tenda, caches_cep)
+
+    precificar_plano(itens)
+    for item in itens:
+        status = "PLANO" if item["sinks"] else ("REVISAO" if item.get("revisao") else "IGNORADO")
+        historico_registrar_observacao(item["sku"], item["nome"], item["preco_base"], item["incremento"],
+                                       item["preco_final"], status, item.pop("_dur_ms", None))
+
+    plano = {
+        "versao": 1,
+        "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+        "cep": CEP_VALOR if USE_CEP else None,
+        "ceps": TENDA_CEPS if len(TENDA_CEPS) > 1 else None,
+        "agregacao": CEP_AGREGACAO if len(TENDA_CEPS) > 1 else None,
+        "itens": itens,
+    }
+    caminho = salvar_plano(plano, saida)
+    historico_finalizar_execucao()
+    relatorio_bloqueio()
+    relatorio_cache_assets()
+    com_preco = sum(1 for i in itens if i["sinks"])
+    retidos = sum(1 for i in itens if i.get("revisao"))
+    log_step(f"Plano gerado: {caminho} ({com_preco}/{len(itens)} com preço, {retidos} em revisão)", t0)
+    return caminho
+
+def _aplicar_sink(sink, escritas, resultados):
+    """Roda um sink inteiro no seu próprio navegador (uma thread por sink)"""
+    cfg = SINKS[sink]
+    res = {}
+    t0 = time.time()
+    try:
+        with sync_playwright() as pw:
+            browser = ctx = page = None
+            try:
+                browser = lancar_navegador(pw)
+                ctx = make_context_only(browser, com_cep=False)
+                page = nova_pagina(ctx, cfg["site"])
+                cfg["login"](page)
+                if PREFLIGHT:
+                    preflight_site(cfg["site"], page, {"sku": PREFLIGHT_SKU or escritas[0][0], "nome": ""})
+
+                if cfg["lote"]:
+                    if breaker_permite(sink):
+                        res.update(cfg["lote"](page, escritas))
+                        for sku, preco in escritas:
+                            breaker_registrar(sink, res.get(sku, False))
+                    else:
+                        for sku, preco in escritas:
+                            enfileirar_pendente(sink, sku, preco)
+                            res[sku] = ADIADO
+                    for sku, preco in escritas:
+                        historico_registrar_escrita(sku, sink, preco, res.get(sku, False))
+                else:
+                    for sku, preco in escritas:
+                        if is_page_closed(page):
+                            print(f"[Aplicar][{sink}] Página morreu, recriando...")
+                            page = nova_pagina(ctx, cfg["site"])
+                            cfg["login"](page)
+                        t_sink = time.time()
+                        res[sku] = escrever_sink(sink, cfg["atualizar"], page, sku, preco)
+                        historico_registrar_escrita(sku, sink, preco, res[sku], _ms(t_sink))
+                        if MEM_AMOSTRA_CADA and len(res) % MEM_AMOSTRA_CADA == 0:
+                            _, paginas = verificar_memoria(ctx, {cfg["site"]: page})
+                            page = paginas[cfg["site"]]
+            finally:
+                for obj in (page, ctx, browser):
+                    try:
+                        if obj: obj.close()
+                    except: pass
     except Exception as e:
-        print(f"[Tenda] ❌ Erro na busca: {e}")
+        print(f"[Aplicar][{sink}] ❌ Erro fatal: {e}")
+    resultados[sink] = res
+    log_step(f"Aplicar {sink} ({len(escritas)} itens)", t0)
+
+def _aplicar_sinks(itens, sinks):
+    """{sink: {sku: resultado}} para os itens do plano (um navegador por sink)"""
+    resultados, threads = {}, []
+    for sink in sinks:
+        escritas = [(i["sku"], i["sinks"][sink]) for i in itens if sink in (i.get("sinks") or {})]
+        if not escritas:
+            continue
+        if APLICAR_PARALELO:
+            t = threading.Thread(target=_aplicar_sink, args=(sink, escritas, resultados),
+                                 name=f"aplicar-{sink}", daemon=True)
+            t.start()
+            threads.append(t)
+        else:
+            _aplicar_sink(sink, escritas, resultados)
+    for t in threads:
+        t.join()
+    return resultados
+
+def aplicar_plano(caminho, sinks=None):
+    """caminho: arquivo do plano ou o próprio dict (plano_manual)"""
+    plano = caminho if isinstance(caminho, dict) else carregar_plano(caminho)
+    sinks = [s for s in (sinks or SINKS) if s in SINKS]
+    itens = plano.get("itens", [])
+    log_file = get_log_filename()
+    origem = caminho if not isinstance(caminho, dict) else f"({plano.get('origem', 'memória')})"
+    print(f"[Aplicar] Plano {origem} ({len(itens)} itens) -> sinks {', '.join(sinks)}")
+    print(f"[LOG] Registrando no arquivo: {log_file}")
+
+    t0 = time.time()
+    historico_iniciar_execucao("apply")
+    resultados = _aplicar_sinks(itens, sinks)
+
+    ok = err = miss = 0
+    for item in itens:
+        sku = item["sku"]
+        alvo = [s for s in sinks if s in (item.get("sinks") or {})]
+        if not alvo:
+            miss += 1
+            log_produto(sku, item.get("nome"), None, "IGNORADO", log_file)
+            continue
+        r = {s: resultados.get(s, {}).get(sku, False) for s in alvo}
+        status = "OK" if r.get("woo") is True else "OK_SEM_WOO"
+        if ADIADO in r.values():
+            status = ADIADO
+        if all(v is not False and v != TIMEOUT_BUDGET for v in r.values()):
+            ok += 1
+            log_produto(sku, item.get("nome"), item.get("preco_final"), status, log_file)
+        else:
+            err += 1
+            status = TIMEOUT_BUDGET if TIMEOUT_BUDGET in r.values() else "ERRO_PARCIAL"
+            log_produto(sku, item.get("nome"), item.get("preco_final"), status, log_file)
+
+    historico_finalizar_execucao()
+    relatorio_bloqueio()
+    relatorio_cache_assets()
+    log_step("Aplicação completa", t0)
+    print(f"\n[Resumo Aplicação] OK={ok} | Falhas={err} | Ignorados={miss} | Total={len(itens)}")
+
+def plano_dos_pendentes(saida=None):
+    """Junta as escritas adiadas pelos breakers num plano para o 'apply' (o último preço de cada SKU vale)"""
+    itens = {}
+    for sink in SINKS:
+        caminho = pendentes_path(sink)
+        if not caminho.exists():
+            continue
+        with open(caminho, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    reg = json.loads(linha)
+                except ValueError:
+                    continue
+                item = itens.setdefault(reg["sku"], {"sku": reg["sku"], "nome": reg.get("nome"), "incremento": None,
+                                                     "preco_base": None, "preco_final": reg["preco"], "sinks": {}})
+                item["sinks"][sink] = reg["preco"]
+                item["preco_final"] = reg["preco"]
+    if not itens:
+        print("[Pendentes] Nenhuma escrita pendente")
+        return None
+    caminho = salvar_plano({"versao": 1, "gerado_em": _agora_iso(), "origem": "pendentes",
+                            "itens": list(itens.values())}, saida)
+    for sink in SINKS:
+        if pendentes_path(sink).exists():
+            pendentes_path(sink).rename(pendentes_path(sink).with_suffix(f".{RUN_ID}.consumido"))
+    print(f"[Pendentes] {len(itens)} SKUs no plano {caminho}")
+    return caminho
+
+def diff_planos(caminho_a, caminho_b):
+    a = {i["sku"]: i for i in carregar_plano(caminho_a).get("itens", [])}
+    b = {i["sku"]: i for i in carregar_plano(caminho_b).get("itens", [])}
+    mudancas = []
+    for sku in sorted(set(a) | set(b)):
+        sa = (a.get(sku) or {}).get("sinks") or {}
+        sb = (b.get(sku) or {}).get("sinks") or {}
+        for sink in sorted(set(sa) | set(sb)):
+            if sa.get(sink) != sb.get(sink):
+                mudancas.append((sku, sink, sa.get(sink), sb.get(sink)))
+                print(f"[Diff] {sku} [{sink}]: {sa.get(sink)} -> {sb.get(sink)}")
+    print(f"[Diff] {len(mudancas)} alterações")
+    return mudancas
+
+# =======================
+# FEED DE PREÇOS (várias lojas)
+# =======================
+# O preço base da Tenda não depende da loja: o feed ({query canônica: preço base}) é coletado
+# uma vez por execução e cada loja faz o próprio plano com o seu catálogo, incrementos e regras.
+# A config dos sinks é global do módulo (lida do ambiente), então cada loja roda num processo
+# filho com o seu LOJAS_DIR/<loja>.env por cima do ambiente atual — em paralelo, sem raspar de novo.
+def perfis_lojas(nomes=None):
+    """{loja: variáveis do .env dela}"""
+    from dotenv import dotenv_values
+    arquivos = sorted(LOJAS_DIR.glob("*.env")) if LOJAS_DIR.exists() else []
+    perfis = {a.stem: {k: v for k, v in dotenv_values(a).items() if v is not None} for a in arquivos}
+    if nomes:
+        faltando = [n for n in nomes if n not in perfis]
+        if faltando:
+            print(f"[Lojas] ⚠️ Sem perfil em {LOJAS_DIR}: {', '.join(faltando)}")
+        perfis = {n: perfis[n] for n in nomes if n in perfis}
+    return perfis
+
+def publicar_feed(catalogo=None, saida=None):
+    """Coleta a Tenda uma vez para o catálogo (de uma ou várias lojas) e grava o feed"""
+    catalogo = catalogo if catalogo is not None else carregar_produtos()
+    if not catalogo:
+        print("[Feed] Nenhum produto para coletar")
+        return None
+    # um produto por busca basta; o catálogo inteiro continua valendo para o multi-match
+    produtos = [grupo[0] for grupo in agrupar_por_query(catalogo).values()]
+    t0 = time.time()
+    itens, cache_tenda, caches_cep = [], {}, {}
+    if TENDA_CRAWL:
+        cache_tenda = precos_via_crawl(produtos)
+        caches_cep[CEP_VALOR] = dict(cache_tenda)
+    print(f"[Feed] {len(catalogo)} SKUs -> {len(produtos)} buscas distintas na Tenda")
+    historico_iniciar_execucao("feed")
+    with sync_playwright() as pw:
+        for batch_idx, batch in enumerate(chunked(produtos, BATCH_SIZE), start=1):
+            print(f"\n====== Feed: lote {batch_idx} ({len(batch)} buscas) ======")
+            itens += coletar_lote_plano(pw, batch, catalogo, cache_tenda, caches_cep)
+    for item in itens:
+        historico_registrar_observacao(item["sku"], item["nome"], item["preco_base"], None, None, "FEED",
+                                       item.pop("_dur_ms", None))
+
+    feed = {
+        "versao": 1,
+        "gerado_em": _agora_iso(),
+        "run_id": RUN_ID,
+        "cep": CEP_VALOR if USE_CEP else None,
+        "ceps": TENDA_CEPS if len(TENDA_CEPS) > 1 else None,
+        "agregacao": CEP_AGREGACAO if len(TENDA_CEPS) > 1 else None,
+        "precos": {normalizar_query(i["nome"]): i["preco_base"] for i in itens},
+        "regioes": {normalizar_query(i["nome"]): i["regioes"] for i in itens if i.get("regioes")} or None,
+    }
+    if saida:
+        caminho = Path(saida)
+    else:
+        FEED_DIR.mkdir(parents=True, exist_ok=True)
+        caminho = FEED_DIR / f"feed_{RUN_ID}.json"
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(feed, f, ensure_ascii=False, indent=2, sort_keys=True)
+    historico_finalizar_execucao()
+    relatorio_bloqueio()
+    relatorio_cache_assets()
+    com_preco = sum(1 for p in feed["precos"].values() if p)
+    log_step(f"Feed publicado: {caminho} ({com_preco}/{len(feed['precos'])} buscas com preço)", t0)
+    return str(caminho)
+
+def plano_do_feed(caminho_feed, produtos=None):
+    """Plano desta loja (catálogo, incrementos e regras do ambiente atual) a partir do feed"""
+    with open(caminho_feed, "r", encoding="utf-8") as f:
+        feed = json.load(f)
+    produtos = produtos if produtos is not None else carregar_produtos()
+    itens = []
+    for prod in produtos:
+        q = normalizar_query(prod["nome"])
+        item = item_do_plano(prod, feed["precos"].get(q))
+        if (feed.get("regioes") or {}).get(q):
+            item["regioes"] = feed["regioes"][q]
+        itens.append(item)
+    precificar_plano(itens)
+    sem_feed = sum(1 for p in produtos if normalizar_query(p["nome"]) not in feed["precos"])
+    if sem_feed:
+        print(f"[Feed] ⚠️ {sem_feed} SKU(s) desta loja fora do feed (ficam sem preço)")
+    return {"versao": 1, "gerado_em": _agora_iso(), "origem": "feed", "feed": str(caminho_feed),
+            "cep": feed.get("cep"), "ceps": feed.get("ceps"), "agregacao": feed.get("agregacao"), "itens": itens}
+
+def aplicar_feed(caminho_feed, sinks=None):
+    """Plano da loja a partir do feed, gravado em PLAN_DIR e aplicado nos sinks dela"""
+    plano = plano_do_feed(caminho_feed)
+    if not plano["itens"]:
+        print("[Feed] Nenhum produto nesta loja")
         return None
+    # observações no histórico desta loja: é contra elas que a trava de desvio compara
+    historico_iniciar_execucao("feed-loja")
+    for item in plano["itens"]:
+        status = "PLANO" if item["sinks"] else ("REVISAO" if item.get("revisao") else "IGNORADO")
+        historico_registrar_observacao(item["sku"], item["nome"], item["preco_base"], item["incremento"],
+                                       item["preco_final"], status)
+    caminho = salvar_plano(plano)
+    aplicar_plano(caminho, sinks or [s.strip() for s in LOJA_SINKS.split(",") if s.strip()] or None)
+    return caminho
+
+# Variáveis que apontam para os sistemas de uma loja: nunca são herdadas do ambiente da loja
+# principal (perfil incompleto = escrever os preços de uma loja nos sistemas de outra).
+VARS_LOJA = {
+    "catalogo": ("PRODUTOS_URL",),
+    "cds":      ("CDS_URL", "CDS_USER", "CDS_PASS"),
+    "woo":      ("WP_BASE_URL", "WP_USER", "WP_PASS"),
+    "portal":   ("PORTAL_URL", "PORTAL_USER", "PORTAL_PASS"),
+}
+VARS_LOJA_OPCIONAIS = ("WOO_BASE_URL", "WOO_CK", "WOO_CS", "PORTAL_LIST_URL", "PORTAL_SAVE_URL", "PORTAL_HTTP")
+
+def faltando_no_perfil(perfil):
+    """Variáveis obrigatórias (catálogo + sinks de LOJA_SINKS do perfil) que o .env da loja não define"""
+    sinks = [s.strip() for s in (perfil.get("LOJA_SINKS") or ",".join(SINKS)).split(",") if s.strip()]
+    exigidas = [v for grupo in ["catalogo", *sinks] for v in VARS_LOJA.get(grupo, ())]
+    return [v for v in exigidas if not perfil.get(v)]
+
+def _rodar_loja(loja, perfil, caminho_feed):
+    """Processo filho com o .env da loja por cima do ambiente; logs/histórico/planos separados por loja"""
+    import subprocess
+    faltando = faltando_no_perfil(perfil)
+    if faltando:
+        print(f"[Lojas] ❌ {loja}: perfil sem {', '.join(faltando)} — loja não iniciada")
+        return 2
+    pasta = LOG_DIR / "lojas" / loja
+    pasta.mkdir(parents=True, exist_ok=True)
+    # vazias (e não só removidas): o load_dotenv() do filho não sobrescreve, então o .env da
+    # loja principal não volta a preencher o que o perfil deixou de fora
+    env = dict(os.environ)
+    env.update({v: "" for grupo in VARS_LOJA.values() for v in grupo})
+    env.update({v: "" for v in (*VARS_LOJA_OPCIONAIS, "LOJA_SINKS")})
+    env.update({"LOG_DIR": str(pasta), "PLAN_DIR": str(pasta / "planos"),
+                "HISTORICO_DB": str(pasta / "historico.sqlite3")})
+    env.update(perfil)
+    env["RUN_ID"] = f"{RUN_ID}-{loja}"
+    cmd = [sys.executable, str(Path(__file__).resolve()), "push-feed", str(caminho_feed)]
+    saida = pasta / f"saida_{RUN_ID}.log"
+    t0 = time.time()
+    print(f"[Lojas] {loja}: iniciando (saída em {saida})")
+    with open(saida, "w", encoding="utf-8") as f:
+        rc = subprocess.run(cmd, env=env, stdout=f, stderr=subprocess.STDOUT).returncode
+    print(f"[Lojas] {loja}: {'✅ concluída' if rc == 0 else f'❌ código {rc}'} ({time.time() - t0:.1f}s)")
+    return rc
+
+def distribuir_feed(caminho_feed=None, lojas=None):
+    """Publica o feed (se não vier um pronto) com o catálogo somado das lojas e aplica em todas"""
+    perfis = perfis_lojas(lojas)
+    if not perfis:
+        print(f"[Lojas] Nenhum perfil de loja em {LOJAS_DIR} (um <loja>.env por loja)")
+        return {}
+    if not caminho_feed:
+        catalogo = []
+        for loja, perfil in perfis.items():
+            produtos = carregar_produtos(perfil.get("PRODUTOS_URL"))
+            print(f"[Lojas] {loja}: {len(produtos)} SKUs no catálogo")
+            catalogo += produtos
+        caminho_feed = publicar_feed(catalogo)
+        if not caminho_feed:
+            return {}
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, LOJAS_PARALELAS)) as ex:
+        futuros = {loja: ex.submit(_rodar_loja, loja, perfil, caminho_feed) for loja, perfil in perfis.items()}
+        res = {loja: f.result() for loja, f in futuros.items()}
+    falhas = [loja for loja, rc in res.items() if rc != 0]
+    log_step(f"Lojas: {len(res) - len(falhas)}/{len(res)} concluídas" + (f" (falharam: {', '.join(falhas)})" if falhas else ""), t0)
+    return res
+
+# =======================
+# FILA DE TRABALHO (coordenador + workers)
+# =======================
+# O coordenador enfileira os SKUs da API; workers em qualquer máquina arrendam lotes e
+# fazem a etapa "coleta" (Tenda + precificação) e/ou "escrita" (sinks). O arrendamento
+# tem prazo: o lote de um worker que morreu volta sozinho para a fila.
+# Um broker é um dict de funções (como SINKS); "sqlite" usa trava de arquivo do próprio
+# SQLite (sem WAL, que não funciona em disco de rede) e "memoria" serve no mesmo processo.
+FILA_ETAPAS = ("coleta", "escrita")
+
+FILA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fila (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    rodada     TEXT NOT NULL,
+    etapa      TEXT NOT NULL,
+    sku        TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    estado     TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    worker     TEXT,
+    lease_ate  REAL,
+    resultado  TEXT,
+    atualizado TEXT,
+    UNIQUE (rodada, etapa, sku)
+);
+CREATE INDEX IF NOT EXISTS idx_fila_rodada_etapa_estado ON fila(rodada, etapa, estado);
+"""
+
+_fila_local = threading.local()
+
+def _fila_db():
+    conn = getattr(_fila_local, "conn", None)
+    if conn is None:
+        FILA_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(FILA_DB), timeout=60, isolation_level=None)
+        conn.executescript(FILA_SCHEMA)
+        _fila_local.conn = conn
+    return conn
+
+def _sqlite_enfileirar(rodada, etapa, itens):
+    conn = _fila_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        antes = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO fila (rodada, etapa, sku, payload, atualizado) VALUES (?, ?, ?, ?, ?)",
+            [(rodada, etapa, sku, json.dumps(payload, ensure_ascii=False), _agora_iso()) for sku, payload in itens])
+        conn.execute("COMMIT")
+        return conn.total_changes - antes
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+FILA_LEASE_ESGOTADO = "lease expirado na última tentativa (worker caiu?)"
+
+def _sqlite_expirar(conn, rodada, agora):
+    """Lease vencido sem tentativas restantes não volta mais à fila: vira 'falhou'"""
+    conn.execute(
+        "UPDATE fila SET estado = 'falhou', resultado = ?, lease_ate = NULL, atualizado = ? "
+        "WHERE rodada = ? AND estado = 'arrendado' AND lease_ate < ? AND tentativas >= ?",
+        (json.dumps(FILA_LEASE_ESGOTADO, ensure_ascii=False), _agora_iso(), rodada, agora, FILA_TENTATIVAS))
+
+def _sqlite_arrendar(rodada, etapa, worker, n):
+    conn = _fila_db()
+    agora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _sqlite_expirar(conn, rodada, agora)
+        linhas = conn.execute(
+            "SELECT id, sku, payload FROM fila WHERE rodada = ? AND etapa = ? AND tentativas < ? "
+            "AND (estado = 'pendente' OR (estado = 'arrendado' AND lease_ate < ?)) ORDER BY id LIMIT ?",
+            (rodada, etapa, FILA_TENTATIVAS, agora, n)).fetchall()
+        conn.executemany(
+            "UPDATE fila SET estado = 'arrendado', worker = ?, lease_ate = ?, tentativas = tentativas + 1, "
+            "atualizado = ? WHERE id = ?",
+            [(worker, agora + FILA_LEASE_S, _agora_iso(), i) for i, _, _ in linhas])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [{"id": i, "sku": sku, "payload": json.loads(p)} for i, sku, p in linhas]
+
+def _sqlite_renovar(ids, worker):
+    _fila_db().executemany(
+        "UPDATE fila SET lease_ate = ? WHERE id = ? AND worker = ? AND estado = 'arrendado'",
+        [(time.time() + FILA_LEASE_S, i, worker) for i in ids])
+
+def _sqlite_concluir(id_, worker, ok, resultado):
+    """ok=False devolve o item à fila até FILA_TENTATIVAS; depois fica 'falhou'"""
+    _fila_db().execute(
+        "UPDATE fila SET estado = CASE WHEN ? THEN 'feito' WHEN tentativas >= ? THEN 'falhou' ELSE 'pendente' END, "
+        "resultado = ?, lease_ate = NULL, atualizado = ? WHERE id = ? AND worker = ?",
+        (1 if ok else 0, FILA_TENTATIVAS, json.dumps(resultado, ensure_ascii=False), _agora_iso(), id_, worker))
+
+def _sqlite_resumo(rodada):
+    _sqlite_expirar(_fila_db(), rodada, time.time())
+    res = {}
+    for etapa, estado, n in _fila_db().execute(
+            "SELECT etapa, estado, COUNT(*) FROM fila WHERE rodada = ? GROUP BY etapa, estado", (rodada,)):
+        res.setdefault(etapa, {})[estado] = n
+    return res
+
+def _sqlite_ultima_rodada():
+    linha = _fila_db().execute("SELECT rodada FROM fila ORDER BY id DESC LIMIT 1").fetchone()
+    return linha[0] if linha else None
+
+_fila_mem = []
+_fila_mem_lock = threading.Lock()
+
+def _mem_enfileirar(rodada, etapa, itens):
+    with _fila_mem_lock:
+        existentes = {(r["rodada"], r["etapa"], r["sku"]) for r in _fila_mem}
+        novos = [{"id": len(_fila_mem) + n + 1, "rodada": rodada, "etapa": etapa, "sku": sku, "payload": payload,
+                  "estado": "pendente", "tentativas": 0, "worker": None, "lease_ate": None, "resultado": None}
+                 for n, (sku, payload) in enumerate(i for i in itens if (rodada, etapa, i[0]) not in existentes)]
+        _fila_mem.extend(novos)
+        return len(novos)
+
+def _mem_expirar(rodada, agora):
+    for r in _fila_mem:
+        if (r["rodada"] == rodada and r["estado"] == "arrendado" and r["lease_ate"] < agora
+                and r["tentativas"] >= FILA_TENTATIVAS):
+            r.update(estado="falhou", resultado=FILA_LEASE_ESGOTADO, lease_ate=None)
+
+def _mem_arrendar(rodada, etapa, worker, n):
+    agora = time.time()
+    with _fila_mem_lock:
+        _mem_expirar(rodada, agora)
+        lote = [r for r in _fila_mem if r["rodada"] == rodada and r["etapa"] == etapa
+                and r["tentativas"] < FILA_TENTATIVAS
+                and (r["estado"] == "pendente" or (r["estado"] == "arrendado" and r["lease_ate"] < agora))][:n]
+        for r in lote:
+            r.update(estado="arrendado", worker=worker, lease_ate=agora + FILA_LEASE_S, tentativas=r["tentativas"] + 1)
+        return [{"id": r["id"], "sku": r["sku"], "payload": json.loads(json.dumps(r["payload"]))} for r in lote]
+
+def _mem_renovar(ids, worker):
+    with _fila_mem_lock:
+        for r in _fila_mem:
+            if r["id"] in ids and r["worker"] == worker and r["estado"] == "arrendado":
+                r["lease_ate"] = time.time() + FILA_LEASE_S
+
+def _mem_concluir(id_, worker, ok, resultado):
+    with _fila_mem_lock:
+        for r in _fila_mem:
+            if r["id"] == id_ and r["worker"] == worker:
+                r["estado"] = "feito" if ok else ("falhou" if r["tentativas"] >= FILA_TENTATIVAS else "pendente")
+                r["resultado"], r["lease_ate"] = resultado, None
+
+def _mem_resumo(rodada):
+    res = {}
+    with _fila_mem_lock:
+        _mem_expirar(rodada, time.time())
+        for r in _fila_mem:
+            if r["rodada"] == rodada:
+                res.setdefault(r["etapa"], {})
+                res[r["etapa"]][r["estado"]] = res[r["etapa"]].get(r["estado"], 0) + 1
+    return res
+
+def _mem_ultima_rodada():
+    with _fila_mem_lock:
+        return _fila_mem[-1]["rodada"] if _fila_mem else None
+
+BROKERS = {
+    "sqlite":  {"enfileirar": _sqlite_enfileirar, "arrendar": _sqlite_arrendar, "renovar": _sqlite_renovar,
+                "concluir": _sqlite_concluir, "resumo": _sqlite_resumo, "ultima_rodada": _sqlite_ultima_rodada},
+    "memoria": {"enfileirar": _mem_enfileirar, "arrendar": _mem_arrendar, "renovar": _mem_renovar,
+                "concluir": _mem_concluir, "resumo": _mem_resumo, "ultima_rodada": _mem_ultima_rodada},
+}
+
+def broker_fila(nome=None):
+    nome = nome or FILA_BROKER
+    if nome not in BROKERS:
+        raise ValueError(f"Broker de fila desconhecido: {nome} (disponíveis: {', '.join(BROKERS)})")
+    return BROKERS[nome]
+
+def _fila_abertos(resumo, etapas=FILA_ETAPAS):
+    return sum(resumo.get(e, {}).get(st, 0) for e in etapas for st in ("pendente", "arrendado"))
+
+def _fila_coleta(b, rodada, lote, estado):
+    """Tenda + precificação; itens com preço e 'escrever' viram itens da etapa escrita"""
+    if estado["catalogo"] is None:
+        estado["catalogo"] = (carregar_produtos() if TENDA_MULTI_MATCH else []) or []
+    prods = [it["payload"] for it in lote]
+    with sync_playwright() as pw:
+        itens = coletar_lote_plano(pw, prods, estado["catalogo"] or prods, estado["cache"], estado["caches_cep"])
+    precificar_plano(itens)
+    por_sku = {i["sku"]: i for i in itens}
+    res, escritas = {}, []
+    for it in lote:
+        item = por_sku.get(it["sku"])
+        if item is None:
+            continue
+        status = "PLANO" if item["sinks"] else ("REVISAO" if item.get("revisao") else "IGNORADO")
+        historico_registrar_observacao(item["sku"], item["nome"], item["preco_base"], item["incremento"],
+                                       item["preco_final"], status, item.pop("_dur_ms", None))
+        if item["sinks"] and it["payload"].get("escrever", True):
+            escritas.append((item["sku"], item))
+        res[it["id"]] = (True, {"status": status, "preco_base": item["preco_base"], "preco_final": item["preco_final"]})
+    if escritas:
+        b["enfileirar"](rodada, "escrita", escritas)
+    return res
+
+def _fila_escrita(b, rodada, lote, estado):
+    """Grava o lote em todos os sinks do item; sink com falha devolve o item à fila"""
+    itens = [it["payload"] for it in lote]
+    resultados = _aplicar_sinks(itens, [s for s in SINKS if any(s in i["sinks"] for i in itens)])
+    res = {}
+    for it in lote:
+        r = {s: resultados.get(s, {}).get(it["sku"], False) for s in it["payload"]["sinks"]}
+        ok = all(v is not False and v != TIMEOUT_BUDGET for v in r.values())
+        res[it["id"]] = (ok, {s: _resultado_sink(v) for s, v in r.items()})
+    return res
+
+FILA_EXECUTORES = {"coleta": _fila_coleta, "escrita": _fila_escrita}
+
+def fila_worker(rodada=None, etapas=FILA_ETAPAS, nome_broker=None, worker=None):
+    """Arrenda lotes até a rodada acabar (ou só restarem arrendamentos alheios por FILA_OCIOSO_S)"""
+    b = broker_fila(nome_broker)
+    rodada = rodada or b["ultima_rodada"]()
+    if not rodada:
+        print("[Fila] Nenhuma rodada na fila")
+        return 0
+    worker = worker or WORKER_ID
+    print(f"[Fila] Worker {worker} na rodada {rodada} (etapas: {', '.join(etapas)})")
+    historico_iniciar_execucao("worker")
+    estado = {"catalogo": None, "cache": {}, "caches_cep": {}}
+    feitos, parado_desde, t0 = 0, None, time.time()
+    while True:
+        trabalhou = False
+        for etapa in etapas:
+            lote = b["arrendar"](rodada, etapa, worker, FILA_LOTE)
+            if not lote:
+                continue
+            trabalhou = True
+            t_lote = time.time()
+            print(f"\n====== Fila: {etapa} de {len(lote)} itens ({worker}) ======")
+            # Renova o arrendamento enquanto o lote roda; se o processo morrer, a renovação para junto
+            parar = threading.Event()
+            def _renovar(ids=[it["id"] for it in lote]):
+                while not parar.wait(FILA_LEASE_S / 3):
+                    try: b["renovar"](ids, worker)
+                    except Exception as e: print(f"[Fila] ⚠️ Erro ao renovar arrendamento: {e}")
+            threading.Thread(target=_renovar, name=f"lease-{worker}", daemon=True).start()
+            try:
+                res = FILA_EXECUTORES[etapa](b, rodada, lote, estado)
+            except Exception as e:
+                print(f"[Fila] ❌ Erro no lote de {etapa}: {e}")
+                res = {}
+            finally:
+                parar.set()
+            for it in lote:
+                ok, resultado = res.get(it["id"], (False, "ERRO"))
+                b["concluir"](it["id"], worker, ok, resultado)
+            feitos += len(lote)
+            log_step(f"Fila {etapa} ({len(lote)} itens)", t_lote)
+        if trabalhou:
+            parado_desde = None
+            continue
+        if not _fila_abertos(b["resumo"](rodada), etapas):
+            break
+        parado_desde = parado_desde or time.time()
+        if time.time() - parado_desde > FILA_OCIOSO_S:
+            print(f"[Fila] Só restam itens arrendados por outros workers há {FILA_OCIOSO_S:.0f}s — saindo")
+            break
+        time.sleep(FILA_ESPERA_S)
+    historico_finalizar_execucao()
+    log_step(f"Worker {worker}: {feitos} itens processados", t0)
+    return feitos
+
+def fila_status(rodada=None, nome_broker=None):
+    b = broker_fila(nome_broker)
+    rodada = rodada or b["ultima_rodada"]()
+    resumo = b["resumo"](rodada) if rodada else {}
+    print(f"[Fila] Rodada {rodada or '-'}")
+    for etapa in FILA_ETAPAS:
+        if etapa in resumo:
+            print(f"  {etapa:<8} " + " | ".join(f"{st}={n}" for st, n in sorted(resumo[etapa].items())))
+    return resumo
+
+def fila_coordenar(rodada=None, nome_broker=None, escrever=True, workers_locais=0, aguardar=False):
+    """Enfileira o catálogo; opcionalmente sobe workers locais e acompanha até o fim"""
+    b = broker_fila(nome_broker)
+    produtos = carregar_produtos()
+    if not produtos:
+        print("[Fila] Nenhum produto carregado da API")
+        return None
+    rodada = rodada or RUN_ID
+    n = b["enfileirar"](rodada, "coleta", [(p["sku"], dict(p, escrever=escrever)) for p in produtos])
+    print(f"[Fila] Rodada {rodada}: {n} SKUs enfileirados no broker '{nome_broker or FILA_BROKER}'")
+    threads = []
+    for i in range(workers_locais):
+        t = threading.Thread(target=fila_worker, name=f"worker-{i + 1}", daemon=True,
+                             kwargs=dict(rodada=rodada, nome_broker=nome_broker, worker=f"{WORKER_ID}-{i + 1}"))
+        t.start()
+        threads.append(t)
+    if aguardar or threads:
+        while _fila_abertos(b["resumo"](rodada)) and (not threads or any(t.is_alive() for t in threads)):
+            time.sleep(FILA_ESPERA_S)
+        for t in threads:
+            t.join()
+    fila_status(rodada, nome_broker)
+    return rodada
+
+# =======================
+# PAINEL DE STATUS (HTTP local)
+# =======================
+# GET /status devolve progresso, vazão, ETA, SKU/etapa atual e a saúde de cada sink.
+# POST /pausar e /retomar seguram o próximo SKU (o que está em curso termina); POST /drenar
+# para de buscar SKUs novos, escreve o que já foi coletado e encerra; POST /priorizar
+# {"skus": [...]} leva SKUs pendentes para o próximo lote.
+_painel = {"modo": None, "inicio": None, "total": 0, "feitos": 0, "status": {}, "escritas": {},
+           "lote": None, "sku_atual": None, "etapa": None, "fila": [], "pausado": False, "drenando": False}
+_painel_lock = threading.Lock()
+
+def painel_iniciar(modo, produtos):
+    with _painel_lock:
+        _painel.update(modo=modo, inicio=time.time(), total=len(produtos), feitos=0, status={}, escritas={},
+                       lote=None, sku_atual=None, etapa=None, fila=list(produtos), pausado=False, drenando=False)
+    if STATUS_PORTA:
+        iniciar_servidor_status()
+
+def painel_atualizar(**campos):
+    with _painel_lock:
+        _painel.update(campos)
+
+def painel_produto(sku, status):
+    with _painel_lock:
+        if _painel["inicio"] is None:
+            return
+        _painel["feitos"] += 1
+        _painel["status"][status] = _painel["status"].get(status, 0) + 1
+
+def painel_escrita(sink, resultado):
+    with _painel_lock:
+        if _painel["inicio"] is None:
+            return
+        r = _resultado_sink(resultado)
+        por_sink = _painel["escritas"].setdefault(sink, {})
+        por_sink[r] = por_sink.get(r, 0) + 1
+
+def painel_status():
+    with _painel_lock:
+        p = {k: (dict(v) if isinstance(v, dict) else v) for k, v in _painel.items() if k != "fila"}
+        pendentes = len(_painel["fila"])
+        proximos = [prod["sku"] for prod in _painel["fila"][:10]]
+    decorrido = time.time() - p["inicio"] if p["inicio"] else 0.0
+    por_min = p["feitos"] / (decorrido / 60.0) if decorrido > 0 else 0.0
+    restantes = max(0, p["total"] - p["feitos"])
+    breakers = breakers_resumo()
+    return {
+        "run_id": RUN_ID, "modo": p["modo"], "pausado": p["pausado"], "drenando": p["drenando"],
+        "lote": p["lote"], "sku_atual": p["sku_atual"], "etapa": p["etapa"],
+        "total": p["total"], "feitos": p["feitos"], "por_status": p["status"],
+        "na_fila": pendentes, "proximos": proximos,
+        "decorrido_s": round(decorrido, 1), "skus_por_min": round(por_min, 2),
+        "eta_s": round(restantes / por_min * 60.0) if por_min else None,
+        "sinks": {s: {"breaker": breakers.get(s, {}).get("estado", "fechado"),
+                      "adiados": breakers.get(s, {}).get("adiados", 0),
+                      "escritas": p["escritas"].get(s, {})} for s in SINKS},
+    }
+
+def painel_priorizar(skus):
+    """Move os SKUs pendentes para o início da fila; devolve (movidos, não encontrados)"""
+    with _painel_lock:
+        fila = _painel["fila"]
+        alvo = set(skus)
+        frente = [prod for prod in fila if prod["sku"] in alvo]
+        fila[:] = frente + [prod for prod in fila if prod["sku"] not in alvo]
+    movidos = [prod["sku"] for prod in frente]
+    return movidos, [s for s in skus if s not in set(movidos)]
+
+def painel_checkpoint(sku=None, etapa=None):
+    """Antes de cada SKU: segura enquanto pausado; False = drenando (não começar trabalho novo)"""
+    avisou = False
+    while True:
+        with _painel_lock:
+            pausado, drenando = _painel["pausado"], _painel["drenando"]
+            if not pausado:
+                _painel.update(sku_atual=sku, etapa=etapa)
+        if drenando and etapa != "sinks":
+            return False
+        if not pausado:
+            return True
+        if not avisou:
+            print("[Painel] ⏸️ Pausado — aguardando /retomar")
+            avisou = True
+        time.sleep(1)
+
+def proximos_lotes(tamanho):
+    """Lotes tirados da fila do painel na hora (respeita /priorizar e /drenar)"""
+    n = 0
+    while True:
+        if not painel_checkpoint():
+            with _painel_lock:
+                sobra = len(_painel["fila"])
+            print(f"[Painel] 🛑 Drenado: {sobra} SKU(s) ficaram para a próxima execução")
+            return
+        with _painel_lock:
+            lote = _painel["fila"][:tamanho]
+            del _painel["fila"][:tamanho]
+        if not lote:
+            return
+        n += 1
+        painel_atualizar(lote=n)
+        yield n, lote
+
+def iniciar_servidor_status():
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, codigo, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("", "/status"):
+                return self._responder(200, painel_status())
+            self._responder(404, {"erro": "rota desconhecida"})
+
+        def do_POST(self):
+            if STATUS_TOKEN and self.headers.get("X-Token") != STATUS_TOKEN:
+                return self._responder(403, {"erro": "token inválido"})
+            rota = urllib.parse.urlsplit(self.path)
+            try:
+                corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            except ValueError:
+                return self._responder(400, {"erro": "JSON inválido"})
+            if not isinstance(corpo, dict):
+                return self._responder(400, {"erro": "o corpo deve ser um objeto JSON"})
+            if rota.path == "/pausar":
+                painel_atualizar(pausado=True)
+            elif rota.path == "/retomar":
+                painel_atualizar(pausado=False)
+            elif rota.path == "/drenar":
+                painel_atualizar(drenando=True, pausado=False)
+                print("[Painel] 🛑 Drenagem pedida: escreve o que já foi coletado e encerra")
+            elif rota.path == "/priorizar":
+                skus = corpo.get("skus") or urllib.parse.parse_qs(rota.query).get("sku") or []
+                if isinstance(skus, str):
+                    skus = [skus]
+                if not isinstance(skus, list):
+                    return self._responder(400, {"erro": "'skus' deve ser uma lista"})
+                movidos, faltando = painel_priorizar([str(s) for s in skus])
+                print(f"[Painel] Priorizados: {', '.join(movidos) or '-'}")
+                return self._responder(200, {"movidos": movidos, "nao_pendentes": faltando})
+            else:
+                return self._responder(404, {"erro": "rota desconhecida"})
+            self._responder(200, painel_status())
+
+        def log_message(self, *a):  # sem poluir o stdout da execução
+            pass
+
+    try:
+        servidor = ThreadingHTTPServer((STATUS_HOST, STATUS_PORTA), Handler)
+    except OSError as e:
+        print(f"[Painel] ⚠️ Não subiu em {STATUS_HOST}:{STATUS_PORTA}: {e}")
+        return None
+    threading.Thread(target=servidor.serve_forever, name="painel-status", daemon=True).start()
+    print(f"[Painel] Status em http://{STATUS_HOST}:{STATUS_PORTA}/status")
+    return servidor
 
 # =======================
 # MAIN (com batching)
@@ -1163,14 +4605,21 @@ def main():
         return
 
     print(f"[Init] {len(produtos)} SKUs para processar (lotes de {BATCH_SIZE})")
+    print(f"[Init] {len(agrupar_por_query(produtos))} buscas distintas na Tenda")
+    cache_tenda, caches_cep = {}, {}
+    if TENDA_CRAWL:
+        cache_tenda = precos_via_crawl(produtos)
+        caches_cep[CEP_VALOR] = dict(cache_tenda)
     
     start_global = time.time()
-    ok = err = miss = 0
+    ok = err = miss = rev = 0
+    historico_iniciar_execucao("run")
+    painel_iniciar("run", produtos)
     
     # Inicia o Playwright Manager uma única vez
     with sync_playwright() as pw:
-        # Loop pelos lotes
-        for batch_idx, batch in enumerate(chunked(produtos, BATCH_SIZE), start=1):
+        # Loop pelos lotes (a fila é do painel: /priorizar reordena, /drenar encerra)
+        for batch_idx, batch in proximos_lotes(BATCH_SIZE):
             print(f"\n====== Lote {batch_idx} ({len(batch)} itens) ======")
             
             browser = None
@@ -1182,19 +4631,7 @@ def main():
                 # Lançamos o navegador AQUI, para cada lote.
                 # Se o lote anterior crashou o browser, este nasce novo.
                 print(f"[Lote {batch_idx}] Criando navegador (modo headless, sem UI)...")
-                launch_args = ["--lang=pt-BR", "--disable-blink-features=AutomationControlled"]
-                
-                # flags só para Linux (VPS/Docker)
-                if sys.platform.startswith("linux"):
-                    launch_args += ["--no-sandbox", "--disable-dev-shm-usage"]
-                
-                print(f"[Lote {batch_idx}] Argumentos: {launch_args}")
-                browser = pw.chromium.launch(
-                    headless=HEADLESS,  # Usa a variável HEADLESS da configuração
-                    slow_mo=SLOW_MO_MS,
-                    devtools=False,  # Sempre sem DevTools
-                    args=launch_args,
-                )
+                browser = lancar_navegador(pw)
                 print(f"[Lote {batch_idx}] ✅ Navegador criado com sucesso")
                 
                 # Cria contexto e páginas
@@ -1203,42 +4640,108 @@ def main():
                 print(f"[Lote {batch_idx}] ✅ Contexto criado")
                 
                 print(f"[Lote {batch_idx}] Iniciando logins...")
-                p_tenda, p_cds, p_wp, p_portal = open_and_login_all(ctx)
+                t_login = time.time()
+                p_tenda, p_cds, p_wp, p_portal = open_and_login_all(ctx, com_tenda=len(TENDA_CEPS) == 1)
+                registrar_etapa("logins", t_login)
                 print(f"[Lote {batch_idx}] ✅ Logins concluídos")
+                if PREFLIGHT and batch_idx == 1:
+                    preflight(dict(zip(PAGINAS_SITES, (p_tenda, p_cds, p_wp, p_portal))), produtos[0])
                 
                 t_lote = time.time()
-                
-                # Processa os produtos do lote
-                for prod in batch:
-                    sku = prod["sku"]
-                    query = prod["nome"]
-                    incremento = float(prod["incremento"])
-                    
-                    print(f"\n=== {sku} | {query} ===")
-                    t_prod = time.time()
-                    
-                    # 1. Busca Tenda
-                    try:
-                        preco_base = buscar_preco_tenda(p_tenda, query)
-                    except Exception as e:
-                        print(f"[Tenda] Erro busca: {e}")
-                        preco_base = None
-                        # Tenta recuperar a página da Tenda se ela morreu
-                        if is_page_closed(p_tenda):
-                            print("[Tenda] Página morreu, tentando recriar...")
-                            try: 
-                                p_tenda = ctx.new_page()
-                                p_tenda.goto(TENDA_URL)
-                            except: pass
-
-                    if not preco_base:
+
+                def _checar_memoria():
+                    nonlocal ctx, p_tenda, p_cds, p_wp, p_portal
+                    paginas = dict(zip(PAGINAS_SITES, (p_tenda, p_cds, p_wp, p_portal)))
+                    ctx, paginas = verificar_memoria(
+                        ctx, paginas, lambda: recriar_contexto_lote(browser, ctx, paginas, len(TENDA_CEPS) == 1))
+                    p_tenda, p_cds, p_wp, p_portal = (paginas[n] for n in PAGINAS_SITES)
+
+                # 1. Busca Tenda (lote inteiro)
+                coletados = []
+                if len(TENDA_CEPS) > 1:
+                    # Um contexto por CEP em paralelo; o preço base é a agregação das regiões
+                    t_regioes = time.time()
+                    regioes = coletar_precos_regioes(batch, produtos, caches_cep)
+                    registrar_etapa("busca tenda (CEPs)", t_regioes)
+                    dur_ms = _ms(t_regioes) // len(batch)
+                    for prod in batch:
+                        coletados.append({"sku": prod["sku"], "nome": prod["nome"],
+                                          "incremento": float(prod["incremento"]),
+                                          "preco_base": preco_base_regioes(prod["sku"], regioes[prod["sku"]]),
+                                          "dur_ms": dur_ms, "prazo_esgotado": False})
+                else:
+                    for n_prod, prod in enumerate(batch, start=1):
+                        if MEM_AMOSTRA_CADA and n_prod > 1 and (n_prod - 1) % MEM_AMOSTRA_CADA == 0:
+                            _checar_memoria()
+
+                        sku = prod["sku"]
+                        query = prod["nome"]
+                        if not painel_checkpoint(sku, "tenda"):
+                            print(f"[Painel] Drenando: {len(batch) - len(coletados)} SKU(s) do lote não buscados")
+                            break
+                        print(f"\n=== {sku} | {query} ===")
+
+                        t_tenda = time.time()
+                        prazo_tenda = criar_prazo(PRAZO_TENDA_S)
+                        try:
+                            with prazo_na_pagina(p_tenda, prazo_tenda):
+                                preco_base = buscar_preco_tenda_coalescido(p_tenda, query, cache_tenda, produtos,
+                                                                           prazo=prazo_tenda)
+                        except Exception as e:
+                            print(f"[Tenda] Erro busca: {e}")
+                            preco_base = None
+                            # Tenta recuperar a página da Tenda se ela morreu
+                            if is_page_closed(p_tenda):
+                                print("[Tenda] Página morreu, tentando recriar...")
+                                try: 
+                                    p_tenda = nova_pagina(ctx, "tenda")
+                                    p_tenda.goto(TENDA_URL)
+                                except: pass
+                        registrar_etapa("busca tenda", t_tenda)
+                        if preco_base is None and prazo_vencido(prazo_tenda):
+                            print(f"[Tenda] ⚠️ {sku}: prazo de {PRAZO_TENDA_S:.0f}s esgotado na busca")
+                        coletados.append({"sku": sku, "nome": query, "incremento": float(prod["incremento"]),
+                                          "preco_base": preco_base, "dur_ms": _ms(t_tenda),
+                                          "prazo_esgotado": preco_base is None and prazo_vencido(prazo_tenda)})
+
+                # 2. Precificação do lote inteiro (com travas)
+                t_prc = time.time()
+                precos = precificar_lote(coletados)
+                registrar_etapa("precificação", t_prc)
+
+                # 3. Atualizações
+                for n_prod, (item, prc) in enumerate(zip(coletados, precos), start=1):
+                    if MEM_AMOSTRA_CADA and n_prod > 1 and (n_prod - 1) % MEM_AMOSTRA_CADA == 0:
+                        _checar_memoria()
+
+                    sku, query, incremento = item["sku"], item["nome"], item["incremento"]
+                    preco_base = item["preco_base"]
+                    painel_checkpoint(sku, "sinks")  # só a pausa vale aqui: o que foi coletado é escrito
+
+                    if prc["status"] == "SEM_PRECO":
+                        if item["prazo_esgotado"]:
+                            err += 1
+                            log_produto(sku, query, None, TIMEOUT_BUDGET, log_file)
+                            historico_registrar_observacao(sku, query, None, incremento, None, TIMEOUT_BUDGET,
+                                                           item["dur_ms"])
+                            continue
                         miss += 1
                         log_produto(sku, query, None, "IGNORADO", log_file)
+                        historico_registrar_observacao(sku, query, None, incremento, None, "IGNORADO", item["dur_ms"])
                         continue
 
-                    # 2. Atualizações
+                    print(f"\n=== {sku} | {query} ===")
+                    t_prod = time.time()
                     print(f"[Cálculo] Preço base (Tenda)={preco_base} | Incremento={incremento}%")
-                    
+
+                    if prc["status"] == "REVISAO":
+                        rev += 1
+                        registrar_revisao(item, prc)
+                        log_produto(sku, query, prc["preco_final"], "REVISAO", log_file)
+                        historico_registrar_observacao(sku, query, preco_base, incremento, prc["preco_final"],
+                                                       "REVISAO", item["dur_ms"])
+                        continue
+
                     # O sistema CDS parece aplicar o incremento automaticamente ao salvar.
                     # Baseado nos dados: Preço Base=7.43, Incremento=33%, Preço Final=9.88
                     # Isso sugere que o CDS aplica incremento sobre o valor enviado.
@@ -1246,25 +4749,54 @@ def main():
                     # Se o esperado é 9.88 e o incremento é 33%, então:
                     # preco_enviado × 1.33 = 9.88 → preco_enviado = 9.88 / 1.33 = 7.43
                     # Mas o preço base da Tenda é 5.59, então precisamos aplicar o incremento primeiro.
-                    preco_com_incremento = round(preco_base * (1 + incremento / 100.0), 2)
-                    preco_final = preco_com_incremento
-                    print(f"[Cálculo] Preço com incremento aplicado={preco_final} (Base {preco_base} × {1 + incremento/100.0:.4f})")
+                    preco_final = prc["preco_final"]
+                    if prc["motivo"]:
+                        print(f"[Cálculo] {prc['motivo']}")
+                    print(f"[Cálculo] Preço com incremento aplicado={preco_final} (Base {preco_base} × {1 + prc['incremento_aplicado']/100.0:.4f}, regra {PRECO_ARREDONDAMENTO})")
                     print(f"[Cálculo] ATENÇÃO: Se o CDS aplicar incremento novamente, o resultado será {preco_final * (1 + incremento/100.0):.2f}")
 
-                    cds_ok = atualizar_cds(p_cds, sku, preco_final) if p_cds else False
-                    woo_ok = atualizar_woo(p_wp, sku, preco_final) if p_wp else None
-                    portal_ok = atualizar_portal(p_portal, sku, preco_final) if p_portal else False
+                    # Orçamento do SKU inteiro: o que a busca na Tenda já gastou sai do PRAZO_SKU_S
+                    prazo_sku = criar_prazo(PRAZO_SKU_S)
+                    if prazo_sku is not None:
+                        prazo_sku -= item["dur_ms"] / 1000.0
+
+                    t_sink = time.time()
+                    cds_ok = escrever_sink("cds", atualizar_cds, p_cds, sku, preco_final, query, prazo_sku)
+                    historico_registrar_escrita(sku, "cds", preco_final, cds_ok, _ms(t_sink))
+                    t_sink = time.time()
+                    woo_ok = escrever_sink("woo", atualizar_woo, p_wp, sku, preco_final, query, prazo_sku)
+                    historico_registrar_escrita(sku, "woo", preco_final, woo_ok, _ms(t_sink))
+                    t_sink = time.time()
+                    portal_ok = escrever_sink("portal", atualizar_portal, p_portal, sku, preco_final, query, prazo_sku)
+                    historico_registrar_escrita(sku, "portal", preco_final, portal_ok, _ms(t_sink))
                     
                     status = "OK" if woo_ok is True else "OK_SEM_WOO"
-                    if cds_ok and portal_ok and (woo_ok is not False):
+                    if ADIADO in (cds_ok, woo_ok, portal_ok):
+                        status = ADIADO
+                    if cds_ok is None:
+                        status = "CDS_NAO_ENCONTRADO"
+                    if not (portal_ok and cds_ok is not False and woo_ok is not False):
+                        status = "ERRO_PARCIAL"
+                    if TIMEOUT_BUDGET in (cds_ok, woo_ok, portal_ok):
+                        status = TIMEOUT_BUDGET
+                    if status not in ("ERRO_PARCIAL", TIMEOUT_BUDGET):
                         ok += 1
-                        log_produto(sku, query, preco_final, status, log_file)
                     else:
                         err += 1
-                        log_produto(sku, query, preco_final, "ERRO_PARCIAL", log_file)
+                    log_produto(sku, query, preco_final, status, log_file)
+                    historico_registrar_observacao(sku, query, preco_base, incremento, preco_final, status, item["dur_ms"])
                     
+                    registrar_etapa("produto (sinks)", t_prod)
                     log_step(f"Produto {sku} fim", t_prod)
 
+                # Gravações do Portal por HTTP: uma listagem confirma o lote todo
+                for sku, (preco, res) in portal_confirmar_pendentes(p_portal).items():
+                    breaker_registrar("portal", res)
+                    historico_registrar_escrita(sku, "portal", preco, res)
+                    if res is not True:
+                        enfileirar_pendente("portal", sku, preco)
+
+                registrar_etapa("lote", t_lote)
                 log_step(f"Lote {batch_idx} concluído", t_lote)
 
             except Exception as e:
@@ -1292,10 +4824,148 @@ def main():
                 # Pequena pausa para o SO liberar as portas
                 time.sleep(2)
 
+    historico_finalizar_execucao()
+    relatorio_bloqueio()
+    relatorio_cache_assets()
+    relatorio_etapas()
+    relatorio_har()
     log_step("Processo completo", start_global)
     total = len(produtos)
-    print(f"\n[Resumo Final] OK={ok} | Falhas={err} | Ignorados={miss} | Total={total}")
+    print(f"\n[Resumo Final] OK={ok} | Falhas={err} | Ignorados={miss} | Revisão={rev} | Total={total}")
     print(f"[Fim] {datetime.datetime.utcnow().isoformat()}Z")
 
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Bot de preços Hortigold")
+    sub = parser.add_subparsers(dest="cmd")
+    p = sub.add_parser("run", help="Fluxo completo: Tenda + sinks, SKU a SKU (padrão)")
+    har = p.add_mutually_exclusive_group()
+    har.add_argument("--record", action="store_true", help="Grava o tráfego de cada site em HAR_DIR/<RUN_ID>")
+    har.add_argument("--replay", nargs="?", const="", metavar="PASTA",
+                     help="Roda offline a partir de uma gravação (padrão: a mais recente); escritas ficam locais")
+    p = sub.add_parser("collect", aliases=["plan"], help="Raspa a Tenda e grava um plano de preços (sem sinks)")
+    p.add_argument("--saida", help="Arquivo do plano (padrão: PLAN_DIR/plano_<data>.json)")
+    p = sub.add_parser("push", aliases=["apply"], help="Aplica um plano nos sinks (sem abrir a Tenda)")
+    p.add_argument("plano", nargs="?", help="Padrão: o plano mais recente em PLAN_DIR")
+    p.add_argument("--sinks", default=",".join(SINKS), help="Ex.: cds,woo,portal")
+    p.add_argument("--sku", help="Empurra só este SKU com --preco, sem plano")
+    p.add_argument("--preco", type=float)
+    p = sub.add_parser("replay", help="Reaplica as escritas adiadas pelos circuit breakers")
+    p.add_argument("--sinks", default=",".join(SINKS))
+    p = sub.add_parser("feed", help="Coleta a Tenda uma vez e publica o feed de preços base")
+    p.add_argument("--saida", help="Padrão: FEED_DIR/feed_<RUN_ID>.json")
+    p = sub.add_parser("lojas", help="Aplica um feed (coletado agora, se omitido) em todas as lojas de LOJAS_DIR")
+    p.add_argument("--feed")
+    p.add_argument("--lojas", help="Ex.: matriz,filial (padrão: todas)")
+    p = sub.add_parser("push-feed", help="Monta o plano desta loja a partir de um feed e aplica")
+    p.add_argument("feed")
+    p.add_argument("--sinks", help="Padrão: LOJA_SINKS ou todos")
+    p = sub.add_parser("report", help="Resumo de uma execução a partir do histórico (sem navegador)")
+    p.add_argument("--run", help="RUN_ID (padrão: a última execução)")
+    p = sub.add_parser("diff", help="Compara dois planos")
+    p.add_argument("a")
+    p.add_argument("b")
+    p = sub.add_parser("pendentes", help="Gera um plano com as escritas adiadas pelos circuit breakers")
+    p.add_argument("--saida")
+    p = sub.add_parser("importar-logs", help="Importa os logs JSON antigos para o histórico SQLite")
+    p.add_argument("--dir", help="Diretório dos logs (padrão: LOG_DIR)")
+    p = sub.add_parser("bench", aliases=["bench-parser"],
+                       help="Micro-benchmarks (parser: HTML vs locator no corpus | startup: perfis do navegador)")
+    p.add_argument("alvo", nargs="?", default="parser", choices=["parser", "startup"])
+    p.add_argument("--dir", help="Diretório do corpus (padrão: CORPUS_DIR)")
+    p.add_argument("--perfis", help="Ex.: completo,reduzido (padrão: todos)")
+    p.add_argument("--rep", type=int, help="Repetições (padrão: 20 no parser, 3 no startup)")
+    p = sub.add_parser("fila-coordenar", help="Enfileira o catálogo para workers (uma rodada)")
+    p.add_argument("--rodada", help="Id da rodada (padrão: RUN_ID)")
+    p.add_argument("--broker", help="sqlite | memoria (padrão: FILA_BROKER)")
+    p.add_argument("--so-coleta", action="store_true", help="Só Tenda + precificação, sem escrita nos sinks")
+    p.add_argument("--workers", type=int, default=0, help="Workers locais neste processo")
+    p.add_argument("--aguardar", action="store_true", help="Acompanha a rodada até esvaziar")
+    p = sub.add_parser("fila-worker", help="Arrenda e processa lotes da fila")
+    p.add_argument("--rodada", help="Padrão: a última enfileirada")
+    p.add_argument("--broker")
+    p.add_argument("--etapas", default=",".join(FILA_ETAPAS), help="Ex.: coleta | escrita | coleta,escrita")
+    p = sub.add_parser("fila-status", help="Contagem por etapa/estado de uma rodada")
+    p.add_argument("--rodada")
+    p.add_argument("--broker")
+    sub.add_parser("preflight", help="Loga em todos os sites e confere os seletores críticos")
+    sub.add_parser("crawl", help="Varre as categorias da Tenda, grava o snapshot e casa o catálogo")
+    p = sub.add_parser("aprovar", help="Libera SKUs retidos para revisão (sem SKUs: lista os retidos)")
+    p.add_argument("skus", nargs="*")
+    p.add_argument("--preco", type=float, help="Preço revisado (padrão: o que ficou retido)")
+    p.add_argument("--todos", action="store_true", help="Aprova todos os retidos com o preço retido")
+    p = sub.add_parser("historico", help="Último preço registrado de um ou mais SKUs")
+    p.add_argument("skus", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.cmd in (None, "run"):
+        if getattr(args, "record", False):
+            har_iniciar("gravar")
+        elif getattr(args, "replay", None) is not None:
+            har_iniciar("replay", args.replay or None)
+        elif HAR_MODO:
+            har_iniciar(HAR_MODO)
+        main()
+    elif args.cmd in ("collect", "plan"):
+        gerar_plano(args.saida)
+    elif args.cmd in ("push", "apply"):
+        sinks = [s.strip() for s in args.sinks.split(",") if s.strip()]
+        if args.sku:
+            if args.preco is None:
+                parser.error("--sku exige --preco")
+            aplicar_plano(plano_manual(args.sku, args.preco, sinks), sinks)
+        else:
+            caminho = args.plano or plano_mais_recente()
+            if not caminho:
+                parser.error(f"nenhum plano em {PLAN_DIR}; rode 'collect' ou informe o arquivo")
+            aplicar_plano(caminho, sinks)
+    elif args.cmd == "replay":
+        caminho = plano_dos_pendentes()
+        if caminho:
+            aplicar_plano(caminho, [s.strip() for s in args.sinks.split(",") if s.strip()])
+    elif args.cmd == "feed":
+        publicar_feed(saida=args.saida)
+    elif args.cmd == "lojas":
+        distribuir_feed(args.feed, [l.strip() for l in (args.lojas or "").split(",") if l.strip()] or None)
+    elif args.cmd == "push-feed":
+        aplicar_feed(args.feed, [s.strip() for s in (args.sinks or "").split(",") if s.strip()] or None)
+    elif args.cmd == "report":
+        relatorio_execucao(args.run)
+    elif args.cmd == "diff":
+        diff_planos(args.a, args.b)
+    elif args.cmd == "pendentes":
+        plano_dos_pendentes(args.saida)
+    elif args.cmd == "importar-logs":
+        historico_importar_logs(args.dir)
+    elif args.cmd in ("bench", "bench-parser"):
+        if args.alvo == "startup":
+            bench_startup([p.strip() for p in (args.perfis or "").split(",") if p.strip()] or None, args.rep or 3)
+        else:
+            bench_parser(args.dir, args.rep or 20)
+    elif args.cmd == "fila-coordenar":
+        fila_coordenar(args.rodada, args.broker, not args.so_coleta, args.workers, args.aguardar)
+    elif args.cmd == "fila-worker":
+        fila_worker(args.rodada, tuple(e.strip() for e in args.etapas.split(",") if e.strip() in FILA_ETAPAS),
+                    args.broker)
+    elif args.cmd == "fila-status":
+        fila_status(args.rodada, args.broker)
+    elif args.cmd == "preflight":
+        preflight_cli()
+    elif args.cmd == "crawl":
+        precos_via_crawl(carregar_produtos())
+    elif args.cmd == "aprovar":
+        retidos = historico_revisoes_pendentes()
+        skus = list(retidos) if args.todos else args.skus
+        if not skus:
+            for sku, preco in retidos.items():
+                print(f"[Revisão] {sku}: retido em {preco}")
+            print(f"[Revisão] {len(retidos)} SKU(s) retidos (aprovar: bot.py aprovar <sku> [--preco X])")
+        for sku in skus:
+            historico_aprovar(sku, args.preco)
+        if skus:
+            print("[Revisão] O preço aprovado vale a partir da próxima execução (ou já: bot.py push --sku X --preco Y)")
+    elif args.cmd == "historico":
+        for sku in args.skus:
+            print(f"[Histórico] {sku}: {historico_ultimo_preco(sku) or 'sem registros'}")
+
 if __name__ == "__main__":
-    main()
+    cli()